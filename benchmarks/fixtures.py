@@ -0,0 +1,203 @@
+"""
+合成 DMol3 / GA 测试数据：dmol.outmol、recover.txt、log.txt 以及完整的 search 目录树。
+格式与 lib.parse_outmol / lib.recover_store / lib.log_index 读取的真实文件一致，规模可配置，
+全部离线生成，同一 seed 得到完全相同的文件。
+
+    python -m benchmarks.fixtures /tmp/dmol_fixture --search-dirs 4 --pops 200 --atoms 40
+"""
+import os
+import random
+import argparse
+
+ELEMENTS = ["B", "Al"]
+
+COORDS_HEADER = [
+    " ATOM                X              Y              Z",
+    " ---------------------------------------------------",
+]
+COORDS_FOOTER = " -----------------------------------------------------------"
+
+
+def random_cluster(natoms, rng, elements=ELEMENTS, spacing=2.2):
+    """ 在球内随机放置原子，保证最近距离不小于 0.8 * spacing，近似真实团簇的密度 """
+    radius = spacing * (natoms ** (1 / 3)) * 0.75 + 1.0
+    species, positions = [], []
+    while len(positions) < natoms:
+        p = [rng.uniform(-radius, radius) for _ in range(3)]
+        if sum(v * v for v in p) > radius * radius:
+            continue
+        if all(sum((a - b) ** 2 for a, b in zip(p, q)) > (0.8 * spacing) ** 2 for q in positions):
+            positions.append(p)
+            species.append(elements[len(species) % len(elements)])
+    return species, positions
+
+
+def _coordinate_block(title, species, positions):
+    lines = [f"                         {title}"] + COORDS_HEADER
+    for i, (s, p) in enumerate(zip(species, positions)):
+        lines.append(f"  {i + 1:4d}   {s:2s} {p[0]:14.6f} {p[1]:14.6f} {p[2]:14.6f}")
+    lines.append(COORDS_FOOTER)
+    return lines
+
+
+def outmol_lines(natoms=20, scf_iterations=20, opt_steps=10, seed=0, final=True, structure=None):
+    """ 一个几何优化的 dmol.outmol：每个优化步包含 SCF 迭代、HOMO/LUMO、能级表、opt== 和 |F|max """
+    rng = random.Random(seed)
+    species, positions = structure or random_cluster(natoms, rng)
+    positions = [list(p) for p in positions]
+    n_levels = max(2 * len(species), 10)
+    n_occupied = len(species)
+
+    lines = ["", " DMol3 synthetic output (benchmark fixture)", ""]
+    lines += _coordinate_block("Input Coordinates (Angstroms)", species, positions)
+    lines += ["", " ** GEOMETRY OPTIMIZATION IN DELOCALIZED COORDINATES **", ""]
+    lines += _coordinate_block("Input Coordinates (Angstroms)", species, positions)
+
+    energy = -1000.0 - rng.random()
+    for step in range(opt_steps):
+        lines.append("")
+        lines.append("            Total Energy           Binding E       Cnvgnce     Time   Iter")
+        for k in range(scf_iterations):
+            lines.append(f"Ef    {energy - 0.01 * rng.random():.6f}Ha   -{rng.uniform(1, 5):.6f}Ha"
+                         f"   {10 ** -(1 + 6 * k / max(1, scf_iterations)):.1E}   {0.1 * (k + 1):.1f}m  {k + 1}")
+        homo = -0.2 - 0.05 * rng.random()
+        lumo = homo + 0.02 + 0.1 * rng.random()
+        lines.append(f" Energy of Highest Occupied Molecular Orbital:  {homo:.6f}Ha   {homo * 27.2114:.3f}eV")
+        lines.append(f" Energy of Lowest Unoccupied Molecular Orbital:  {lumo:.6f}Ha   {lumo * 27.2114:.3f}eV")
+        lines.append("")
+        lines.append("     state                         eigenvalue        occupation")
+        lines.append("                                     (au)            (ev)")
+        lines.append("")
+        for k in range(n_levels):
+            e = homo - 0.02 * (n_occupied - 1 - k) if k < n_occupied else lumo + 0.02 * (k - n_occupied)
+            occ = 2.0 if k < n_occupied else 0.0
+            lines.append(f"  {k + 1:4d} +  {k + 1:4d}   a    {e:12.6f}   {e * 27.2114:12.4f}   {occ:8.6f}")
+        lines.append("")
+        energy -= 0.001 * rng.random()
+        lines.append(f"opt==   {step}   {energy:.7f}   {0.001 * rng.random():.7f}   {rng.random() / 100:.6f}")
+        lines.append(f" |  |F|max   |   {rng.random() / 50:.6f}|   0.004000| {'YES' if step == opt_steps - 1 else 'NO '} |")
+        for p in positions:
+            for j in range(3):
+                p[j] += rng.uniform(-0.02, 0.02)
+
+    if final:
+        lines.append("")
+        lines += _coordinate_block("Final Coordinates (Angstroms)", species, positions)
+    lines += ["", " DMOL3 job finished", ""]
+    return lines
+
+
+def write_outmol(path, **kwargs):
+    with open(path, "w") as f:
+        f.write("\n".join(outmol_lines(**kwargs)) + "\n")
+
+
+def population(n_pops, natoms, n_distinct, rng, noise=0.01):
+    """
+    GA 种群：n_distinct 种基础构型，每个个体是其中一种加微小扰动（模拟大量近似重复的结构）。
+    返回 [(pop, energy, species, positions)]
+    """
+    bases = [random_cluster(natoms, rng) for _ in range(n_distinct)]
+    base_energies = [-1000.0 - 10 * rng.random() for _ in range(n_distinct)]
+    pops = []
+    for pop in range(n_pops):
+        b = rng.randrange(n_distinct)
+        species, positions = bases[b]
+        positions = [[v + rng.uniform(-noise, noise) for v in p] for p in positions]
+        pops.append((pop, base_energies[b] + 0.01 * rng.random(), species, positions))
+    return pops
+
+
+def recover_lines(pops):
+    lines = []
+    for pop, energy, species, positions in pops:
+        lines.append(f"pop {pop}")
+        lines.append(f"{energy:.6f} 0")
+        for s, p in zip(species, positions):
+            lines.append(f"{s} {p[0]:.6f} {p[1]:.6f} {p[2]:.6f}")
+        lines.append("")
+    return lines
+
+
+def log_lines(n_pops, rng, replace_fraction=0.2, noise_lines=5, folder_prefix="calc"):
+    """
+    GA 日志：每个 pop 一条 init + folder name，部分 pop 之后被 replace（对应新的文件夹），
+    中间穿插 noise_lines 行无关输出，模拟很长的 log.txt。返回 (行列表, {pop: 最终文件夹})
+    """
+    lines, folders = [], {}
+    counter = 0
+    for pop in range(n_pops):
+        lines.append(f"init {pop}")
+        folder = f"{folder_prefix}_{counter}"
+        counter += 1
+        lines.append(f"folder name: {folder}")
+        folders[pop] = folder
+        for _ in range(noise_lines):
+            lines.append(f"generation {pop}  best energy {-1000 - rng.random():.6f}  elapsed {rng.random():.3f}s")
+    for pop in range(n_pops):
+        if rng.random() < replace_fraction:
+            folder = f"{folder_prefix}_{counter}"
+            counter += 1
+            lines.append(f"folder name: {folder}")
+            for _ in range(noise_lines):
+                lines.append(f"offspring energy {-1000 - rng.random():.6f}")
+            lines.append(f"replace population member {pop}")
+            folders[pop] = folder
+    return lines, folders
+
+
+def make_search_dir(path, n_pops=50, natoms=20, n_distinct=10, scf_iterations=20, opt_steps=10,
+                    replace_fraction=0.2, noise_lines=5, seed=0):
+    """ 一个完整的 search 目录：recover.txt、log.txt 和每个个体的 <folder>/dmol.outmol """
+    rng = random.Random(seed)
+    os.makedirs(path, exist_ok=True)
+    pops = population(n_pops, natoms, n_distinct, rng)
+    lines, folders = log_lines(n_pops, rng, replace_fraction, noise_lines)
+    with open(os.path.join(path, "recover.txt"), "w") as f:
+        f.write("\n".join(recover_lines(pops)) + "\n")
+    with open(os.path.join(path, "log.txt"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+    for pop, energy, species, positions in pops:
+        folder = os.path.join(path, folders[pop])
+        os.makedirs(folder, exist_ok=True)
+        write_outmol(os.path.join(folder, "dmol.outmol"), scf_iterations=scf_iterations, opt_steps=opt_steps,
+                     seed=seed * 100003 + pop, structure=(species, positions))
+    return path
+
+
+def make_tree(root, search_dirs=2, **kwargs):
+    """ root/run{i}/search 形式的目录树，可直接交给 dmol2db.py """
+    seed = kwargs.pop("seed", 0)
+    paths = []
+    for i in range(search_dirs):
+        paths.append(make_search_dir(os.path.join(root, f"run{i}", "search"), seed=seed + i, **kwargs))
+    return paths
+
+
+def add_arguments(parser):
+    parser.add_argument("--search-dirs", type=int, default=2, help="search 目录个数")
+    parser.add_argument("--pops", type=int, default=50, help="每个 search 目录的个体数（recover.txt 条目数）")
+    parser.add_argument("--atoms", type=int, default=20, help="每个结构的原子数")
+    parser.add_argument("--distinct", type=int, default=10, help="每个种群中不同基础构型的个数")
+    parser.add_argument("--scf", type=int, default=20, help="每个优化步的 SCF 迭代数")
+    parser.add_argument("--opt-steps", type=int, default=10, help="每个 outmol 的几何优化步数")
+    parser.add_argument("--replace-fraction", type=float, default=0.2, help="log.txt 中被 replace 的个体比例")
+    parser.add_argument("--log-noise", type=int, default=5, help="log.txt 中每条记录之间的无关行数")
+    parser.add_argument("--seed", type=int, default=0)
+
+def tree_kwargs(args):
+    return dict(search_dirs=args.search_dirs, n_pops=args.pops, natoms=args.atoms, n_distinct=args.distinct,
+                scf_iterations=args.scf, opt_steps=args.opt_steps, replace_fraction=args.replace_fraction,
+                noise_lines=args.log_noise, seed=args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成合成的 DMol3 / GA 测试目录树")
+    parser.add_argument("root", help="输出目录")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    paths = make_tree(args.root, **tree_kwargs(args))
+    print(f"✅ 已生成 {len(paths)} 个 search 目录: {args.root}")
+
+if __name__ == "__main__":
+    main()
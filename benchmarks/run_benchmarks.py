@@ -0,0 +1,414 @@
+"""
+基准测试：分别计时流水线的各个阶段以及 dmol2db 端到端运行，结果写成 JSON，可在不同版本之间比较。
+
+    python -m benchmarks.run_benchmarks --size small -o bench_base.json
+    git checkout <新版本>
+    python -m benchmarks.run_benchmarks --size small -o bench_new.json
+    python -m benchmarks.run_benchmarks --compare bench_base.json bench_new.json
+
+也可以用 --repo 指向另一个版本的 checkout（例如 git worktree add /tmp/base <rev>），在同一份测试数据上比较。
+
+只依赖项目本身的依赖，完全离线运行。某个阶段在当前版本中不存在（例如旧版本没有对应函数）时记为 skipped。
+"""
+import io
+import os
+import ast
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import datetime
+import statistics
+import subprocess
+import contextlib
+import inspect
+from unittest import mock
+
+from benchmarks import fixtures
+
+# 预设规模：search 目录数 / 每个目录的个体数 / 原子数 / 不同构型数 / SCF 迭代 / 优化步 / log 噪声行
+SIZES = {
+    "tiny":   dict(search_dirs=1, n_pops=10, natoms=8, n_distinct=3, scf_iterations=5, opt_steps=3, noise_lines=2),
+    "small":  dict(search_dirs=2, n_pops=40, natoms=20, n_distinct=8, scf_iterations=20, opt_steps=10, noise_lines=5),
+    "medium": dict(search_dirs=4, n_pops=150, natoms=40, n_distinct=20, scf_iterations=30, opt_steps=20, noise_lines=20),
+    "large":  dict(search_dirs=8, n_pops=400, natoms=80, n_distinct=40, scf_iterations=40, opt_steps=40, noise_lines=50),
+}
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Skip(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def quiet():
+    """ 屏蔽被测代码的 print / 日志输出 """
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def measure(func, repeats, setup=None, warmup=1):
+    """
+    先不计时运行 warmup 次（延迟导入、文件系统缓存），再运行 repeats 次；
+    每次之前调用 setup()（不计时），返回墙钟与 CPU 时间
+    """
+    wall, cpu = [], []
+    for i in range(warmup + repeats):
+        state = setup() if setup is not None else None
+        t0, c0 = time.perf_counter(), time.process_time()
+        with quiet():
+            func(state) if setup is not None else func()
+        if i >= warmup:
+            wall.append(time.perf_counter() - t0)
+            cpu.append(time.process_time() - c0)
+    return {
+        "wall_median": statistics.median(wall),
+        "wall_min": min(wall),
+        "cpu_median": statistics.median(cpu),
+        "wall": wall,
+    }
+
+
+# ========== 各阶段 ==========
+def _outmol_paths(tree):
+    paths = []
+    for root, dirs, files in os.walk(tree):
+        dirs.sort()
+        if "dmol.outmol" in files:
+            paths.append(os.path.join(root, "dmol.outmol"))
+    return sorted(paths)
+
+def _search_dirs(tree):
+    return sorted(os.path.dirname(p) for p in _find(tree, "recover.txt"))
+
+def _find(tree, name):
+    for root, dirs, files in os.walk(tree):
+        if name in files:
+            yield os.path.join(root, name)
+
+def bench_extract_parameters(ctx):
+    from lib.extract_parameters import extract_parameters
+    paths = ctx["outmols"]
+    return measure(lambda: [extract_parameters(p) for p in paths], ctx["repeats"]), len(paths)
+
+def bench_read_eigenvalues(ctx):
+    from lib.calculate_dos import read_eigenvalues
+    paths = ctx["outmols"]
+    return measure(lambda: [read_eigenvalues(p) for p in paths], ctx["repeats"]), len(paths)
+
+def bench_parse_recover_file(ctx):
+    import dmol2db
+    paths = [os.path.join(d, "recover.txt") for d in ctx["search_dirs"]]
+    return measure(lambda: [list(dmol2db.parse_recover_file(p)) for p in paths], ctx["repeats"]), len(paths)
+
+def _structures(ctx):
+    import dmol2db
+    return [list(dmol2db.parse_recover_file(os.path.join(d, "recover.txt"))) for d in ctx["search_dirs"]]
+
+def _bench_cluster(ctx, **kwargs):
+    import dmol2db
+    if kwargs and "engine" not in dmol2db.cluster_structures.__code__.co_varnames:
+        raise Skip("cluster_structures 不支持 engine 参数")
+    all_structures = _structures(ctx)
+    n = sum(len(s) for s in all_structures)
+    return measure(lambda: [dmol2db.cluster_structures(s, **kwargs) for s in all_structures], ctx["repeats"]), n
+
+def bench_cluster_structures(ctx):
+    return _bench_cluster(ctx)
+
+def bench_cluster_structures_numpy(ctx):
+    return _bench_cluster(ctx, engine="numpy")
+
+def bench_locate_folders_from_log(ctx):
+    import dmol2db
+    jobs = []
+    for d in ctx["search_dirs"]:
+        popnums = [s[0] for s in dmol2db.parse_recover_file(os.path.join(d, "recover.txt"))]
+        jobs.append((os.path.join(d, "log.txt"), popnums))
+
+    def clear_cache():
+        # 每次都从头扫描 log.txt，不计入索引缓存
+        try:
+            from lib import log_index
+            log_index._index_cache.clear()
+        except ImportError:
+            pass
+
+    return measure(lambda state: [dmol2db.locate_folders_from_log(p, pops) for p, pops in jobs],
+                   ctx["repeats"], setup=clear_cache), sum(len(p) for _, p in jobs)
+
+def _records(ctx):
+    from lib.extract_parameters import extract_parameters
+    records = []
+    with quiet():
+        for path in ctx["outmols"]:
+            result = extract_parameters(path)
+            if result:
+                records.append(result)
+    return records
+
+def bench_save_to_db(ctx):
+    records = _records(ctx)
+    workdir = ctx["workdir"]
+
+    def fresh_db():
+        path = os.path.join(workdir, "bench_save.db")
+        if os.path.exists(path):
+            os.remove(path)
+        return path
+
+    try:
+        from lib.save_to_db import DBWriter
+    except ImportError:
+        DBWriter = None
+
+    if DBWriter is not None:
+        def run(db_path):
+            with DBWriter(db_path) as writer:
+                for parameters, species, positions in records:
+                    writer.write(parameters, species, positions)
+    else:
+        from lib.save_to_db import save_to_db
+
+        def run(db_path):
+            for parameters, species, positions in records:
+                save_to_db(db_path, parameters, species, positions)
+
+    return measure(run, ctx["repeats"], setup=fresh_db), len(records)
+
+def _defines(repo, filename, name):
+    """ 只用 ast 检查文件是否定义了顶层函数 name，不导入（旧版本在模块顶层就会读写数据库） """
+    path = os.path.join(repo, filename)
+    if not os.path.isfile(path):
+        return False
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    return any(isinstance(node, ast.FunctionDef) and node.name == name for node in tree.body)
+
+def _seed_target(path):
+    """ 每次合并到新的目标库，先写入一行（旧版本要求目标库已有 systems 表和数据） """
+    from ase import Atoms
+    from ase.db import connect
+
+    if os.path.exists(path):
+        os.remove(path)
+    connect(path).write(Atoms("H"))
+    return path
+
+def bench_tool_merge_db(ctx):
+    source = ctx["e2e_db"]
+    if source is None:
+        raise Skip("没有端到端生成的数据库")
+    rows = _row_count(source)
+
+    if _defines(ctx["repo"], "tool_merge_db.py", "merge_databases"):
+        import tool_merge_db
+
+        target = os.path.join(ctx["workdir"], "bench_merge_target.db")
+        # 同一结果库不能重复合并到同一目标库（unique_id 冲突），每次都用新的目标库
+        return measure(lambda path: tool_merge_db.merge_databases(path, [source]), ctx["repeats"],
+                       setup=lambda: _seed_target(target)), rows
+
+    # 旧版本：脚本在模块顶层合并自己目录下的 DATABASE.db 和 DMOL_RESULTS.db（并改写后者），
+    # 复制到临时目录中用子进程运行，不改动被测的 checkout
+    script = os.path.join(ctx["repo"], "tool_merge_db.py")
+    if not os.path.isfile(script):
+        raise Skip("没有 tool_merge_db.py")
+    sandbox = os.path.join(ctx["workdir"], "merge_sandbox")
+    os.makedirs(sandbox, exist_ok=True)
+    shutil.copy(script, sandbox)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ctx["repo"], os.environ.get("PYTHONPATH")])))
+
+    def setup():
+        _seed_target(os.path.join(sandbox, "DATABASE.db"))
+        shutil.copy(source, os.path.join(sandbox, "DMOL_RESULTS.db"))
+
+    def run(state):
+        result = subprocess.run([sys.executable, "tool_merge_db.py"], cwd=sandbox, env=env,
+                                stdin=subprocess.DEVNULL, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Skip(f"旧版 tool_merge_db.py 运行失败: {(result.stderr.strip().splitlines() or ['?'])[-1]}")
+
+    stats = measure(run, ctx["repeats"], setup=setup)
+    stats["mode"] = "subprocess"  # 墙钟包含解释器启动；CPU 时间不含子进程
+    return stats, rows
+
+def _row_count(db_path):
+    import sqlite3
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM systems").fetchone()[0]
+
+def _run_dmol2db(ctx, extra_args):
+    import dmol2db
+    db_path = os.path.join(ctx["workdir"], "bench_e2e.db")
+    for path in (db_path, os.path.join(ctx["workdir"], "SYMMETRY_CACHE.db")):
+        if os.path.exists(path):
+            os.remove(path)
+    if inspect.signature(dmol2db.main).parameters:
+        dmol2db.main([ctx["tree"], "--db", db_path] + extra_args)
+        return db_path
+    # 旧版本：根路径交互输入，数据库名为模块全局变量
+    if extra_args:
+        raise Skip("dmol2db.main 不接受命令行参数")
+    dmol2db.db_filename = db_path
+    with mock.patch("builtins.input", return_value=ctx["tree"]):
+        dmol2db.main()
+    return db_path
+
+def bench_end_to_end(ctx):
+    stats = measure(lambda state: _run_dmol2db(ctx, []), ctx["repeats"], setup=lambda: None)
+    ctx["e2e_db"] = os.path.join(ctx["workdir"], "bench_e2e.db")
+    return stats, len(ctx["outmols"])
+
+def bench_end_to_end_parallel(ctx):
+    jobs = ctx["jobs"]
+    if jobs <= 1:
+        raise Skip("--jobs 1")
+    return measure(lambda state: _run_dmol2db(ctx, ["--jobs", str(jobs)]), ctx["repeats"],
+                   setup=lambda: None), len(ctx["outmols"])
+
+# 端到端在 tool_merge_db 之前运行，合并使用它生成的数据库
+STAGES = [
+    ("extract_parameters", bench_extract_parameters),
+    ("read_eigenvalues", bench_read_eigenvalues),
+    ("parse_recover_file", bench_parse_recover_file),
+    ("cluster_structures", bench_cluster_structures),
+    ("cluster_structures_numpy", bench_cluster_structures_numpy),
+    ("locate_folders_from_log", bench_locate_folders_from_log),
+    ("save_to_db", bench_save_to_db),
+    ("end_to_end", bench_end_to_end),
+    ("end_to_end_parallel", bench_end_to_end_parallel),
+    ("tool_merge_db", bench_tool_merge_db),
+]
+
+
+# ========== 运行与比较 ==========
+def git_revision(repo=REPO_ROOT):
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo,
+                             capture_output=True, text=True, timeout=10)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo,
+                               capture_output=True, text=True, timeout=30)
+        return out.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "")
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run_suite(size, repeats=3, jobs=1, only=None, fixture_dir=None, keep=False, repo=REPO_ROOT):
+    """ repo: 被测代码所在目录，可以是另一个版本的 checkout（例如 git worktree） """
+    repo = os.path.abspath(repo)
+    config = dict(SIZES[size])
+    workdir = tempfile.mkdtemp(prefix="dmol_bench_")
+    tree = fixture_dir or os.path.join(workdir, "tree")
+    if not (fixture_dir and os.path.isdir(fixture_dir)):
+        print(f"📌 生成测试数据 ({size}): {tree}")
+        fixtures.make_tree(tree, **config)
+
+    ctx = {
+        "tree": os.path.abspath(tree),
+        "workdir": workdir,
+        "repeats": repeats,
+        "jobs": jobs,
+        "outmols": _outmol_paths(tree),
+        "search_dirs": _search_dirs(tree),
+        "e2e_db": None,
+        "repo": repo,
+    }
+
+    results = {}
+    cwd = os.getcwd()
+    os.chdir(workdir)   # dmol2db 的日志和数据库写在当前目录
+    sys.path.insert(0, repo)
+    try:
+        with quiet():
+            import dmol2db  # noqa: F401 先导入（pymatgen 等），不计入第一个阶段
+        for name, func in STAGES:
+            if only and name not in only and not (name == "end_to_end" and "tool_merge_db" in only):
+                continue
+            try:
+                stats, n = func(ctx)
+            except (Skip, ImportError, AttributeError) as e:
+                results[name] = {"skipped": str(e)}
+                print(f"⏭️  {name}: 跳过 ({e})")
+                continue
+            except Exception as e:
+                results[name] = {"error": f"{type(e).__name__}: {e}"}
+                print(f"❌ {name}: 出错 ({type(e).__name__}: {e})")
+                continue
+            stats["items"] = n
+            results[name] = stats
+            print(f"⏱️  {name:28s} {stats['wall_median']:9.4f} s  (cpu {stats['cpu_median']:.4f} s, n={n})")
+    finally:
+        os.chdir(cwd)
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "revision": git_revision(repo),
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "size": size,
+            "config": config,
+            "repeats": repeats,
+            "jobs": jobs,
+        },
+        "results": results,
+    }
+
+def compare(base_path, new_path, threshold=0.10):
+    """ 打印两次结果的对比，返回变慢超过 threshold 的阶段 """
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"base: {base['meta'].get('revision')} ({base['meta'].get('size')})   "
+          f"new: {new['meta'].get('revision')} ({new['meta'].get('size')})")
+    print(f"{'stage':28s} {'base (s)':>10s} {'new (s)':>10s} {'speedup':>9s}")
+    regressions = []
+    for name in dict.fromkeys(list(base["results"]) + list(new["results"])):
+        a = base["results"].get(name, {})
+        b = new["results"].get(name, {})
+        if "wall_median" not in a or "wall_median" not in b:
+            print(f"{name:28s} {'-':>10s} {'-':>10s} {'-':>9s}")
+            continue
+        speedup = a["wall_median"] / b["wall_median"] if b["wall_median"] > 0 else float("inf")
+        flag = ""
+        if b["wall_median"] > a["wall_median"] * (1 + threshold):
+            regressions.append(name)
+            flag = "  ⚠️ 变慢"
+        print(f"{name:28s} {a['wall_median']:10.4f} {b['wall_median']:10.4f} {speedup:8.2f}x{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="dmol_webdb 基准测试")
+    parser.add_argument("--size", choices=list(SIZES), default="small", help="测试数据规模，默认 small")
+    parser.add_argument("--repeats", type=int, default=3, help="每个阶段重复次数（取中位数），默认 3")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="端到端并行测试使用的进程数（>1 时运行）")
+    parser.add_argument("--only", nargs="+", metavar="STAGE", help="只运行指定阶段: " + ", ".join(n for n, _ in STAGES))
+    parser.add_argument("--fixtures", help="使用（或生成到）指定的测试数据目录，便于不同版本共用同一份数据")
+    parser.add_argument("--repo", default=REPO_ROOT,
+                        help="被测代码目录（默认本仓库），可指向另一个版本的 checkout 进行对比")
+    parser.add_argument("--keep", action="store_true", help="保留临时工作目录")
+    parser.add_argument("-o", "--output", help="结果 JSON 文件（默认 bench_<版本>_<size>.json）")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="比较两个结果文件")
+    parser.add_argument("--threshold", type=float, default=0.10, help="比较时判定变慢的阈值，默认 0.10 (10%%)")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        regressions = compare(*args.compare, threshold=args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    report = run_suite(args.size, args.repeats, args.jobs, args.only, args.fixtures, args.keep, args.repo)
+    output = args.output or f"bench_{report['meta']['revision'] or 'unknown'}_{args.size}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"📄 结果已保存: {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+from lib.cli import main
+
+# 统一入口：python dmol.py {ingest,merge,export,plot,dos,query,serve,symmetry,startup} ...
+if __name__ == "__main__":
+    main()
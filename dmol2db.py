@@ -1,74 +1,159 @@
 import os
+import atexit
+import signal
 import datetime
 import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import numpy as np
-from pymatgen.core import Molecule
-from pymatgen.analysis.molecule_matcher import HungarianOrderMatcher, KabschMatcher
-from lib.extract_parameters import extract_parameters
-from lib.save_to_db import save_to_db
-from lib.calculate_dos import plot_dos, read_eigenvalues
+from lib.parse_outmol import parse_outmol
+from lib.fingerprint import FingerprintIndex, distance_fingerprint
+from lib.recover_store import load_population_store
+from lib.log_index import get_log_index, lookup_folders
+from lib.rmsd import cluster_greedy
+from lib.extract_parameters import extract_parameters, DEFAULT_SYMMETRY
+from lib.symmetry import SymmetryStage, backfill_point_groups
+from lib.save_to_db import DBWriter
+from lib.manifest import Manifest
+from lib.journal import Journal
+from lib.shard import parse_shard, shard_of, search_tag, shard_db_name, record_shard
+from lib.dos_store import DOSStore
+from lib.instrument import metrics, profiled
+from lib.discover import iter_search_dirs
+from lib.compressed import input_exists
+from lib.cli import ask
 from collections import Counter
-from pymatgen.core import Composition
 
 # ========== 自动生成数据库和日志名 ==========
 timestamp = datetime.datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
 db_filename = f"DMOL_RESULTS_{timestamp}.db"
 log_filename = f"log_{timestamp}.log"
 
+# 子进程中不直接写日志，先缓存，随任务结果交给主进程统一写入
+_worker_messages = None
+
+# 日志文件只打开一次，带缓冲写入，退出时（或 flush_log）落盘
+_log_file = None
+
+def _open_log():
+    global _log_file
+    if _log_file is None:
+        _log_file = open(log_filename, "a", encoding="utf-8", buffering=1 << 16)
+        atexit.register(_log_file.close)
+    return _log_file
+
+def flush_log():
+    if _log_file is not None:
+        _log_file.flush()
+
 def log_message(message):
+    if _worker_messages is not None:
+        _worker_messages.append(message)
+        return
     ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     full_msg = f"[{ts}] {message}"
     print(full_msg)
-    with open(log_filename, "a", encoding="utf-8") as f:
-        f.write(full_msg + "\n")
-
-def parse_recover_file(recover_path):
-    structures = []
-    with open(recover_path, 'r') as f:
-        lines = f.readlines()
-
-    i = 0
-    while i < len(lines):
-        if lines[i].startswith("pop"):
-            match = lines[i].strip().split()
-            pop_num = int(match[1])
-            energy_line = lines[i+1].strip()
-            energy = float(energy_line.split()[0])
-            atom_species, atom_positions = [], []
-            j = i + 2
-            while j < len(lines) and lines[j].strip() and not lines[j].startswith("pop"):
-                parts = lines[j].split()
-                if len(parts) >= 4:
-                    atom_species.append(parts[0])
-                    atom_positions.append([float(x) for x in parts[1:4]])
-                j += 1
-            structures.append((pop_num, energy, atom_species, atom_positions))
-            i = j
-        else:
-            i += 1
-    return structures
+    _open_log().write(full_msg + "\n")
+
+def parse_recover_file(recover_path, cache=False):
+    # 流式解析为紧凑的 PopulationStore（连续数组），迭代时仍得到 (pop_num, energy, species, positions)
+    return load_population_store(recover_path, cache=cache)
+
+def _cluster_with_matchers(structures, rmsd_cutoff, energy_window):
+    """
+    逐个结构与已有分组的代表结构比较，RMSD < rmsd_cutoff 归入第一个匹配的分组。
+    完整的 Kabsch/Hungarian 拟合前先用廉价条件排除不可能匹配的分组：
+      - 元素序列：KabschMatcher 要求元素顺序完全一致，否则抛异常（原实现中即视为不匹配）
+      - 距离指纹：排序后的原子间距离差给出 RMSD 的严格下界
+    两者都不改变聚类结果。energy_window (eV) 为可选的额外能量窗口筛选，默认关闭。
+    """
+    from pymatgen.core import Molecule
+    from pymatgen.analysis.molecule_matcher import HungarianOrderMatcher, KabschMatcher
 
-def cluster_structures(structures, rmsd_cutoff=0.2):
-    selected_popnums = []
     grouped = []
+    ref_mols = []
+    indexes = {}  # 元素序列 -> FingerprintIndex
 
     for pop_num, energy, species, positions in structures:
-        mol = Molecule(species, positions)
+        key = tuple(species)
+        index = indexes.get(key)
+        if index is None:
+            index = indexes[key] = FingerprintIndex(len(species))
+        fp = distance_fingerprint(positions)
+
+        mol = None
         added = False
-        for group in grouped:
-            ref_mol = Molecule(group[0][2], group[0][3])
+        for g in index.candidates(fp, rmsd_cutoff):
+            group = grouped[g]
+            if energy_window is not None and abs(energy - group[0][1]) > energy_window:
+                continue
+            if mol is None:
+                mol = Molecule(species, positions)
+            ref_mol = ref_mols[g]
             try:
-                rmsd1 = HungarianOrderMatcher(ref_mol).fit(mol)[-1]
-                rmsd2 = KabschMatcher(ref_mol).fit(mol)[-1]
-                if min(rmsd1, rmsd2) < rmsd_cutoff:
+                # 与原实现相同，两个拟合都要成功：任何一个抛异常都视为不匹配，
+                # 所以 Kabsch 已低于阈值时也要跑 Hungarian。Kabsch 更便宜，先算，抛异常时省掉 Hungarian
+                rmsd = KabschMatcher(ref_mol).fit(mol)[-1]
+                rmsd = min(rmsd, HungarianOrderMatcher(ref_mol).fit(mol)[-1])
+                if rmsd < rmsd_cutoff:
                     group.append((pop_num, energy, species, positions))
                     added = True
                     break
-            except Exception as e:
+            except Exception:
                 continue
         if not added:
+            index.add(fp, len(grouped))
             grouped.append([(pop_num, energy, species, positions)])
+            ref_mols.append(mol if mol is not None else Molecule(species, positions))
+
+    return grouped
+
+def _cluster_bucket(coords, species, rmsd_cutoff, energies, energy_window):
+    from pymatgen.core import Element
+
+    elements = [Element(s) for s in species]
+    numbers = [e.Z for e in elements]
+    masses = [float(e.atomic_mass) for e in elements]
+    return cluster_greedy(coords, numbers, masses, rmsd_cutoff, energies, energy_window)
+
+def _cluster_with_numpy(structures, rmsd_cutoff, energy_window, jobs):
+    """
+    批量 NumPy 内核，每个结构只与已有分组的代表结构比较（指纹预筛选 + 批量 Kabsch/Hungarian），
+    判据与贪心规则与逐对比较时相同；jobs > 1 时不同元素序列的分组在多个进程中同时聚类。
+    贪心聚类依赖输入顺序，同一元素序列的分组只能在一个进程中进行：单一组成的输入（常见的 GA 搜索）只用一个核
+    """
+    buckets = {}
+    for idx, structure in enumerate(structures):
+        buckets.setdefault(tuple(structure[2]), []).append(idx)
+
+    tasks = []
+    for species, members in buckets.items():
+        coords = np.array([structures[i][3] for i in members], dtype=float)
+        energies = np.array([structures[i][1] for i in members], dtype=float)
+        tasks.append((coords, species, rmsd_cutoff, energies, energy_window))
+    if jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as pool:
+            results = list(pool.map(_cluster_bucket, *zip(*tasks)))
+    else:
+        results = [_cluster_bucket(*task) for task in tasks]
+
+    groups = [[members[k] for k in group] for members, bucket in zip(buckets.values(), results) for group in bucket]
+    # 恢复按分组创建顺序排列，与逐个比较时一致
+    groups.sort(key=lambda g: g[0])
+    return [[structures[i] for i in group] for group in groups]
+
+def cluster_structures(structures, rmsd_cutoff=0.2, energy_window=None, engine="pymatgen", jobs=1):
+    """
+    engine="pymatgen": 指纹预筛选 + pymatgen 匹配器逐对拟合（默认）
+    engine="numpy":    指纹预筛选 + 批量 NumPy Kabsch/Hungarian（jobs > 1 时按元素序列分桶多进程，
+                       只对包含多种元素序列的输入有效）
+    """
+    if engine == "numpy":
+        grouped = _cluster_with_numpy(structures, rmsd_cutoff, energy_window, jobs)
+    else:
+        grouped = _cluster_with_matchers(structures, rmsd_cutoff, energy_window)
 
+    selected_popnums = []
     for group in grouped:
         best = min(group, key=lambda x: x[1])
         selected_popnums.append(best[0])
@@ -77,105 +162,449 @@ def cluster_structures(structures, rmsd_cutoff=0.2):
     return selected_popnums
 
 def locate_folders_from_log(log_path, popnums):
-    with open(log_path, 'r') as f:
-        lines = f.readlines()
-
-    folders = [None] * len(popnums)
-    pop_index = {p: i for i, p in enumerate(popnums)}
-    found = set()
-
-    # Pass 1: 从后往前找 replace
-    for i in range(len(lines) - 1, -1, -1):
-        line = lines[i].strip()
-        if line.startswith("replace"):
-            parts = line.split()
-            if parts and parts[-1].isdigit():
-                pop = int(parts[-1])
-                if pop in pop_index and folders[pop_index[pop]] is None:
-                    # 找 folder name
-                    for j in range(i - 1, -1, -1):
-                        if lines[j].strip().startswith("folder name"):
-                            folder = lines[j].strip().split(":")[-1].strip()
-                            folders[pop_index[pop]] = folder
-                            found.add(pop)
-                            break
-    # Pass 2: 补充剩下的 pop
-    for i, pop in enumerate(popnums):
-        if pop in found:
-            continue
-        for j in range(len(lines)):
-            if lines[j].strip() == f"init {pop}":
-                for k in range(j, len(lines)):
-                    if lines[k].strip().startswith("folder name"):
-                        folders[i] = lines[k].strip().split(":")[-1].strip()
-                        break
-                break
-    return folders
-
-def process_selected_folders(search_dir, folders):
+    # 单次扫描建立 pop -> 文件夹 索引（replace 优先于 init），同一 log.txt 重复调用时复用
+    return lookup_folders(get_log_index(log_path), popnums)
+
+def process_folder(search_dir, folder, index, symmetry=DEFAULT_SYMMETRY, tag=None):
+    """
+    解析单个结构（outmol、点群、能级表），返回待写入数据库的记录；不写数据库。
+    tag 为 search 目录标签（lib.shard.search_tag），filename 为 {formula}_{tag}_{序号}，不同目录之间不重名
+    """
+    if folder is None:
+        log_message(f"❌ {search_dir}: log.txt 中找不到第 {index+1} 个结构的文件夹")
+        return None
+
+    dmol_path = os.path.join(search_dir, folder, "dmol.outmol")
+    if not input_exists(dmol_path):
+        log_message(f"❌ 找不到文件: {dmol_path}")
+        return None
+
+    try:
+        # 每个 outmol 只读取一次，参数提取和 DOS 共用解析结果
+        with metrics.stage("outmol_parse", item=dmol_path, group=search_dir):
+            parsed = parse_outmol(dmol_path)
+        with metrics.context(dmol_path, search_dir):
+            parameters, atom_species, atom_positions = extract_parameters(parsed, symmetry)
+    except Exception as e:
+        log_message(f"❌ {dmol_path}: 提取参数失败，错误: {e}")
+        return None
+
+    if not (parameters and atom_species and atom_positions):
+        log_message(f"⚠️ {dmol_path}: 信息不完整，跳过")
+        return None
+
+    from pymatgen.core import Composition
+
+    formula = Composition(Counter(atom_species)).formula.replace(" ", "")
+    filename = f"{formula}_{tag}_{index+1}" if tag else f"{formula}_{index+1}"
+    parameters["filename"] = filename
+
+    if not parsed.eigenvalues:
+        log_message(f"⚠️ 电子能级为空，跳过 DOS: {dmol_path}")
+
+    return {
+        "dmol_path": dmol_path,
+        "index": index,
+        "parameters": parameters,
+        "atom_species": atom_species,
+        "atom_positions": atom_positions,
+        "formula": formula,
+        "eigenvalues": parsed.eigenvalues,
+        "occupations": parsed.occupations,
+    }
+
+
+class Ingestion:
+    """ 主进程中的写入端：唯一的数据库写入器，同一数据库中的清单、进度日志和能级谱存储，以及可选的 DOS 渲染队列 """
+
+    def __init__(self, writer, manifest=None, dos_store=None, render_queue=None, journal=None):
+        self.writer = writer
+        self.manifest = manifest
+        self.dos_store = dos_store
+        self.render_queue = render_queue
+        self.journal = journal
+
+    def delete(self, ids):
+        if self.dos_store is not None:
+            self.dos_store.delete(ids)
+        self.writer.delete(ids)
+
+def write_record(sink, record, search_dir=None):
+    """ 只在主进程中调用，保证只有一个进程写 SQLite；记录及其附加信息随同一批次提交 """
+    dmol_path = record["dmol_path"]
+    parameters = record["parameters"]
+
+    def on_written(row_id):
+        if sink.dos_store is not None and record["eigenvalues"]:
+            sink.dos_store.put(row_id, record["eigenvalues"], record["occupations"],
+                               filename=parameters["filename"], formula=record["formula"])
+        if sink.render_queue is not None and record["eigenvalues"]:
+            # 出图交给后台渲染进程，入库不等待
+            sink.render_queue.submit(row_id, parameters["filename"], record["formula"],
+                                     record["eigenvalues"], record["occupations"], label=dmol_path)
+        if sink.manifest is not None:
+            # 与新行在同一事务中替换旧行、更新清单
+            entry = sink.manifest.get(dmol_path)
+            if entry is not None and entry["db_id"] is not None:
+                sink.delete([entry["db_id"]])
+            sink.manifest.record(dmol_path, "outmol", search_dir, db_id=row_id)
+        if sink.journal is not None:
+            sink.journal.record_structure(search_dir, record["index"], row_id)
+        log_message(f"✅ 成功存入数据库: {dmol_path}，Filename: {parameters['filename']}")
+
+    sink.writer.write(parameters, record["atom_species"], record["atom_positions"],
+                      callback=on_written, label=dmol_path)
+
+def outmol_unchanged(manifest, search_dir, folder):
+    """ 增量模式：outmol 与清单一致且已有对应数据库行时跳过 """
+    if manifest is None or folder is None:
+        return False
+    dmol_path = os.path.join(search_dir, folder, "dmol.outmol")
+    if not input_exists(dmol_path):
+        return False
+    entry = manifest.get(dmol_path)
+    return entry is not None and entry["db_id"] is not None and manifest.is_unchanged(dmol_path)
+
+def process_selected_folders(search_dir, folders, sink=None, symmetry=DEFAULT_SYMMETRY, tag=None):
+    if sink is None:
+        with DBWriter(db_filename) as writer:
+            sink = Ingestion(writer, dos_store=DOSStore(writer.connection))
+            return process_selected_folders(search_dir, folders, sink, symmetry, tag)
+
+    finished = finished_structures(sink.journal, search_dir)
     for i, folder in enumerate(folders):
-        dmol_path = os.path.join(search_dir, folder, "dmol.outmol")
-        if not os.path.exists(dmol_path):
-            log_message(f"❌ 找不到文件: {dmol_path}")
+        if i in finished or outmol_unchanged(sink.manifest, search_dir, folder):
             continue
+        record = process_folder(search_dir, folder, i, symmetry, tag)
+        if record:
+            write_record(sink, record, search_dir)
+        else:
+            journal_failure(sink, search_dir, i)
 
-        try:
-            parameters, atom_species, atom_positions = extract_parameters(dmol_path)
-        except Exception as e:
-            log_message(f"❌ {dmol_path}: 提取参数失败，错误: {e}")
-            continue
+def analyze_search_dir(search_path, cluster_engine="pymatgen", cluster_jobs=1, recover_cache=False):
+    """ recover.txt 解析 + 结构聚类 + log.txt 定位文件夹 """
+    recover = os.path.join(search_path, "recover.txt")
+    log_txt = os.path.join(search_path, "log.txt")
+    with metrics.stage("recover_parse", item=search_path, group=search_path):
+        structures = parse_recover_file(recover, cache=recover_cache)
+    with metrics.stage("clustering", item=search_path, group=search_path):
+        popnums = cluster_structures(structures, engine=cluster_engine, jobs=cluster_jobs)
+    with metrics.stage("log_lookup", item=search_path, group=search_path):
+        return locate_folders_from_log(log_txt, popnums)
+
+def find_search_dirs(root, prune=(), max_depth=None, threads=1, descend_into_search=False):
+    """ 遍历根目录（os.scandir，可剪枝、限深、多线程），找到一个就返回一个包含 recover.txt 和 log.txt 的 search 目录 """
+    return iter_search_dirs(root, prune, max_depth, threads, descend_into_search,
+                            warn=lambda path: log_message(f"⚠️ 缺失 recover.txt 或 log.txt: {path}"))
+
+def discover(root, options):
+    search_dirs = find_search_dirs(root, options.prune or (), options.max_depth,
+                                   options.walk_threads, options.descend_search)
+    if options.shard:
+        # 按相对路径的稳定哈希分片：各节点独立遍历，互不协调，也不会重复或遗漏
+        index, count = parse_shard(options.shard)
+        search_dirs = (d for d in search_dirs if shard_of(d, root, count) == index)
+    return metrics.timed_iter(search_dirs, "walk")
+
+# ========== 多进程任务：返回 (结果, 子进程日志, 子进程耗时记录) ==========
+def _init_worker():
+    global _worker_messages
+    _worker_messages = []
+    metrics.buffer()
+
+def _worker_task(func, *args, **kwargs):
+    _worker_messages.clear()
+    try:
+        result = func(*args, **kwargs)
+    except Exception as e:
+        _worker_messages.append(f"❌ {args[0]}: 处理失败，错误: {e}")
+        result = None
+    return result, list(_worker_messages), metrics.drain()
+
+def cached_folders(manifest, search_path):
+    """ 增量模式：recover.txt 和 log.txt 都没变时直接复用上次选出的文件夹 """
+    if manifest is None:
+        return None
+    recover = os.path.join(search_path, "recover.txt")
+    log_txt = os.path.join(search_path, "log.txt")
+    return manifest.cached_folders(search_path, recover, log_txt)
+
+def remember_folders(sink, search_path, folders):
+    """ 增量模式：search 目录重新分析后，删除它以前写入的行并记录新的文件夹列表 """
+    if sink.manifest is None or folders is None:
+        return
+    sink.delete(sink.manifest.forget_search_dir(search_path))
+    recover = os.path.join(search_path, "recover.txt")
+    log_txt = os.path.join(search_path, "log.txt")
+    sink.manifest.record_search_dir(search_path, recover, log_txt, folders)
+
+# ========== 续跑：进度日志与结果行在同一事务中提交 ==========
+def search_done(journal, search_path):
+    return journal is not None and journal.search_done(search_path)
+
+def journaled_folders(journal, search_path):
+    """ 上次运行中已聚类、但还没处理完的 search 目录直接复用文件夹列表 """
+    return journal.folders(search_path) if journal is not None else None
+
+def finished_structures(journal, search_path):
+    return journal.finished_structures(search_path) if journal is not None else set()
+
+def journal_folders(sink, search_path, folders):
+    if sink.journal is not None and folders is not None:
+        sink.journal.record_folders(search_path, folders)
+
+def journal_failure(sink, search_path, index):
+    """ 没有写入行的结构也记为已处理，续跑时不再重试 """
+    if sink.journal is not None:
+        sink.journal.record_structure(search_path, index)
+
+def finish_search(sink, search_path):
+    if sink.journal is not None:
+        sink.journal.finish_search(search_path)
 
-        if not (parameters and atom_species and atom_positions):
-            log_message(f"⚠️ {dmol_path}: 信息不完整，跳过")
+def _terminate(signum, frame):
+    """ 集群抢占时发送 SIGTERM：转为 SystemExit，让 DBWriter 提交已完成的记录后退出 """
+    raise SystemExit(128 + signum)
+
+def inline_symmetry(options):
+    """ 入库时使用的点群分析；deferred / off 模式下入库时不计算点群 """
+    if options.symmetry != "inline":
+        return None
+    return symmetry_stage(options)
+
+def symmetry_stage(options):
+    return SymmetryStage(options.symmetry_cache, options.symmetry_tolerance, timeout=options.symmetry_timeout)
+
+def run_serial(root, sink, options):
+    symmetry = inline_symmetry(options)
+    for search_path in discover(root, options):
+        if search_done(sink.journal, search_path):
             continue
+        folders = journaled_folders(sink.journal, search_path)
+        if folders is None:
+            folders = cached_folders(sink.manifest, search_path)
+        if folders is None:
+            log_message(f"📌 开始处理: {search_path}")
+            folders = analyze_search_dir(search_path, cluster_engine=options.cluster_engine,
+                                         cluster_jobs=options.cluster_jobs, recover_cache=options.recover_cache)
+            remember_folders(sink, search_path, folders)
+        journal_folders(sink, search_path, folders)
+        process_selected_folders(search_path, folders or [], sink, symmetry, search_tag(search_path, root))
+        finish_search(sink, search_path)
 
-        formula = Composition(Counter(atom_species)).formula.replace(" ", "")
-        filename = f"{formula}_{i+1}"
-        parameters["filename"] = filename
+def run_parallel(root, sink, options):
+    """ search 目录分析和每个结构的解析/点群/DOS 分发到进程池，主进程是唯一的数据库写入者 """
+    symmetry = inline_symmetry(options)
+    pool = ProcessPoolExecutor(max_workers=options.jobs, initializer=_init_worker)
+    try:
+        pending = {}
+        remaining = Counter()  # search 目录 -> 还没写回的结构任务数，降到 0 时该目录处理完毕
+        max_in_flight = 4 * options.jobs
 
-        save_to_db(db_filename, parameters, atom_species, atom_positions)
-        log_message(f"✅ 成功存入数据库: {dmol_path}，Filename: {filename}")
+        def submit_folders(search_path, folders):
+            journal_folders(sink, search_path, folders)
+            finished = finished_structures(sink.journal, search_path)
+            for i, folder in enumerate(folders or []):
+                if i in finished or outmol_unchanged(sink.manifest, search_path, folder):
+                    continue
+                future = pool.submit(_worker_task, process_folder, search_path, folder, i, symmetry,
+                                     search_tag(search_path, root))
+                pending[future] = (None, search_path, i)
+                remaining[search_path] += 1
+            if not remaining[search_path]:
+                finish_search(sink, search_path)
 
-        eigenvalues, occupations = read_eigenvalues(dmol_path)
-        if eigenvalues:
-            if not os.path.exists("dmol_dos"):
-                os.makedirs("dmol_dos")
-            dos_output = os.path.join("dmol_dos", f"{filename}.png")
-            plot_dos(dmol_path, dos_output, formula)
-            log_message(f"📊 DOS 图已保存: {dos_output}")
-        else:
-            log_message(f"⚠️ 电子能级为空，跳过 DOS 绘制: {dmol_path}")
+        def drain(timeout=None):
+            """ 处理已完成的任务：写入结果、为分析完的 search 目录提交结构任务；timeout=0 时不等待 """
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                search_path, parent_dir, index = pending.pop(future)
+                result, messages, records = future.result()
+                for message in messages:
+                    log_message(message)
+                metrics.extend(records)
+                if search_path is None:
+                    # 单个结构的任务
+                    if result:
+                        write_record(sink, result, parent_dir)
+                    else:
+                        journal_failure(sink, parent_dir, index)
+                    remaining[parent_dir] -= 1
+                    if not remaining[parent_dir]:
+                        finish_search(sink, parent_dir)
+                    continue
+                remember_folders(sink, search_path, result)
+                submit_folders(search_path, result)
+
+        for search_path in discover(root, options):
+            # 遍历与解析、入库重叠：每找到一个目录先处理已完成的任务；
+            # 在途任务超过窗口时等进程池消化后再继续遍历，pending 不会随目录树无限增长
+            drain(timeout=0)
+            while len(pending) >= max_in_flight:
+                drain()
+            if search_done(sink.journal, search_path):
+                continue
+            folders = journaled_folders(sink.journal, search_path)
+            if folders is None:
+                folders = cached_folders(sink.manifest, search_path)
+            if folders is not None:
+                submit_folders(search_path, folders)
+                continue
+            log_message(f"📌 开始处理: {search_path}")
+            future = pool.submit(_worker_task, analyze_search_dir, search_path,
+                                 cluster_engine=options.cluster_engine, recover_cache=options.recover_cache)
+            pending[future] = (search_path, None, None)
 
-def main():
-    root = input("请输入包含 search 目录的根路径: ").strip()
+        while pending:
+            drain()
+    finally:
+        # 被中断（Ctrl-C / SIGTERM）时不再启动排队中的任务
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量解析 DMol3 结果并写入 SQLite 数据库")
+    parser.add_argument("root", nargs="?", help="包含 search 目录的根路径（缺省时在终端中交互输入）")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="并行进程数，默认 1（串行）")
+    parser.add_argument("--cluster-engine", choices=["pymatgen", "numpy"], default="pymatgen",
+                        help="结构聚类方式：pymatgen 匹配器（默认）或批量 NumPy RMSD 内核")
+    parser.add_argument("--cluster-jobs", type=int, default=1,
+                        help="串行模式下按元素序列分桶并行聚类的进程数（仅 --cluster-engine numpy）；"
+                             "同一元素序列的结构总在一个进程中聚类，单一组成的搜索不会加速")
+    parser.add_argument("--recover-cache", action="store_true",
+                        help="在 recover.txt 旁缓存解析结果 recover.txt.npz，下次直接读取")
+    parser.add_argument("--batch-size", type=int, default=500,
+                        help="数据库每个事务写入的记录数，默认 500")
+    parser.add_argument("--wal", action="store_true",
+                        help="数据库使用 WAL 日志模式")
+    parser.add_argument("--db", help="输出数据库路径（默认 DMOL_RESULTS_<时间>.db，增量模式默认 DMOL_RESULTS.db）")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量模式：在数据库中保存输入文件清单，只处理新增或变化的 recover/log/outmol")
+    parser.add_argument("--resume", metavar="DB",
+                        help="续跑被中断的运行：继续写入该数据库，跳过进度日志中已完成的 search 目录和结构")
+    parser.add_argument("--shard", metavar="i/N",
+                        help="只处理第 i 片（0 <= i < N）search 目录，按相对路径哈希分片，供多节点作业数组使用；"
+                             "默认输出 DMOL_RESULTS_shard<i>of<N>.db，之后用 tool_merge_db.py --reduce 归并")
+    parser.add_argument("--checkpoint-interval", type=float, default=60,
+                        help="距上次提交超过该秒数时即提交一批（结果和进度日志一起），默认 60")
+    parser.add_argument("--symmetry", choices=["inline", "deferred", "off"], default="inline",
+                        help="点群分析：入库时计算（默认）、入库完成后用进程池补算，或不计算")
+    parser.add_argument("--symmetry-cache", default="SYMMETRY_CACHE.db",
+                        help="点群持久化缓存文件，几乎相同的结构只计算一次（默认 SYMMETRY_CACHE.db）")
+    parser.add_argument("--symmetry-tolerance", type=float, default=0.3,
+                        help="PointGroupAnalyzer 距离容差，默认 0.3")
+    parser.add_argument("--symmetry-timeout", type=float,
+                        help="每个结构点群分析的时间上限（秒），超时记为 unknown")
+    parser.add_argument("--render-dos", action="store_true",
+                        help="入库的同时在后台进程中渲染 DOS 图到 dmol_dos/（默认只把能级表存入 dos_spectra 表，之后用 tool_render_dos.py 出图）")
+    parser.add_argument("--render-jobs", type=int, default=1,
+                        help="--render-dos 使用的渲染进程数，默认 1")
+    parser.add_argument("--prune", action="append", metavar="GLOB",
+                        help="遍历时跳过名称匹配的目录（glob，可多次指定，例如 --prune 'calc_*' --prune '.*'）")
+    parser.add_argument("--max-depth", type=int,
+                        help="最多进入根目录以下多少层（search 目录最深位于 max-depth + 1 层），默认不限制")
+    parser.add_argument("--walk-threads", type=int, default=1,
+                        help="并发列目录的线程数，Lustre/NFS 等网络文件系统上建议 8–32，默认 1")
+    parser.add_argument("--descend-search", action="store_true",
+                        help="继续进入 search 目录内部寻找嵌套的 search 目录（默认不进入计算文件夹）")
+    parser.add_argument("--metrics", default=f"metrics_{timestamp}.json",
+                        help="各阶段耗时汇总（JSON），默认 metrics_<时间>.json")
+    parser.add_argument("--metrics-records",
+                        help="另把每条耗时记录（阶段、结构、search 目录、墙钟、CPU、峰值 RSS）流式写入该 CSV 文件")
+    parser.add_argument("--profile", help="用 cProfile 分析主进程，结果写入该文件（python -m pstats 查看）")
+    args = parser.parse_args(argv)
+
+    root = args.root or ask("请输入包含 search 目录的根路径: ")
+    if root is None:
+        print("❌ 缺少根路径（非交互运行时请在命令行中给出）")
+        return
     if not os.path.isdir(root):
         print(f"❌ 路径不存在: {root}")
         return
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return
 
-    for dirpath, dirnames, _ in os.walk(root):
-        if "search" in dirnames:
-            search_path = os.path.join(dirpath, "search")
-            recover = os.path.join(search_path, "recover.txt")
-            log_txt = os.path.join(search_path, "log.txt")
+    global db_filename
+    if args.resume:
+        if not os.path.isfile(args.resume):
+            print(f"❌ 要续跑的数据库不存在: {args.resume}")
+            return
+        db_filename = args.resume
+    elif args.db:
+        db_filename = args.db
+    elif args.shard:
+        db_filename = shard_db_name(*shard)
+    elif args.incremental:
+        db_filename = "DMOL_RESULTS.db"
+    signal.signal(signal.SIGTERM, _terminate)
 
-            if not os.path.exists(recover) or not os.path.exists(log_txt):
-                log_message(f"⚠️ 缺失 recover.txt 或 log.txt: {search_path}")
-                continue
+    metrics.reset()
+    if args.metrics_records:
+        metrics.open_records(args.metrics_records)
 
-            log_message(f"📌 开始处理: {search_path}")
-            structures = parse_recover_file(recover)
-            popnums = cluster_structures(structures)
-            folders = locate_folders_from_log(log_txt, popnums)
-            process_selected_folders(search_path, folders)
+    try:
+        with profiled(args.profile):
+            ingest(root, args)
+    finally:
+        for line in metrics.summary_lines():
+            log_message(line)
+        metrics.write_summary(args.metrics)
+        metrics.close()
+        log_message(f"📄 耗时统计已保存: {args.metrics}")
+        if args.profile:
+            log_message(f"📄 cProfile 结果已保存: {args.profile}")
 
     row_count = get_db_row_count(db_filename)
     log_message(f"\n✅ 所有任务完成，数据库共记录 {row_count} 条")
     log_message(f"📄 日志文件已保存: {log_filename}")
+    flush_log()
+
+def ingest(root, args):
+    render_queue = None
+    if args.render_dos:
+        from lib.render_dos import RenderQueue
+        render_queue = RenderQueue("dmol_dos", workers=args.render_jobs)
+
+    try:
+        with DBWriter(db_filename, batch_size=args.batch_size, wal=args.wal,
+                      flush_interval=args.checkpoint_interval) as writer:
+            manifest = Manifest(writer.connection) if args.incremental else None
+            journal = Journal(writer.connection)
+            if args.resume:
+                dirs, structures = journal.progress()
+                log_message(f"📌 续跑 {db_filename}: 已完成 {dirs} 个 search 目录、{structures} 个结构")
+            else:
+                journal.clear()
+            sink = Ingestion(writer, manifest, DOSStore(writer.connection), render_queue, journal)
+            if args.shard:
+                record_shard(writer.connection, *parse_shard(args.shard), root)
+            if args.jobs > 1:
+                run_parallel(root, sink, args)
+            else:
+                run_serial(root, sink, args)
+    finally:
+        if render_queue is not None:
+            rendered, failed = render_queue.close()
+            log_message(f"📊 DOS 图已保存 {rendered} 张到 dmol_dos/")
+            for error in failed:
+                log_message(f"❌ DOS 渲染失败，错误: {error}")
+
+    if args.symmetry == "deferred":
+        log_message("📌 开始补算点群")
+        updated = backfill_point_groups(db_filename, symmetry_stage(args), jobs=args.jobs, batch_size=args.batch_size)
+        log_message(f"✅ 已补算 {updated} 个结构的点群")
 
 def get_db_row_count(db_path):
     if not os.path.isfile(db_path):
         return 0
     with sqlite3.connect(db_path) as conn:
+        # 没有写入任何记录时数据库文件存在但还没有建表
+        if not conn.execute("SELECT name FROM sqlite_master WHERE name='systems'").fetchone():
+            return 0
         return conn.execute("SELECT COUNT(*) FROM systems").fetchone()[0]
 
 if __name__ == "__main__":
@@ -1,41 +1,10 @@
 import os
 import numpy as np
-import matplotlib.pyplot as plt
-
-def read_eigenvalues(dmol_outmol_path):
-    all_eigenvalues = []
-    all_occupations = []
-
-    try:
-        with open(dmol_outmol_path, "r") as f:
-            lines = f.readlines()
-    except FileNotFoundError:
-        print(f"❌ 文件未找到: {dmol_outmol_path}")
-        return [], []
-
-    start_index = None
-    for i in range(len(lines) - 1, -1, -1):
-        if "state                         eigenvalue        occupation" in lines[i]:
-            start_index = i + 3
-            break
-
-    if start_index is None:
-        print(f"⚠️ {dmol_outmol_path}: 未找到电子能级部分")
-        return [], []
-
-    for line in lines[start_index:]:
-        if line.strip() == "":
-            break
-        parts = line.split()
-        if len(parts) >= 7:
-            try:
-                eigenvalue_ev = float(parts[5])
-                occupation = float(parts[6])
-                all_eigenvalues.append(eigenvalue_ev)
-                all_occupations.append(occupation)
-            except ValueError:
-                continue
+from lib.parse_outmol import ParsedOutmol, parse_outmol
+from lib.compressed import strip_compression_suffix, resolve_input
 
+def select_homo_window(all_eigenvalues, all_occupations):
+    """ 以 HOMO 为中心截取 10 个能级用于 DOS 绘制 """
     homo_index = None
     for i, occ in enumerate(all_occupations):
         if occ < 1.0:
@@ -54,27 +23,75 @@ def read_eigenvalues(dmol_outmol_path):
 
     return eigenvalues, occupations
 
+def read_eigenvalues(source):
+    """ source 可以是 outmol 路径，也可以是已解析的 ParsedOutmol """
+    if isinstance(source, ParsedOutmol):
+        parsed = source
+    else:
+        try:
+            parsed = parse_outmol(source)
+        except FileNotFoundError:
+            print(f"❌ 文件未找到: {source}")
+            return [], []
+
+    if not parsed.eigenvalues:
+        print(f"⚠️ {parsed.path}: 未找到电子能级部分")
+        return [], []
 
+    return select_homo_window(parsed.eigenvalues, parsed.occupations)
 
-def gaussian_broadening(eigenvalues, occupations, width=0.1, resolution=0.01, energy_window=(-20, 10)):
+
+
+def batch_gaussian_broadening(spectra, width=0.1, resolution=0.01, energy_window=(-20, 10), cutoff=5.0):
+    """
+    一次性对多组能级做高斯展宽，所有谱共用同一能量网格。
+    spectra: [(eigenvalues, occupations), ...]
+    每个能级只在 ±cutoff*width 范围内的网格点上计算高斯值，用 bincount 一步累加到 (S, G) 的结果中，
+    不再为每个能级分配整条网格的数组。
+    返回 energy_grid (G,), dos (S, G)
+    """
     min_e, max_e = energy_window
     energy_grid = np.arange(min_e, max_e, resolution)
-    dos = np.zeros_like(energy_grid)
-
-    for ev, occ in zip(eigenvalues, occupations):
-        if ev < min_e - 5 * width or ev > max_e + 5 * width:
-            continue
-        gauss = occ * np.exp(-((energy_grid - ev) ** 2) / (2 * width ** 2))
-        dos += gauss
+    n_grid = len(energy_grid)
+    dos = np.zeros((len(spectra), n_grid))
+
+    lengths = [len(eigs) for eigs, _ in spectra]
+    if n_grid == 0 or sum(lengths) == 0:
+        return energy_grid, dos
+
+    ev = np.concatenate([np.asarray(eigs, dtype=float) for eigs, _ in spectra])
+    occ = np.concatenate([np.asarray(occs, dtype=float) for _, occs in spectra])
+    owner = np.repeat(np.arange(len(spectra)), lengths)
+
+    # 每个能级对应的网格窗口 [first, first + span)
+    half = cutoff * width
+    span = int(np.ceil(2 * half / resolution)) + 2
+    first = np.floor((ev - half - min_e) / resolution).astype(np.int64)
+    idx = first[:, None] + np.arange(span)[None, :]
+    valid = (idx >= 0) & (idx < n_grid)
+    idx_clipped = np.clip(idx, 0, n_grid - 1)
+    delta = energy_grid[idx_clipped] - ev[:, None]
+    valid &= np.abs(delta) <= half
+    weights = occ[:, None] * np.exp(-(delta ** 2) / (2 * width ** 2))
+
+    flat = (owner[:, None] * n_grid + idx_clipped)[valid]
+    dos += np.bincount(flat, weights=weights[valid], minlength=dos.size).reshape(dos.shape)
 
     dos /= (width * np.sqrt(2 * np.pi))  # 归一化，单位为 states/eV
     return energy_grid, dos
 
-def plot_dos(outmol_path, save_path, formula, width=0.1, resolution=0.01):
-    eigenvalues, occupations = read_eigenvalues(outmol_path)
+def gaussian_broadening(eigenvalues, occupations, width=0.1, resolution=0.01, energy_window=(-20, 10)):
+    energy_grid, dos = batch_gaussian_broadening([(eigenvalues, occupations)], width, resolution, energy_window)
+    return energy_grid, dos[0]
+
+def plot_dos(source, save_path, formula, width=0.1, resolution=0.01, fig=None):
+    eigenvalues, occupations = read_eigenvalues(source)
     if not eigenvalues:
         return
+    draw_dos(eigenvalues, occupations, save_path, formula, width, resolution, fig)
 
+def draw_dos(eigenvalues, occupations, save_path, formula, width=0.1, resolution=0.01, fig=None):
+    """ 在 fig 上绘制并保存 DOS 图；fig 为 None 时新建并在保存后关闭，避免 figure 堆积 """
     # 自动能量范围
     ev_min = min(eigenvalues)
     ev_max = max(eigenvalues)
@@ -85,16 +102,21 @@ def plot_dos(outmol_path, save_path, formula, width=0.1, resolution=0.01):
         eigenvalues, occupations, width, resolution, energy_window
     )
 
-    # 绘图
-    fig, ax = plt.subplots()
+    # 绘图（传入的 figure 先清空再复用）
+    own_figure = fig is None
+    if own_figure:
+        import matplotlib.pyplot as plt
+
+        fig = plt.figure()
+    fig.clf()
+    ax = fig.add_subplot()
 
     # DOS 曲线
     ax.plot(energy_axis, dos, color="#1f77b4", linewidth=1.2, label="DOS")
 
     # 添加能级 stick lines
     stick_height = max(dos) * 0.2
-    for ev, occ in zip(eigenvalues, occupations):
-        ax.vlines(ev, 0, stick_height, color='salmon', linewidth=0.5, alpha=0.6)
+    ax.vlines(eigenvalues, 0, stick_height, color='salmon', linewidth=0.5, alpha=0.6)
 
     # 设置坐标轴标签，使用 LaTeX
     ax.set_xlabel(r"Energy (eV)", fontsize=12)
@@ -107,32 +129,51 @@ def plot_dos(outmol_path, save_path, formula, width=0.1, resolution=0.01):
     # 其他图形参数
     ax.tick_params(direction='in')
     ax.grid(True, linestyle=':', linewidth=0.5)
-    plt.tight_layout()
-    plt.savefig(save_path, dpi=300)
-    plt.cla()
-
-
-
+    fig.tight_layout()
+    fig.savefig(save_path, dpi=300)
+    if own_figure:
+        plt.close(fig)
 
 
 def log_message(msg):
     print(msg)
 
 
-if __name__ == "__main__":
+def main():
+    """ 批量模式：为当前目录下所有 .outmol 渲染 DOS 图（与 render-dos 共用渲染阶段） """
+    from lib.render_dos import render_jobs, is_up_to_date
+
     current_dir = os.getcwd()
     save_dir = os.path.join(current_dir, "dmol_dos")
     os.makedirs(save_dir, exist_ok=True)
 
+    jobs = []
     for root, dirs, files in os.walk(current_dir):
+        # foo.outmol 和 foo.outmol.gz 对应同一张图：只处理一次，原文件优先（与 resolve_input 一致）
+        copies = {}
         for file in files:
-            if file.endswith(".outmol"):
-                file_path = os.path.join(root, file)
-                eigenvalues, occupations = read_eigenvalues(file_path)
-                if eigenvalues:
-                    filename = os.path.splitext(file)[0]
-                    dos_output = os.path.join(save_dir, f"{filename}_dos.png")
-                    plot_dos(file_path, dos_output, width=0.1, energy_window=(-20, 10))
-                    log_message(f"📊 DOS 图已保存: {dos_output}")
-                else:
-                    log_message(f"⚠️ 电子能级为空，跳过 DOS 绘制: {file_path}")
+            if strip_compression_suffix(file).endswith(".outmol"):
+                copies.setdefault(strip_compression_suffix(file), []).append(file)
+        for name, found in sorted(copies.items()):
+            file_path = resolve_input(os.path.join(root, name))
+            if file_path is None:
+                log_message(f"⚠️ 无法读取 {', '.join(found)}（.zst 需要安装 zstandard），跳过")
+                continue
+            if len(found) > 1:
+                log_message(f"⚠️ {', '.join(sorted(found))} 是同一输出的多个副本，只使用 {os.path.basename(file_path)}")
+            filename = os.path.splitext(name)[0]
+            dos_output = os.path.join(save_dir, f"{filename}_dos.png")
+            if is_up_to_date(dos_output, os.path.getmtime(file_path)):
+                continue
+            eigenvalues, occupations = read_eigenvalues(parse_outmol(file_path))
+            if eigenvalues:
+                jobs.append((dos_output, filename, eigenvalues, occupations))
+            else:
+                log_message(f"⚠️ 电子能级为空，跳过 DOS 绘制: {file_path}")
+
+    for dos_output in render_jobs(jobs, workers=os.cpu_count() or 1):
+        log_message(f"📊 DOS 图已保存: {dos_output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import statistics
+import subprocess
+
+# 统一的命令行入口，例如:
+#   python dmol.py ingest /path/to/root --jobs 16
+#   python dmol.py merge DMOL_RESULTS_*.db -t DATABASE.db
+#   python dmol.py startup
+# 子命令的参数与对应的 tool_*.py / dmol2db.py 完全相同；只导入被调用的那个模块，
+# pymatgen、ase、scipy、matplotlib、pyarrow 等在真正用到的代码路径中才导入。
+
+# 子命令 -> (模块, 说明)；模块都提供 main(argv)
+COMMANDS = {
+    "ingest":   ("dmol2db", "解析 DMol3 结果并写入数据库"),
+    "merge":    ("tool_merge_db", "合并结果数据库 / 归并分片数据库"),
+    "export":   ("tool_db2csv", "导出为 CSV / Parquet / Arrow"),
+    "plot":     ("tool_plot", "数据库统计图"),
+    "dos":      ("lib.render_dos", "根据能级表批量渲染 DOS 图"),
+    "query":    ("lib.query", "按属性和组成查询"),
+    "serve":    ("lib.server", "只读 HTTP/JSON 查询服务"),
+    "symmetry": ("lib.symmetry", "补算点群"),
+}
+
+# 导入较慢的依赖：启动测试中报告各子命令在解析参数之前是否已经导入了它们
+HEAVY_MODULES = ["pymatgen", "ase", "scipy", "matplotlib", "pandas", "pyarrow"]
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def interactive():
+    """ stdin 是终端时才允许交互提问；批处理作业中没有终端，缺少参数时直接报错退出，不会阻塞 """
+    return sys.stdin is not None and sys.stdin.isatty()
+
+def ask(prompt):
+    """ 缺省的命令行参数在终端中交互输入；非交互运行或输入为空时返回 None """
+    if not interactive():
+        return None
+    return input(prompt).strip() or None
+
+def run(command, argv):
+    module_name, _ = COMMANDS[command]
+    # 子命令的帮助信息显示为 "dmol.py ingest ..."
+    sys.argv[0] = f"{os.path.basename(sys.argv[0])} {command}"
+    return importlib.import_module(module_name).main(argv)
+
+# ========== 启动耗时测试 ==========
+_PROBE = """
+import io, sys, json, contextlib
+from lib.cli import run, HEAVY_MODULES
+with contextlib.redirect_stdout(io.StringIO()):
+    try:
+        run({command!r}, ["--help"])
+    except SystemExit:
+        pass
+print(json.dumps([m for m in HEAVY_MODULES if m in sys.modules]))
+"""
+
+def _time_process(args):
+    start = time.perf_counter()
+    result = subprocess.run(args, cwd=REPO_ROOT, capture_output=True, text=True)
+    return time.perf_counter() - start, result
+
+def startup_times(commands=None, repeats=5):
+    """
+    每个子命令在新的解释器中运行 --help（导入模块 + 建立参数解析器，不做实际工作），
+    返回 {子命令: {"median": 秒, "min": 秒, "heavy": [已导入的慢依赖], "error": ...}}；
+    "python" 为空解释器的启动时间，作为基线
+    """
+    results = {}
+    baseline = [_time_process([sys.executable, "-c", "pass"])[0] for _ in range(repeats)]
+    results["python"] = {"median": statistics.median(baseline), "min": min(baseline), "heavy": []}
+    for command in commands or COMMANDS:
+        times, heavy, error = [], [], None
+        for _ in range(repeats):
+            elapsed, result = _time_process([sys.executable, "-c", _PROBE.format(command=command)])
+            if result.returncode != 0:
+                error = (result.stderr.strip().splitlines() or ["?"])[-1]
+                break
+            times.append(elapsed)
+            heavy = json.loads(result.stdout.strip().splitlines()[-1])
+        if error is not None:
+            results[command] = {"error": error}
+        else:
+            results[command] = {"median": statistics.median(times), "min": min(times), "heavy": heavy}
+    return results
+
+def startup_main(argv=None):
+    parser = argparse.ArgumentParser(prog=f"{os.path.basename(sys.argv[0])} startup",
+                                     description="测量各子命令的启动耗时（新解释器中运行 --help）")
+    parser.add_argument("commands", nargs="*", metavar="COMMAND",
+                        help=f"要测量的子命令，默认全部（{', '.join(COMMANDS)}）")
+    parser.add_argument("-n", "--repeats", type=int, default=5, help="每个子命令运行次数，默认 5")
+    parser.add_argument("--json", help="另把结果写入该 JSON 文件")
+    args = parser.parse_args(argv)
+    unknown = [c for c in args.commands if c not in COMMANDS]
+    if unknown:
+        parser.error(f"未知子命令: {', '.join(unknown)}")
+
+    results = startup_times(args.commands or None, max(1, args.repeats))
+    print(f"{'command':<10} {'median':>9} {'min':>9}  heavy imports")
+    for command, result in results.items():
+        if "error" in result:
+            print(f"{command:<10} ❌ {result['error']}")
+            continue
+        heavy = ", ".join(result["heavy"]) or "-"
+        print(f"{command:<10} {result['median'] * 1000:>7.0f}ms {result['min'] * 1000:>7.0f}ms  {heavy}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"📄 结果已保存: {args.json}")
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    commands = "\n".join(f"  {name:<10} {description}" for name, (_, description) in COMMANDS.items())
+    parser = argparse.ArgumentParser(
+        description="dmol_webdb 命令行工具", formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"子命令:\n{commands}\n  {'startup':<10} 测量各子命令的启动耗时\n\n"
+               f"各子命令的参数见: %(prog)s <子命令> --help")
+    parser.add_argument("command", choices=list(COMMANDS) + ["startup"], metavar="command")
+    # 只解析子命令名，其余参数原样交给子命令（包括 --help）
+    args = parser.parse_args(argv[:1])
+    if args.command == "startup":
+        return startup_main(argv[1:])
+    return run(args.command, argv[1:])
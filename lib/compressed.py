@@ -0,0 +1,83 @@
+import os
+import io
+import gzip
+import lzma
+import bz2
+
+try:
+    import zstandard
+except ImportError:  # 没有安装 zstandard 时 .zst 文件视为不存在
+    zstandard = None
+
+# 按优先级排列：未压缩的原文件优先，其次是同名的压缩文件
+COMPRESSED_SUFFIXES = (".gz", ".xz", ".zst", ".bz2")
+
+
+def _open_zstd(path):
+    if zstandard is None:
+        raise ImportError("读取 .zst 文件需要安装 zstandard")
+    f = open(path, "rb")
+    try:
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f, closefd=True))
+    except BaseException:
+        f.close()
+        raise
+
+_OPENERS = {
+    ".gz": lambda path: gzip.open(path, "rb"),
+    ".xz": lambda path: lzma.open(path, "rb"),
+    ".zst": _open_zstd,
+    ".bz2": lambda path: bz2.open(path, "rb"),
+}
+
+def _available_suffixes():
+    return tuple(s for s in COMPRESSED_SUFFIXES if s != ".zst" or zstandard is not None)
+
+def strip_compression_suffix(path):
+    """ dmol.outmol.gz -> dmol.outmol；没有压缩后缀时原样返回 """
+    for suffix in COMPRESSED_SUFFIXES:
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+def resolve_input(path):
+    """
+    path 为逻辑路径（例如 .../dmol.outmol）。原文件存在时返回原文件，
+    否则返回第一个存在的压缩文件（dmol.outmol.gz / .xz / .zst / .bz2），都不存在时返回 None
+    """
+    if os.path.exists(path):
+        return path
+    for suffix in _available_suffixes():
+        candidate = path + suffix
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+def input_exists(path):
+    return resolve_input(path) is not None
+
+def _resolve_or_raise(path):
+    actual = resolve_input(path)
+    if actual is None:
+        raise FileNotFoundError(f"No such file (or compressed sibling): {path}")
+    return actual
+
+def _opener(actual):
+    return _OPENERS.get(os.path.splitext(actual)[1])
+
+def open_binary(path):
+    """ 以二进制流打开逻辑路径对应的文件，压缩文件边读边解压，不写临时文件 """
+    actual = _resolve_or_raise(path)
+    opener = _opener(actual)
+    return opener(actual) if opener is not None else open(actual, "rb")
+
+def open_text(path, encoding=None, errors=None):
+    """ open(path, 'r') 的替代：透明读取 .gz / .xz / .zst / .bz2 """
+    actual = _resolve_or_raise(path)
+    if _opener(actual) is None:
+        return open(actual, "r", encoding=encoding, errors=errors)
+    return io.TextIOWrapper(open_binary(actual), encoding=encoding, errors=errors)
+
+def input_stat(path):
+    """ 实际读取的文件（原文件或压缩文件）的 os.stat 结果，用于缓存签名 """
+    return os.stat(_resolve_or_raise(path))
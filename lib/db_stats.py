@@ -0,0 +1,73 @@
+import sqlite3
+from collections import Counter
+import numpy as np
+
+# 直接对 ASE 数据库的 systems / species / number_key_values 表做聚合查询，
+# 不再逐行 toatoms() 解码坐标；百万行的数据库也只需要常数内存。
+
+def _hill_order(symbols):
+    symbols = sorted(symbols)
+    if "C" in symbols:
+        head = ["C"] + (["H"] if "H" in symbols else [])
+        symbols = head + [s for s in symbols if s not in head]
+    return symbols
+
+def hill_label(numbers):
+    """ 元素集合 → 去掉数字的 Hill 式标签，例如 {13, 5} → "AlB"，{6, 1, 8} → "CHO" """
+    from ase.data import chemical_symbols
+
+    return "".join(_hill_order(chemical_symbols[z] for z in set(numbers)))
+
+def hill_formula(counts):
+    """ {Z: 个数} → Hill 式化学式，例如 {13: 2, 5: 4} → "Al2B4" """
+    from ase.data import chemical_symbols
+
+    by_symbol = {chemical_symbols[z]: n for z, n in counts.items()}
+    return "".join(s + (str(by_symbol[s]) if by_symbol[s] != 1 else "") for s in _hill_order(by_symbol))
+
+def composition_counts(conn):
+    """ 每种元素组合（与元素个数无关）的结构数 """
+    # species 表每个结构每种元素一行；group_concat 的顺序不保证，取回后再排序合并
+    cur = conn.execute(
+        "SELECT elements, COUNT(*) FROM "
+        "(SELECT id, group_concat(Z) AS elements FROM species GROUP BY id) "
+        "GROUP BY elements")
+    counts = Counter()
+    for elements, count in cur:
+        counts[hill_label(int(z) for z in elements.split(","))] += count
+    return counts
+
+def size_counts(conn):
+    """ natoms → 结构数 """
+    return dict(conn.execute("SELECT natoms, COUNT(*) FROM systems GROUP BY natoms ORDER BY natoms"))
+
+def key_histogram(conn, key="GAP_DFT", bins=30):
+    """ 数值键的直方图（与 numpy.histogram 的分箱方式一致），返回 (counts, edges)；没有数据时返回 None """
+    lo, hi, total = conn.execute(
+        "SELECT MIN(value), MAX(value), COUNT(*) FROM number_key_values WHERE key=?", (key,)).fetchone()
+    if not total:
+        return None
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    edges = np.linspace(lo, hi, bins + 1)
+    width = (hi - lo) / bins
+    counts = np.zeros(bins, dtype=np.int64)
+    cur = conn.execute(
+        "SELECT CAST((value - ?) / ? AS INTEGER) AS b, COUNT(*) FROM number_key_values "
+        "WHERE key=? GROUP BY b", (lo, width, key))
+    for b, count in cur:
+        counts[min(max(b, 0), bins - 1)] += count   # 最大值落在最后一个分箱（右闭）
+    return counts, edges
+
+def collect_statistics(db_path, gap_bins=30):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        if not conn.execute("SELECT name FROM sqlite_master WHERE name='systems'").fetchone():
+            return {"compositions": Counter(), "sizes": {}, "gap": None}
+        return {
+            "compositions": composition_counts(conn),
+            "sizes": size_counts(conn),
+            "gap": key_histogram(conn, "GAP_DFT", gap_bins),
+        }
+    finally:
+        conn.close()
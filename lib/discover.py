@@ -0,0 +1,114 @@
+import os
+import queue
+import threading
+from fnmatch import fnmatch
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from lib.compressed import input_exists
+
+SEARCH_DIR_NAME = "search"
+REQUIRED_FILES = ("recover.txt", "log.txt")
+
+_DONE = object()
+
+
+def _pruned(name, prune):
+    return any(fnmatch(name, pattern) for pattern in prune)
+
+def _scan(path, depth, prune, max_depth, descend_into_search):
+    """
+    用 os.scandir 列出一个目录（目录项类型来自 d_type，普通目录不需要 stat）。
+    返回 (需要继续遍历的 [(子目录, 深度)], [(search 目录, 是否完整)])
+    """
+    children, found = [], []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    # 与 os.walk 一致：指向目录的符号链接也算子目录，但不进入
+                    if not entry.is_dir():
+                        continue
+                    is_link = entry.is_symlink()
+                except OSError:
+                    continue
+                if entry.name == SEARCH_DIR_NAME:
+                    complete = all(input_exists(os.path.join(entry.path, f)) for f in REQUIRED_FILES)
+                    found.append((entry.path, complete))
+                    if not descend_into_search:
+                        continue
+                if is_link or _pruned(entry.name, prune):
+                    continue
+                if max_depth is not None and depth + 1 > max_depth:
+                    continue
+                children.append((entry.path, depth + 1))
+    except OSError:
+        # 没有权限或遍历期间被删除，与 os.walk 一样忽略
+        pass
+    return children, found
+
+def _serial(root, scan):
+    # 深度优先、先序，与 os.walk(topdown=True) 的顺序一致
+    stack = [(root, 0)]
+    while stack:
+        path, depth = stack.pop()
+        children, found = scan(path, depth)
+        yield from found
+        stack.extend(reversed(children))
+
+def _concurrent(root, scan, threads):
+    """
+    后台线程用线程池并发列目录（网络文件系统上每次 readdir / stat 延迟很高），
+    发现的 search 目录立即放入队列，调用方边遍历边处理。
+    """
+    results = queue.Queue()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                pending = {pool.submit(scan, root, 0)}
+                while pending and not stop.is_set():
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        children, found = future.result()
+                        for item in found:
+                            results.put(item)
+                        for path, depth in children:
+                            pending.add(pool.submit(scan, path, depth))
+                for future in pending:
+                    future.cancel()
+        except BaseException as e:
+            results.put(e)
+        finally:
+            results.put(_DONE)
+
+    producer = threading.Thread(target=produce, name="discover", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = results.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+def iter_search_dirs(root, prune=(), max_depth=None, threads=1, descend_into_search=False, warn=None):
+    """
+    逐个返回 root 下名为 search、且包含 recover.txt 和 log.txt 的目录，找到一个就立即返回一个。
+      - prune: 目录名的 glob 模式（例如 "calc_*"、".*"），匹配的目录不进入
+      - max_depth: 最多进入的层数（root 为第 0 层），search 目录最深位于 max_depth + 1 层；None 不限制
+      - threads: 并发列目录的线程数；> 1 时返回顺序取决于完成顺序
+      - descend_into_search: 是否继续进入 search 目录（其中是成千上万的计算文件夹），默认不进入
+      - warn: 缺少 recover.txt 或 log.txt 时以 search 目录路径调用
+    """
+    def scan(path, depth):
+        return _scan(path, depth, tuple(prune), max_depth, descend_into_search)
+
+    found = _concurrent(root, scan, threads) if threads > 1 else _serial(root, scan)
+    for search_path, complete in found:
+        if complete:
+            yield search_path
+        elif warn is not None:
+            warn(search_path)
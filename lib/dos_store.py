@@ -0,0 +1,62 @@
+import time
+import numpy as np
+
+DOS_TABLE = "dos_spectra"
+
+
+class DOSStore:
+    """
+    以数据库 id 为键的能级谱存储，和 ASE 表放在同一个数据库文件中。
+    每行保存完整的能级表（float64 二进制）以及绘图需要的 filename / formula，
+    DOS 曲线可随时用 batch_gaussian_broadening 批量计算，入库时不再渲染 PNG。
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.connection.execute(f"""CREATE TABLE IF NOT EXISTS {DOS_TABLE} (
+            id INTEGER PRIMARY KEY,
+            filename TEXT,
+            formula TEXT,
+            n INTEGER,
+            eigenvalues BLOB,
+            occupations BLOB,
+            mtime REAL)""")  # mtime: 写入时间 (Unix 时间戳)，用于判断 PNG 是否过期
+
+    def put(self, db_id, eigenvalues, occupations, filename=None, formula=None, mtime=None):
+        eigenvalues = np.ascontiguousarray(eigenvalues, dtype=np.float64)
+        occupations = np.ascontiguousarray(occupations, dtype=np.float64)
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO {DOS_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (db_id, filename, formula, len(eigenvalues), eigenvalues.tobytes(), occupations.tobytes(),
+             time.time() if mtime is None else mtime))
+
+    def get(self, db_id):
+        row = self.connection.execute(
+            f"SELECT eigenvalues, occupations FROM {DOS_TABLE} WHERE id=?", (db_id,)).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float64), np.frombuffer(row[1], dtype=np.float64)
+
+    def iter_spectra(self, ids=None, chunk_size=1000):
+        """ 逐条返回 (id, filename, formula, eigenvalues, occupations)，按 id 排序、分块读取 """
+        sql = f"SELECT id, filename, formula, eigenvalues, occupations FROM {DOS_TABLE}"
+        if ids is not None:
+            ids = [int(i) for i in ids]
+            for start in range(0, len(ids), chunk_size):
+                chunk = ids[start:start + chunk_size]
+                cur = self.connection.execute(
+                    f"{sql} WHERE id IN ({', '.join('?' * len(chunk))}) ORDER BY id", chunk)
+                yield from self._decode(cur)
+            return
+        yield from self._decode(self.connection.execute(f"{sql} ORDER BY id"))
+
+    @staticmethod
+    def _decode(cursor):
+        for db_id, filename, formula, eigs, occs in cursor:
+            yield (db_id, filename, formula,
+                   np.frombuffer(eigs, dtype=np.float64), np.frombuffer(occs, dtype=np.float64))
+
+    def delete(self, ids):
+        ids = [int(i) for i in ids]
+        if ids:
+            self.connection.execute(f"DELETE FROM {DOS_TABLE} WHERE id IN ({', '.join('?' * len(ids))})", ids)
@@ -0,0 +1,178 @@
+import numpy as np
+
+def distance_fingerprint(positions):
+    """ 排序后的原子间距离向量，对平移、旋转、镜像和原子置换都不变 """
+    pos = np.asarray(positions, dtype=float)
+    n = len(pos)
+    if n < 2:
+        return np.zeros(0)
+    diff = pos[:, None, :] - pos[None, :, :]
+    dist = np.sqrt(np.einsum("ijk,ijk->ij", diff, diff))
+    return np.sort(dist[np.triu_indices(n, k=1)])
+
+def rmsd_lower_bound_factor(natoms, per_atom=False):
+    """
+    距离指纹差 → RMSD 下界的比例系数。
+    任意刚体变换 + 原子置换后，若每个原子偏移 e_i，则
+        ||Δd||^2 <= sum_{i<j} (|e_i| + |e_j|)^2 <= 2(N-1) * sum_i |e_i|^2 = 2N(N-1) * RMSD^2
+    排序不会增大 L2 距离，所以 RMSD >= ||Δfp|| / sqrt(2N(N-1))。
+    旧版 pymatgen 的 RMSD 按 3N 个分量取平均（小 sqrt(3) 倍），默认按更保守的 6N(N-1) 取值；
+    per_atom=True 时按 lib.rmsd 的约定（按 N 个原子取平均）取 2N(N-1)。
+    """
+    if natoms < 2:
+        return 0.0
+    return 1.0 / np.sqrt((2.0 if per_atom else 6.0) * natoms * (natoms - 1))
+
+def shape_descriptor(positions):
+    """
+    居中坐标矩阵的三个奇异值 / sqrt(N)（三个主轴方向上的回转半径，从大到小）。
+    对平移、旋转、镜像和原子置换都不变；由 Weyl 不等式，|Δσ_k| <= ||ΔX||_F，
+    所以每个分量之差都不超过两结构间（按 N 个原子取平均的）任意对齐方式下的 RMSD
+    """
+    pos = np.asarray(positions, dtype=float)
+    pos = pos - pos.mean(axis=0)
+    sv = np.linalg.svd(pos, compute_uv=False) / np.sqrt(len(pos))
+    return np.pad(sv, (0, 3 - len(sv)))
+
+
+class FingerprintIndex:
+    """ 同一原子序列（元素顺序一致）的一组距离指纹，用 NumPy 一次性筛掉不可能匹配的候选 """
+
+    def __init__(self, natoms):
+        self.natoms = natoms
+        self.factor = rmsd_lower_bound_factor(natoms)
+        self._fps = None
+        self._ids = []
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, fp, item_id):
+        n = len(self._ids)
+        if self._fps is None:
+            self._fps = np.empty((4, len(fp)))
+        elif n == len(self._fps):
+            # 容量翻倍，避免每次追加都复制整张表
+            grown = np.empty((2 * n, self._fps.shape[1]))
+            grown[:n] = self._fps
+            self._fps = grown
+        self._fps[n] = fp
+        self._ids.append(item_id)
+
+    def candidates(self, fp, rmsd_cutoff):
+        """ 返回 RMSD 下界 < rmsd_cutoff 的 item_id（保持加入顺序） """
+        n = len(self._ids)
+        if n == 0:
+            return []
+        if self.factor == 0.0:
+            return list(self._ids)
+        lower = np.linalg.norm(self._fps[:n] - fp, axis=1) * self.factor
+        # 留一点浮点余量，保证不会误删真正匹配的结构
+        keep = np.nonzero(lower < rmsd_cutoff + 1e-9)[0]
+        return [self._ids[k] for k in keep]
+
+
+# ========== 跨运行去重：保存在主数据库中的持久指纹索引 ==========
+FINGERPRINT_TABLE = "structure_fingerprints"
+FINGERPRINT_INDEX = "structure_fingerprints_rtree"
+COMPOSITION_TABLE = "structure_compositions"
+# 两个结构 RMSD < cutoff 时（lib.rmsd 的约定），各描述符之差的严格上界（cutoff 的倍数）：
+#   回转半径 |Δσ_k| <= RMSD（见 shape_descriptor）
+#   平均原子间距离 |Δmean| <= ||Δfp|| / sqrt(K) <= 2 RMSD，K = N(N-1)/2
+SHAPE_WINDOW = 1.0
+MEAN_DISTANCE_WINDOW = 2.0
+
+def canonical_order(numbers):
+    """ 按原子序数稳定排序的原子顺序；不同运行的同一组成排序后元素序列一致，可直接比较 """
+    return np.argsort(np.asarray(numbers), kind="stable")
+
+def composition_key(numbers):
+    """ 与原子顺序无关的组成键，例如 [13, 5, 5] → "5:2,13:1" """
+    zs, counts = np.unique(np.asarray(numbers), return_counts=True)
+    return ",".join(f"{z}:{n}" for z, n in zip(zs.tolist(), counts.tolist()))
+
+
+class FingerprintStore:
+    """
+    主数据库中每个结构一行的指纹表：组成键 + 完整的距离指纹 + TOTEN，
+    以及 SQLite R*Tree 空间索引（组成编号、三个回转半径、平均原子间距离）。
+    查重时用一次 R*Tree 范围查询取出描述符都落在 cutoff 窗口内的候选（各维的窗口都是严格界，不会漏掉匹配），
+    再用指纹下界过滤，剩下的少量候选交给 RMSD 确认；候选数只取决于描述符空间中查询点附近的结构数，
+    与数据库中其他组成、其他形状的结构数无关。
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.connection.execute(f"""CREATE TABLE IF NOT EXISTS main.{FINGERPRINT_TABLE} (
+            id INTEGER PRIMARY KEY,
+            composition TEXT,
+            natoms INTEGER,
+            mean_distance REAL,
+            toten REAL,
+            fingerprint BLOB)""")
+        # 旧版本按 (composition, mean_distance) 建的索引窗口太宽，已由 R*Tree 取代
+        self.connection.execute(f"DROP INDEX IF EXISTS main.{FINGERPRINT_TABLE}_lookup")
+        self.connection.execute(f"""CREATE TABLE IF NOT EXISTS main.{COMPOSITION_TABLE} (
+            code INTEGER PRIMARY KEY,
+            composition TEXT UNIQUE)""")
+        self.connection.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS main.{FINGERPRINT_INDEX} USING rtree("
+            f"id, code_lo, code_hi, r1_lo, r1_hi, r2_lo, r2_hi, r3_lo, r3_hi, mean_lo, mean_hi)")
+
+    def _code(self, composition, create=False):
+        """ 组成键 → 整数编号（R*Tree 只能索引数值）；没有该组成且 create=False 时返回 None """
+        row = self.connection.execute(
+            f"SELECT code FROM main.{COMPOSITION_TABLE} WHERE composition=?", (composition,)).fetchone()
+        if row is not None or not create:
+            return row and row[0]
+        return self.connection.execute(
+            f"INSERT INTO main.{COMPOSITION_TABLE} (composition) VALUES (?)", (composition,)).lastrowid
+
+    def put(self, db_id, numbers, fp, shape, toten):
+        """ fp: distance_fingerprint，shape: shape_descriptor """
+        fp = np.ascontiguousarray(fp, dtype=np.float64)
+        composition = composition_key(numbers)
+        mean = float(fp.mean()) if len(fp) else 0.0
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO main.{FINGERPRINT_TABLE} VALUES (?, ?, ?, ?, ?, ?)",
+            (db_id, composition, len(numbers), mean, toten, fp.tobytes()))
+        code = self._code(composition, create=True)
+        r1, r2, r3 = (float(v) for v in shape)
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO main.{FINGERPRINT_INDEX} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (db_id, code, code, r1, r1, r2, r2, r3, r3, mean, mean))
+
+    def delete(self, ids):
+        ids = [int(i) for i in ids]
+        if ids:
+            for table in (FINGERPRINT_TABLE, FINGERPRINT_INDEX):
+                self.connection.execute(
+                    f"DELETE FROM main.{table} WHERE id IN ({', '.join('?' * len(ids))})", ids)
+
+    def prune(self):
+        """ 删除 systems 中已经不存在的行的指纹 """
+        for table in (FINGERPRINT_TABLE, FINGERPRINT_INDEX):
+            self.connection.execute(f"DELETE FROM main.{table} WHERE id NOT IN (SELECT id FROM main.systems)")
+
+    def candidates(self, numbers, fp, shape, rmsd_cutoff):
+        """ 返回 [(id, toten)]：组成相同、描述符在窗口内且距离指纹下界 < rmsd_cutoff 的已有结构 """
+        code = self._code(composition_key(numbers))
+        if code is None:
+            return []
+        mean = float(fp.mean()) if len(fp) else 0.0
+        # R*Tree 以 32 位浮点保存（向外取整），窗口再留一点余量
+        r = SHAPE_WINDOW * rmsd_cutoff + 1e-6
+        m = MEAN_DISTANCE_WINDOW * rmsd_cutoff + 1e-6
+        (r1, r2, r3) = (float(v) for v in shape)
+        rows = self.connection.execute(
+            f"SELECT f.id, f.toten, f.fingerprint FROM main.{FINGERPRINT_INDEX} i "
+            f"JOIN main.{FINGERPRINT_TABLE} f ON f.id = i.id "
+            f"WHERE i.code_lo >= ? AND i.code_hi <= ? "
+            f"AND i.r1_hi >= ? AND i.r1_lo <= ? AND i.r2_hi >= ? AND i.r2_lo <= ? "
+            f"AND i.r3_hi >= ? AND i.r3_lo <= ? AND i.mean_hi >= ? AND i.mean_lo <= ? ORDER BY f.id",
+            (code, code, r1 - r, r1 + r, r2 - r, r2 + r, r3 - r, r3 + r, mean - m, mean + m)).fetchall()
+        if not rows:
+            return []
+        fps = np.array([np.frombuffer(row[2], dtype=np.float64) for row in rows]).reshape(len(rows), len(fp))
+        lower = np.linalg.norm(fps - fp, axis=1) * rmsd_lower_bound_factor(len(numbers), per_atom=True)
+        return [(rows[k][0], rows[k][1]) for k in np.nonzero(lower < rmsd_cutoff + 1e-9)[0]]
@@ -0,0 +1,206 @@
+import os
+import csv
+import json
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource，RSS 记为 None
+    resource = None
+
+# 每条记录: (stage, item, group, wall, cpu, rss_peak_mb, pid)
+FIELDS = ["stage", "item", "group", "wall", "cpu", "rss_peak_mb", "pid"]
+
+
+def peak_rss_mb():
+    """ 当前进程的峰值 RSS (MB)；Linux 上 ru_maxrss 单位为 KB，macOS 为字节 """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
+
+
+class Metrics:
+    """
+    各阶段的墙钟时间、CPU 时间和峰值 RSS。
+      - item:  结构（dmol.outmol 路径）或 search 目录
+      - group: 所属的 search 目录，用于按目录汇总
+
+        with metrics.stage("outmol_parse", item=dmol_path, group=search_dir):
+            parsed = parse_outmol(dmol_path)
+
+    工作进程中调用 buffer() 后，记录先缓存，由 drain() 随任务结果交给主进程 extend()。
+    主进程只保留汇总（按阶段 / search 目录 / 结构累计），逐条记录可流式写入 CSV（open_records），
+    百万级结构的运行也不会把所有记录留在内存中。
+    """
+
+    def __init__(self):
+        self._records_file = None
+        self.reset()
+
+    def reset(self):
+        """ 清空所有统计（同一进程中多次运行 dmol2db.main 时使用） """
+        self.close()
+        self._buffer = None        # 工作进程：待交给主进程的记录
+        self._groups = {}          # item -> group，供只知道 item 的阶段（例如数据库写入）归组
+        self._current = None       # 当前 (item, group)，嵌套阶段（例如点群）默认归到它下面
+        self._records_writer = None
+        self.stages = {}           # stage -> [次数, 墙钟, CPU, 单次最长, 峰值 RSS]
+        self.groups = {}           # group -> {stage: 墙钟}
+        self.items = {}            # item -> {stage: 墙钟}
+
+    def buffer(self):
+        self._buffer = []
+
+    def open_records(self, path):
+        """ 之后的每条记录都流式写入 CSV 文件（--metrics-records） """
+        self._records_file = open(path, "w", newline="", encoding="utf-8")
+        self._records_writer = csv.writer(self._records_file)
+        self._records_writer.writerow(FIELDS)
+
+    def close(self):
+        if self._records_file is not None:
+            self._records_file.close()
+            self._records_file = self._records_writer = None
+
+    @contextmanager
+    def context(self, item, group=None):
+        """ 只设置当前结构，不计时；其中的嵌套阶段记到该结构下 """
+        previous = self._current
+        self._current = (item, group if group is not None else self._groups.get(item))
+        try:
+            yield
+        finally:
+            self._current = previous
+
+    @contextmanager
+    def stage(self, name, item=None, group=None):
+        if item is None and self._current is not None:
+            item, group = self._current
+        with self.context(item, group):
+            t0, c0 = time.perf_counter(), time.process_time()
+            try:
+                yield
+            finally:
+                item, group = self._current
+                self.add(name, item, group, time.perf_counter() - t0, time.process_time() - c0)
+
+    def add(self, name, item, group, wall, cpu, rss=None, pid=None):
+        if group is None and item is not None:
+            group = self._groups.get(item)
+        record = (name, item, group, wall, cpu,
+                  peak_rss_mb() if rss is None else rss, os.getpid() if pid is None else pid)
+        if self._buffer is not None:
+            self._buffer.append(record)
+        else:
+            self._absorb(record)
+
+    def timed_iter(self, iterable, name, item=None):
+        """ 只累计迭代器自身（例如目录遍历）花的时间，循环体的时间不计入 """
+        wall = cpu = 0.0
+        iterator = iter(iterable)
+        while True:
+            t0, c0 = time.perf_counter(), time.process_time()
+            try:
+                value = next(iterator)
+            except StopIteration:
+                value = iterator
+            wall += time.perf_counter() - t0
+            cpu += time.process_time() - c0
+            if value is iterator:
+                break
+            yield value
+        self.add(name, item, None, wall, cpu)
+
+    def drain(self):
+        records, self._buffer = self._buffer, []
+        return records
+
+    def extend(self, records):
+        for record in records:
+            self._absorb(record)
+
+    def _absorb(self, record):
+        name, item, group, wall, cpu, rss, pid = record
+        if group is None and item is not None:
+            group = self._groups.get(item)
+        elif item is not None:
+            self._groups[item] = group
+        totals = self.stages.setdefault(name, [0, 0.0, 0.0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += wall
+        totals[2] += cpu
+        totals[3] = max(totals[3], wall)
+        if rss is not None:
+            totals[4] = max(totals[4], rss)
+        if group is not None:
+            by_stage = self.groups.setdefault(group, {})
+            by_stage[name] = by_stage.get(name, 0.0) + wall
+        if item is not None and item != group:
+            by_stage = self.items.setdefault(item, {})
+            by_stage[name] = by_stage.get(name, 0.0) + wall
+        if self._records_writer is not None:
+            self._records_writer.writerow((name, item, group, f"{wall:.6f}", f"{cpu:.6f}",
+                                           None if rss is None else f"{rss:.1f}", pid))
+
+    # ========== 汇总与输出 ==========
+    def stage_totals(self):
+        return {name: {"count": t[0], "wall": t[1], "cpu": t[2], "max_wall": t[3], "rss_peak_mb": t[4]}
+                for name, t in self.stages.items()}
+
+    @staticmethod
+    def _slowest(totals, top):
+        ranked = sorted(totals.items(), key=lambda kv: sum(kv[1].values()), reverse=True)[:top]
+        return [(key, sum(stages.values()), stages) for key, stages in ranked]
+
+    def slowest_groups(self, top=10):
+        return self._slowest(self.groups, top)
+
+    def slowest_items(self, top=10):
+        return self._slowest(self.items, top)
+
+    def summary_lines(self, top=10):
+        lines = ["⏱️ 各阶段耗时统计 (墙钟合计 / CPU 合计 / 次数 / 单次最长 / 峰值 RSS):"]
+        for name, t in sorted(self.stage_totals().items(), key=lambda kv: kv[1]["wall"], reverse=True):
+            lines.append(f"   {name:14s} {t['wall']:9.3f} s  {t['cpu']:9.3f} s  {t['count']:7d}  "
+                         f"{t['max_wall']:8.3f} s  {t['rss_peak_mb']:8.1f} MB")
+        for title, slow in (("最慢的 search 目录", self.slowest_groups(top)), ("最慢的结构", self.slowest_items(top))):
+            if not slow:
+                continue
+            lines.append(f"🐢 {title}:")
+            for key, wall, stages in slow:
+                detail = ", ".join(f"{s} {w:.3f}s" for s, w in sorted(stages.items(), key=lambda kv: -kv[1]))
+                lines.append(f"   {wall:8.3f} s  {key}  ({detail})")
+        return lines
+
+    def write_summary(self, path, top=100):
+        """ JSON 汇总：各阶段合计、每个 search 目录的分阶段耗时、最慢的 top 个结构 """
+        summary = {
+            "stages": self.stage_totals(),
+            "search_dirs": {group: stages for group, stages in self.groups.items()},
+            "slowest_structures": [{"item": key, "wall": wall, "stages": stages}
+                                   for key, wall, stages in self.slowest_items(top)],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=1)
+
+
+# 进程内的全局记录器（主进程和每个工作进程各一个）
+metrics = Metrics()
+
+
+@contextmanager
+def profiled(path):
+    """ --profile：对主进程做 cProfile，结束时写出 .prof 文件（可用 pstats / snakeviz 查看） """
+    if not path:
+        yield
+        return
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
@@ -0,0 +1,69 @@
+import json
+
+SEARCH_TABLE = "dmol2db_journal_search"
+STRUCTURE_TABLE = "dmol2db_journal_structures"
+
+
+class Journal:
+    """
+    一次 dmol2db 运行的进度日志，和结果保存在同一个数据库文件中（同一连接、同一事务提交），
+    运行被中断后用 --resume 从停下的地方继续：
+      - search 目录：聚类后选出的文件夹列表，以及其中所有结构是否都已处理完
+      - 结构：(search 目录, 序号) 已处理完，db_id 为写入的行（解析失败时为 NULL，续跑时不再重试）
+    只记录路径和状态，不读取输入文件（与增量模式的 Manifest 不同，不计算 sha256）。
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.connection.execute(f"""CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (
+            search_dir TEXT PRIMARY KEY,
+            folders TEXT,
+            done INTEGER DEFAULT 0)""")
+        self.connection.execute(f"""CREATE TABLE IF NOT EXISTS {STRUCTURE_TABLE} (
+            search_dir TEXT,
+            idx INTEGER,
+            db_id INTEGER,
+            PRIMARY KEY (search_dir, idx))""")
+
+    def clear(self):
+        """ 新的一次运行（非续跑）开始时清空上一次的进度 """
+        self.connection.execute(f"DELETE FROM {SEARCH_TABLE}")
+        self.connection.execute(f"DELETE FROM {STRUCTURE_TABLE}")
+
+    def progress(self):
+        """ (已完成的 search 目录数, 已完成的结构数) """
+        dirs = self.connection.execute(f"SELECT COUNT(*) FROM {SEARCH_TABLE} WHERE done=1").fetchone()[0]
+        structures = self.connection.execute(f"SELECT COUNT(*) FROM {STRUCTURE_TABLE}").fetchone()[0]
+        return dirs, structures
+
+    # ========== search 目录 ==========
+    def search_done(self, search_dir):
+        row = self.connection.execute(
+            f"SELECT done FROM {SEARCH_TABLE} WHERE search_dir=?", (search_dir,)).fetchone()
+        return row is not None and bool(row[0])
+
+    def folders(self, search_dir):
+        """ 已聚类过的 search 目录返回文件夹列表，否则返回 None """
+        row = self.connection.execute(
+            f"SELECT folders FROM {SEARCH_TABLE} WHERE search_dir=?", (search_dir,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0])
+
+    def record_folders(self, search_dir, folders):
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO {SEARCH_TABLE} (search_dir, folders, done) VALUES (?, ?, 0)",
+            (search_dir, json.dumps(folders)))
+
+    def finish_search(self, search_dir):
+        self.connection.execute(f"UPDATE {SEARCH_TABLE} SET done=1 WHERE search_dir=?", (search_dir,))
+
+    # ========== 结构 ==========
+    def finished_structures(self, search_dir):
+        """ 该 search 目录中已处理完的结构序号 """
+        return {row[0] for row in self.connection.execute(
+            f"SELECT idx FROM {STRUCTURE_TABLE} WHERE search_dir=?", (search_dir,))}
+
+    def record_structure(self, search_dir, index, db_id=None):
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO {STRUCTURE_TABLE} VALUES (?, ?, ?)", (search_dir, index, db_id))
@@ -0,0 +1,70 @@
+import os
+from lib.compressed import open_text, input_stat
+
+# 同一个 log.txt 的索引只建一次；文件大小或修改时间变化后自动重建
+_index_cache = {}
+_CACHE_SIZE = 16
+
+def _folder_from_line(line):
+    return line.split(":")[-1].strip()
+
+def build_log_index(log_path):
+    """
+    单次顺序扫描 log.txt，建立 pop -> 文件夹 的索引，规则与原先的两遍查找一致：
+      - replace: 取该 pop 最后一条 replace 行之前最近的 folder name（优先）
+      - init:    取第一条 "init {pop}" 行及其之后第一条 folder name
+    返回 (replace_map, init_map)
+    """
+    replace_map = {}
+    init_map = {}
+    pending_init = []   # 已出现 init 但还没等到 folder name 的 pop
+    last_folder = None
+
+    with open_text(log_path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("folder name"):
+                last_folder = _folder_from_line(line)
+                if pending_init:
+                    for pop in pending_init:
+                        init_map[pop] = last_folder
+                    pending_init = []
+            elif line.startswith("replace"):
+                parts = line.split()
+                if parts and parts[-1].isdigit() and last_folder is not None:
+                    replace_map[int(parts[-1])] = last_folder
+            elif line.startswith("init "):
+                value = line[5:]
+                # 与原先的 line == f"init {pop}" 完全匹配等价
+                if value.isdigit() and str(int(value)) == value:
+                    pop = int(value)
+                    if pop not in init_map:
+                        init_map[pop] = None
+                        pending_init.append(pop)
+
+    return replace_map, init_map
+
+def get_log_index(log_path):
+    """ 带缓存的 build_log_index，同一个 log.txt 多次调用只扫描一次 """
+    key = os.path.abspath(log_path)
+    st = input_stat(log_path)
+    signature = (st.st_size, st.st_mtime_ns)
+    cached = _index_cache.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    index = build_log_index(log_path)
+    _index_cache.pop(key, None)
+    if len(_index_cache) >= _CACHE_SIZE:
+        _index_cache.pop(next(iter(_index_cache)))
+    _index_cache[key] = (signature, index)
+    return index
+
+def lookup_folders(index, popnums):
+    replace_map, init_map = index
+    folders = []
+    for pop in popnums:
+        folder = replace_map.get(pop)
+        if folder is None:
+            folder = init_map.get(pop)
+        folders.append(folder)
+    return folders
@@ -0,0 +1,98 @@
+import json
+import hashlib
+from lib.compressed import open_binary, input_stat
+
+MANIFEST_TABLE = "dmol2db_manifest"
+
+def file_sha256(path, chunk_size=1 << 20):
+    # 对解压后的内容求哈希：文件被压缩后仍视为未变化
+    h = hashlib.sha256()
+    with open_binary(path) as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Manifest:
+    """
+    增量处理用的清单，和结果一起保存在同一个数据库文件中（同一连接、同一事务提交）。
+    每个输入文件记录 路径 / 大小 / 修改时间 / sha256，以及它产生的数据库行 id：
+      - recover.txt: extra 中保存该 search 目录聚类后选出的文件夹列表
+      - log.txt:     只用于判断是否变化
+      - dmol.outmol: db_id 为对应的 systems 行
+    判断是否变化时先比较大小和修改时间，不同时才计算 sha256。
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.connection.execute(f"""CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+            path TEXT PRIMARY KEY,
+            kind TEXT,
+            search_dir TEXT,
+            size INTEGER,
+            mtime_ns INTEGER,
+            sha256 TEXT,
+            db_id INTEGER,
+            extra TEXT)""")
+        self.connection.execute(
+            f"CREATE INDEX IF NOT EXISTS {MANIFEST_TABLE}_search_dir ON {MANIFEST_TABLE}(search_dir)")
+        self._signatures = {}
+
+    def get(self, path):
+        row = self.connection.execute(
+            f"SELECT size, mtime_ns, sha256, db_id, extra FROM {MANIFEST_TABLE} WHERE path=?", (path,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("size", "mtime_ns", "sha256", "db_id", "extra"), row))
+
+    def is_unchanged(self, path):
+        """ 与清单中的记录比较；计算出的签名暂存，供 record() 使用 """
+        st = input_stat(path)
+        entry = self.get(path)
+        if entry is not None and (entry["size"], entry["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+            self._signatures[path] = (st.st_size, st.st_mtime_ns, entry["sha256"])
+            return True
+        sha = file_sha256(path)
+        self._signatures[path] = (st.st_size, st.st_mtime_ns, sha)
+        if entry is not None and entry["sha256"] == sha:
+            # 内容未变（例如被 touch 过），只更新时间戳
+            self.connection.execute(
+                f"UPDATE {MANIFEST_TABLE} SET size=?, mtime_ns=? WHERE path=?",
+                (st.st_size, st.st_mtime_ns, path))
+            return True
+        return False
+
+    def record(self, path, kind, search_dir, db_id=None, extra=None):
+        signature = self._signatures.pop(path, None)
+        if signature is None:
+            st = input_stat(path)
+            signature = (st.st_size, st.st_mtime_ns, file_sha256(path))
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO {MANIFEST_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, kind, search_dir) + signature + (db_id, extra))
+
+    # ========== search 目录 ==========
+    def cached_folders(self, search_dir, recover, log_txt):
+        """ recover.txt 和 log.txt 都没变时返回上次的文件夹列表，否则返回 None """
+        recover_unchanged = self.is_unchanged(recover)
+        log_unchanged = self.is_unchanged(log_txt)
+        if not (recover_unchanged and log_unchanged):
+            return None
+        entry = self.get(recover)
+        if entry is None or entry["extra"] is None:
+            return None
+        return json.loads(entry["extra"])
+
+    def record_search_dir(self, search_dir, recover, log_txt, folders):
+        self.record(recover, "recover", search_dir, extra=json.dumps(folders))
+        self.record(log_txt, "log", search_dir)
+
+    def forget_search_dir(self, search_dir):
+        """ 删除 search 目录下所有 outmol 记录，返回它们对应的数据库行 id """
+        ids = [row[0] for row in self.connection.execute(
+            f"SELECT db_id FROM {MANIFEST_TABLE} WHERE search_dir=? AND kind='outmol' AND db_id IS NOT NULL",
+            (search_dir,))]
+        self.connection.execute(
+            f"DELETE FROM {MANIFEST_TABLE} WHERE search_dir=? AND kind='outmol'", (search_dir,))
+        return ids
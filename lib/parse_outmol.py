@@ -0,0 +1,259 @@
+import os
+import re
+import mmap
+from lib.compressed import open_text, resolve_input, strip_compression_suffix
+
+HARTREE_TO_EV = 27.212
+AU_FORCE_TO_EV_ANG = 51.422067  # 1 au = 51.422067 eV/Å
+
+OPT_SECTION_MARKER = "            Total Energy           Binding E       Cnvgnce     Time   Iter"
+EIGENVALUE_MARKER = "state                         eigenvalue        occupation"
+FINAL_COORDS_MARKER = "Final Coordinates (Angstroms)"
+INPUT_COORDS_MARKER = "Input Coordinates (Angstroms)"
+GEO_OPT_MARKER = "** GEOMETRY OPTIMIZATION IN DELOCALIZED COORDINATES **"
+HOMO_MARKER = "Energy of Highest Occupied Molecular Orbital"
+LUMO_MARKER = "Energy of Lowest Unoccupied Molecular Orbital"
+
+HOMO_RE = re.compile(r"Energy of Highest Occupied Molecular Orbital:\s*(-?\d+\.\d+)")
+LUMO_RE = re.compile(r"Energy of Lowest Unoccupied Molecular Orbital:\s*(-?\d+\.\d+)")
+FORCE_RE = re.compile(r"\|\s*\|F\|max\s*\|\s*(-?\d+\.\d+E?-?\d*)")
+
+
+class ParsedOutmol:
+    """ 一次读取 dmol.outmol 得到的全部结果，供参数提取和 DOS 共用 """
+
+    def __init__(self, path):
+        self.path = path
+        self.has_opt_section = False   # 是否找到几何优化 (Total Energy ... Iter) 部分
+        self.parameters = {}           # HOMO_DFT / LUMO_DFT / GAP_DFT / TOTEN / Max_Force
+        self.final_species = []        # 最后一次优化后的 Final Coordinates
+        self.final_positions = []
+        self.input_species = []        # 最后一个 GEOMETRY OPTIMIZATION 段的 Input Coordinates（从末尾读取时只在没有 Final Coordinates 时填写）
+        self.input_positions = []
+        self.eigenvalues = []          # 最后一张能级表 (eV)
+        self.occupations = []
+        self.force_history = []        # 每一步的 |F|max (eV/Å)；从文件末尾读取时只有最后一个优化段
+        self.energy_history = []       # 每一步 opt== 的能量 (eV)；同上
+
+    @property
+    def atom_species(self):
+        return self.final_species or self.input_species
+
+    @property
+    def atom_positions(self):
+        return self.final_positions if self.final_species else self.input_positions
+
+
+def fix_scientific_notation(value_str):
+    """ 处理科学计数法格式，确保转换为浮点数 """
+    try:
+        return float(value_str.replace('E', 'e'))  # 兼容 'E' → 'e'
+    except ValueError:
+        return None  # 解析失败返回 None
+
+
+def _read_coordinate_block(lines):
+    """ 读取坐标块：跳过两行表头，直到 ------ 结束 """
+    species, positions = [], []
+    next(lines, None)
+    next(lines, None)
+    for line in lines:
+        if line.strip().startswith("------"):
+            break
+        atom_data = line.split()
+        if len(atom_data) >= 5:
+            species.append(atom_data[1])
+            x, y, z = map(float, atom_data[2:5])
+            positions.append([x, y, z])
+    return species, positions
+
+
+def _read_eigenvalue_block(lines):
+    """ 读取能级表：跳过两行表头，直到空行结束 """
+    eigenvalues, occupations = [], []
+    next(lines, None)
+    next(lines, None)
+    for line in lines:
+        if line.strip() == "":
+            break
+        parts = line.split()
+        if len(parts) >= 7:
+            try:
+                eigenvalue_ev = float(parts[5])
+                occupation = float(parts[6])
+            except ValueError:
+                continue
+            eigenvalues.append(eigenvalue_ev)
+            occupations.append(occupation)
+    return eigenvalues, occupations
+
+
+def parse_lines(lines, path=None):
+    """ 单次顺序扫描 outmol 的所有行，结果与原先多次正反向查找一致 """
+    result = ParsedOutmol(path)
+    lines = iter(lines)
+
+    # 以下变量只记录最后一个优化段 (Total Energy ... Iter 之后) 的结果
+    homo = lumo = max_force = None
+    toten = None
+    geo_opt_seen = False
+
+    for line in lines:
+        if OPT_SECTION_MARKER in line:
+            result.has_opt_section = True
+            homo = lumo = max_force = None
+            result.final_species, result.final_positions = [], []
+            continue
+
+        if "opt==" in line:  # 识别优化行
+            parts = line.split()
+            if len(parts) >= 3:
+                try:
+                    toten = float(parts[2]) * HARTREE_TO_EV  # **Ha → eV**
+                    result.energy_history.append(toten)
+                except ValueError:
+                    pass
+            continue
+
+        if "|F|max" in line:
+            match = FORCE_RE.search(line)
+            if match:
+                force = fix_scientific_notation(match.group(1))  # 处理科学计数法
+                if force is not None:
+                    max_force = force * AU_FORCE_TO_EV_ANG
+                    result.force_history.append(max_force)
+            continue
+
+        if HOMO_MARKER in line:
+            match = HOMO_RE.search(line)
+            if match:
+                homo = float(match.group(1)) * HARTREE_TO_EV
+        elif LUMO_MARKER in line:
+            match = LUMO_RE.search(line)
+            if match:
+                lumo = float(match.group(1)) * HARTREE_TO_EV
+        elif EIGENVALUE_MARKER in line:
+            result.eigenvalues, result.occupations = _read_eigenvalue_block(lines)
+        elif FINAL_COORDS_MARKER in line:
+            result.final_species, result.final_positions = _read_coordinate_block(lines)
+        elif GEO_OPT_MARKER in line:
+            geo_opt_seen = True
+            result.input_species, result.input_positions = [], []
+        elif INPUT_COORDS_MARKER in line and geo_opt_seen:
+            result.input_species, result.input_positions = _read_coordinate_block(lines)
+
+    if not result.has_opt_section:
+        return result
+
+    parameters = result.parameters
+    if homo is not None:
+        parameters['HOMO_DFT'] = homo
+    if lumo is not None:
+        parameters['LUMO_DFT'] = lumo
+    if homo is not None and lumo is not None:
+        parameters['GAP_DFT'] = lumo - homo
+    if toten is not None:
+        parameters['TOTEN'] = toten
+    if max_force is not None:
+        parameters['Max_Force'] = max_force
+    return result
+
+
+# ========== 从文件末尾读取：只解码最后一个优化段及少量需要回溯的位置 ==========
+SEARCH_BLOCK = 4 << 20  # 向前查找标记时每块的字节数，查找过的页随即释放
+
+
+def _release(mm, start, end):
+    """ 释放已查找过的映射页，文件再大 RSS 也不增长 """
+    if hasattr(mmap, "MADV_DONTNEED") and end > start:
+        start -= start % mmap.PAGESIZE
+        mm.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+def _rfind(mm, marker, start, end):
+    """ 在 [start, end) 中从后向前逐块查找 marker 最后一次出现的位置，找不到返回 -1 """
+    pos = end
+    while pos > start:
+        lo = max(start, pos - SEARCH_BLOCK)
+        # 与后一块重叠 len(marker) - 1 字节，跨块的标记也能找到
+        hit = mm.rfind(marker, lo, min(end, pos + len(marker) - 1))
+        _release(mm, lo, pos)
+        if hit >= 0:
+            return hit
+        pos = lo
+    return -1
+
+def _lines_from(mm, pos, end=None):
+    """ 从 pos 所在行的行首开始逐行解码到 end """
+    end = len(mm) if end is None else end
+    pos = mm.rfind(b"\n", 0, pos) + 1
+    while pos < end:
+        stop = mm.find(b"\n", pos, end)
+        stop = end if stop < 0 else stop + 1
+        yield mm[pos:stop].decode("utf-8", "replace")
+        pos = stop
+
+def _block_after(mm, pos, read_block):
+    lines = _lines_from(mm, pos)
+    next(lines, None)  # 标记所在行
+    return read_block(lines)
+
+def _last_total_energy(mm, end):
+    """ 与顺序扫描相同：最后一个能解析的 opt== 行 """
+    while True:
+        end = _rfind(mm, b"opt==", 0, end)
+        if end < 0:
+            return None
+        parts = next(_lines_from(mm, end)).split()
+        if len(parts) >= 3:
+            try:
+                return float(parts[2]) * HARTREE_TO_EV
+            except ValueError:
+                pass
+
+def parse_mapped(mm, path=None):
+    """
+    从映射的 outmol 末尾开始查找：只解码最后一个 Total Energy ... Iter 段（HOMO/LUMO、|F|max、
+    opt==、能级表和 Final Coordinates 都在其中），段内缺少的 TOTEN 和能级表再分块向前查找；
+    Input Coordinates 只在没有 Final Coordinates 时才查找（在整个文件的最后一个 GEOMETRY OPTIMIZATION 标记之后，
+    可能在最后一个优化段之后，例如作业被中断时）。结果与 parse_lines 一致。
+    没有优化段时返回 None（交给 parse_lines 顺序扫描）。
+    """
+    last_section = _rfind(mm, OPT_SECTION_MARKER.encode(), 0, len(mm))
+    if last_section < 0:
+        return None
+    result = parse_lines(_lines_from(mm, last_section), path)
+
+    if "TOTEN" not in result.parameters:
+        toten = _last_total_energy(mm, last_section)
+        if toten is not None:
+            result.parameters["TOTEN"] = toten
+    if not result.eigenvalues:
+        pos = _rfind(mm, EIGENVALUE_MARKER.encode(), 0, last_section)
+        if pos >= 0:
+            result.eigenvalues, result.occupations = _block_after(mm, pos, _read_eigenvalue_block)
+    if not result.final_species:
+        # 顺序扫描时：每个 GEOMETRY OPTIMIZATION 标记清空 Input Coordinates，取最后一个标记之后的最后一个坐标块。
+        # 段内的 parse_lines 看不到段前的标记，这里对整个文件重新确定
+        result.input_species, result.input_positions = [], []
+        geo = _rfind(mm, GEO_OPT_MARKER.encode(), 0, len(mm))
+        if geo >= 0:
+            pos = _rfind(mm, INPUT_COORDS_MARKER.encode(), geo, len(mm))
+            if pos >= 0:
+                result.input_species, result.input_positions = _block_after(mm, pos, _read_coordinate_block)
+    return result
+
+
+def parse_outmol(dmol_outmol_path):
+    """
+    解析 dmol.outmol（或同名的 .gz / .xz / .zst / .bz2），返回 ParsedOutmol。
+    未压缩的文件用 mmap 从末尾读取，只解码需要的字节范围，内存占用与文件大小无关；
+    压缩文件或没有优化段的文件顺序扫描一次。
+    """
+    actual = resolve_input(dmol_outmol_path)
+    if actual is not None and strip_compression_suffix(actual) == actual and os.path.getsize(actual) > 0:
+        with open(actual, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            result = parse_mapped(mm, dmol_outmol_path)
+        if result is not None:
+            return result
+    with open_text(dmol_outmol_path) as f:
+        return parse_lines(f, dmol_outmol_path)
@@ -0,0 +1,299 @@
+import json
+import sqlite3
+
+PROPERTY_TABLE = "system_properties"
+
+# 物化表的列：ASE 的 EAV 表 (number_key_values / text_key_values) 按 id 展开为一行
+NUMERIC_KEYS = ("GAP_DFT", "HOMO_DFT", "LUMO_DFT", "TOTEN", "Max_Force")
+TEXT_KEYS = {"filename": "filename", "composition": "Composition", "point_group": "Point_Group",
+             "calculator": "Calculator", "functional": "Functional"}
+NUMERIC_COLUMNS = ("natoms", "nelements") + NUMERIC_KEYS
+TEXT_COLUMNS = tuple(TEXT_KEYS)
+COLUMNS = ("id",) + NUMERIC_COLUMNS + TEXT_COLUMNS
+# 单列索引（id 是 rowid，自动包含在每个索引中），用于范围过滤和排序
+INDEXED_COLUMNS = NUMERIC_COLUMNS + ("composition", "point_group")
+
+# ASE 表上的覆盖索引：按键 / 元素过滤时只读索引，不回表
+COVERING_INDEXES = {
+    "number_key_values_key_value_id": "number_key_values(key, value, id)",
+    "text_key_values_key_value_id": "text_key_values(key, value, id)",
+    "species_Z_id": "species(Z, id)",
+}
+
+MAX_LIMIT = 1000
+
+
+def composition_label(symbols):
+    """ 元素集合 → 与 extract_parameters 相同的 Composition 字符串，例如 ["B", "Al", "B"] → "Al, B" """
+    return ", ".join(sorted(set(symbols)))
+
+def _atomic_numbers(symbols):
+    from ase.data import atomic_numbers  # 只有按元素过滤时才需要 ase
+
+    try:
+        return sorted({atomic_numbers[s] for s in symbols})
+    except KeyError as e:
+        raise ValueError(f"未知元素: {e.args[0]}") from None
+
+def _has_table(conn, table, schema="main"):
+    return conn.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE type='table' AND name=?", (table,)).fetchone() is not None
+
+
+class PropertyIndex:
+    """
+    每个结构一行的物化属性表（以 systems.id 为键），和 ASE 表放在同一个数据库文件中，
+    由 DBWriter（逐条写入）、tool_merge_db（整库 INSERT … SELECT）和点群补算维护。
+    查询走这张表及其单列索引，不再在 EAV 表上做多次自连接。
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        numeric = ", ".join(f"{c} REAL" if c in NUMERIC_KEYS else f"{c} INTEGER" for c in NUMERIC_COLUMNS)
+        text = ", ".join(f"{c} TEXT" for c in TEXT_COLUMNS)
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS main.{PROPERTY_TABLE} (id INTEGER PRIMARY KEY, {numeric}, {text})")
+        for column in INDEXED_COLUMNS:
+            self.connection.execute(
+                f"CREATE INDEX IF NOT EXISTS main.{PROPERTY_TABLE}_{column} ON {PROPERTY_TABLE}({column})")
+
+    def ensure_covering_indexes(self):
+        """ 在 ASE 表上建立覆盖索引（ASE 表在第一次写入时才创建，不存在时跳过） """
+        if not _has_table(self.connection, "systems"):
+            return False
+        for name, target in COVERING_INDEXES.items():
+            self.connection.execute(f"CREATE INDEX IF NOT EXISTS main.{name} ON {target}")
+        return True
+
+    def put(self, db_id, parameters, symbols):
+        """ 写入一行（DBWriter 写入 ASE 行后、同一事务中调用） """
+        values = [db_id, len(symbols), len(set(symbols))]
+        values += [parameters.get(k) for k in NUMERIC_KEYS]
+        values += [parameters.get(k) for k in TEXT_KEYS.values()]
+        if values[COLUMNS.index("composition")] is None:
+            values[COLUMNS.index("composition")] = composition_label(symbols)
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO main.{PROPERTY_TABLE} ({', '.join(COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(COLUMNS))})", values)
+
+    def set_point_group(self, db_id, point_group):
+        self.connection.execute(f"UPDATE main.{PROPERTY_TABLE} SET point_group=? WHERE id=?", (point_group, db_id))
+
+    def delete(self, ids):
+        ids = [int(i) for i in ids]
+        if ids:
+            self.connection.execute(
+                f"DELETE FROM main.{PROPERTY_TABLE} WHERE id IN ({', '.join('?' * len(ids))})", ids)
+
+    def rebuild(self, schema="main", offset=0):
+        """
+        从 schema 中的 ASE 表整体重建（INSERT … SELECT，每张 EAV 表只扫描一次），id 平移 offset；
+        schema 为 ATTACH 的结果数据库时用于合并。返回写入的行数。
+        """
+        if not _has_table(self.connection, "systems", schema):
+            return 0
+        numeric = ", ".join(f"MAX(CASE WHEN key='{k}' THEN value END) AS {k}" for k in NUMERIC_KEYS)
+        text = ", ".join(f"MAX(CASE WHEN key='{k}' THEN value END) AS {c}" for c, k in TEXT_KEYS.items())
+        columns = [f"n.{c}" for c in NUMERIC_KEYS] + [f"t.{c}" for c in TEXT_COLUMNS]
+        cur = self.connection.execute(
+            f"INSERT OR REPLACE INTO main.{PROPERTY_TABLE} ({', '.join(COLUMNS)}) "
+            f"SELECT s.id + ?, s.natoms, e.nelements, {', '.join(columns)} "
+            f"FROM {schema}.systems s "
+            f"LEFT JOIN (SELECT id, COUNT(*) AS nelements FROM {schema}.species GROUP BY id) e ON e.id = s.id "
+            f"LEFT JOIN (SELECT id, {numeric} FROM {schema}.number_key_values GROUP BY id) n ON n.id = s.id "
+            f"LEFT JOIN (SELECT id, {text} FROM {schema}.text_key_values GROUP BY id) t ON t.id = s.id",
+            (offset,))
+        return cur.rowcount
+
+    def is_stale(self):
+        """ 物化表行数与 systems 不一致（例如旧数据库或被其它工具改写过） """
+        if not _has_table(self.connection, "systems"):
+            return False
+        systems = self.connection.execute("SELECT COUNT(*) FROM systems").fetchone()[0]
+        rows = self.connection.execute(f"SELECT COUNT(*) FROM main.{PROPERTY_TABLE}").fetchone()[0]
+        return systems != rows
+
+
+def build_index(db_path, rebuild=False):
+    """ 为已有数据库建立覆盖索引和物化表；表已是最新时只补建索引。返回重建的行数 """
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            index = PropertyIndex(conn)
+            index.ensure_covering_indexes()
+            if not (rebuild or index.is_stale()):
+                return 0
+            conn.execute(f"DELETE FROM {PROPERTY_TABLE}")
+            rows = index.rebuild()
+        conn.execute("ANALYZE")
+        return rows
+    finally:
+        conn.close()
+
+
+class Page:
+    """ 一页查询结果；next_cursor 传给下一次 search(after=...) 得到下一页，为 None 时已到末尾 """
+
+    def __init__(self, rows, next_cursor):
+        self.rows = rows
+        self.next_cursor = next_cursor
+
+    def to_dict(self):
+        return {"rows": self.rows, "next_cursor": self.next_cursor}
+
+
+def _where(ranges=None, point_group=None, contains=None, exact=None):
+    clauses, params = [], []
+    for column, bounds in (ranges or {}).items():
+        if column not in NUMERIC_COLUMNS:
+            raise ValueError(f"不支持范围过滤的列: {column}（可用: {', '.join(NUMERIC_COLUMNS)}）")
+        lo, hi = bounds
+        if lo is not None:
+            clauses.append(f"{column} >= ?")
+            params.append(float(lo))
+        if hi is not None:
+            clauses.append(f"{column} <= ?")
+            params.append(float(hi))
+    if point_group is not None:
+        clauses.append("point_group = ?")
+        params.append(point_group)
+    if exact:
+        # 元素集合完全相同：Composition 即排序后的元素列表，走 composition 索引
+        _atomic_numbers(exact)
+        clauses.append("composition = ?")
+        params.append(composition_label(exact))
+    if contains:
+        numbers = _atomic_numbers(contains)
+        clauses.append(
+            f"id IN (SELECT id FROM species WHERE Z IN ({', '.join('?' * len(numbers))}) "
+            f"GROUP BY id HAVING COUNT(*) = ?)")
+        params += numbers + [len(numbers)]
+    return clauses, params
+
+
+class SearchResult:
+    """ 逐行读取的查询结果（大页流式输出用）；迭代结束后 next_cursor 才有值 """
+
+    def __init__(self, cursor, limit, order_by):
+        self._cursor = cursor
+        self.limit = limit
+        self.order_by = order_by
+        self.next_cursor = None
+
+    def __iter__(self):
+        last = None
+        for i, values in enumerate(self._cursor):
+            if i == self.limit:
+                # 多取的一行只用来判断是否还有下一页
+                self.next_cursor = [last["id"]] if self.order_by == "id" else [last[self.order_by], last["id"]]
+                break
+            last = dict(zip(COLUMNS, values))
+            yield last
+
+def iter_search(conn, ranges=None, point_group=None, contains=None, exact=None,
+                order_by="id", descending=False, limit=50, after=None, max_limit=MAX_LIMIT):
+    """ 与 search 相同，但返回逐行读取的 SearchResult；max_limit 为每页行数上限 """
+    if order_by not in COLUMNS:
+        raise ValueError(f"不支持的排序列: {order_by}")
+    limit = max(1, min(int(limit), max_limit))
+    clauses, params = _where(ranges, point_group, contains, exact)
+
+    direction = "DESC" if descending else "ASC"
+    compare = "<" if descending else ">"
+    if order_by == "id":
+        order = f"id {direction}"
+        if after is not None:
+            clauses.append(f"id {compare} ?")
+            params.append(int(after[-1]))
+    else:
+        order = f"{order_by} {direction}, id {direction}"
+        clauses.append(f"{order_by} IS NOT NULL")
+        if after is not None:
+            clauses.append(f"({order_by}, id) {compare} (?, ?)")
+            params += [after[0], int(after[1])]
+
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    cur = conn.execute(
+        f"SELECT {', '.join(COLUMNS)} FROM {PROPERTY_TABLE}{where} ORDER BY {order} LIMIT ?",
+        params + [limit + 1])
+    return SearchResult(cur, limit, order_by)
+
+def search(conn, ranges=None, point_group=None, contains=None, exact=None,
+           order_by="id", descending=False, limit=50, after=None):
+    """
+    分页查询物化属性表：
+      - ranges: {列: (下限, 上限)}，None 表示不限，例如 {"GAP_DFT": (1.0, None)}
+      - point_group: 点群，例如 "D3h"
+      - contains: 必须包含的元素，例如 ["Al", "B"]；exact: 元素集合完全相同
+      - order_by / descending: 排序列（NUMERIC_COLUMNS、TEXT_COLUMNS 或 id）；按某列排序时跳过该列为空的行
+      - limit: 每页行数（最多 MAX_LIMIT）；after: 上一页的 next_cursor（按 (排序列, id) 续读，深翻页同样走索引）
+    返回 Page，rows 为 {列: 值} 字典
+    """
+    result = iter_search(conn, ranges, point_group, contains, exact, order_by, descending, limit, after)
+    rows = list(result)
+    return Page(rows, result.next_cursor)
+
+def count(conn, ranges=None, point_group=None, contains=None, exact=None):
+    """ 满足过滤条件的结构数 """
+    clauses, params = _where(ranges, point_group, contains, exact)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    return conn.execute(f"SELECT COUNT(*) FROM {PROPERTY_TABLE}{where}", params).fetchone()[0]
+
+def connect_readonly(db_path):
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+
+def parse_range(text):
+    """ "GAP_DFT=1.0:3.5"、"TOTEN=:-100"（左侧或右侧留空表示不限） → (列, (下限, 上限)) """
+    column, _, bounds = text.partition("=")
+    lo, sep, hi = bounds.partition(":")
+    if not sep:
+        raise ValueError(f"范围格式应为 列=下限:上限，例如 GAP_DFT=1.0:3.5: {text}")
+    return column, (float(lo) if lo else None, float(hi) if hi else None)
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="按属性和组成查询 DATABASE.db")
+    parser.add_argument("db", help="数据库文件")
+    parser.add_argument("--build-index", action="store_true",
+                        help="建立覆盖索引和物化属性表（已有数据库第一次查询前运行一次）")
+    parser.add_argument("--rebuild", action="store_true", help="与 --build-index 一起使用：强制重建物化表")
+    parser.add_argument("--range", action="append", default=[], metavar="COL=LO:HI",
+                        help=f"数值范围过滤，可多次指定（列: {', '.join(NUMERIC_COLUMNS)}）")
+    parser.add_argument("--point-group", help="点群，例如 D3h")
+    parser.add_argument("--contains", nargs="+", metavar="EL", help="包含这些元素")
+    parser.add_argument("--exact", nargs="+", metavar="EL", help="元素集合完全相同")
+    parser.add_argument("--sort", default="id", help="排序列，默认 id")
+    parser.add_argument("--desc", action="store_true", help="降序")
+    parser.add_argument("--limit", type=int, default=50, help=f"每页行数，默认 50，最多 {MAX_LIMIT}")
+    parser.add_argument("--after", help="上一页输出的 next_cursor（JSON）")
+    parser.add_argument("--count", action="store_true", help="只输出满足条件的结构数")
+    args = parser.parse_args(argv)
+
+    if args.build_index:
+        rows = build_index(args.db, rebuild=args.rebuild)
+        print(f"✅ 索引已就绪，物化表重建 {rows} 行")
+        return
+
+    try:
+        ranges = dict(parse_range(r) for r in args.range)
+    except ValueError as e:
+        parser.error(str(e))
+    conn = connect_readonly(args.db)
+    try:
+        if not _has_table(conn, PROPERTY_TABLE):
+            print(f"❌ {args.db} 还没有物化属性表，请先运行 --build-index")
+            return
+        filters = dict(ranges=ranges, point_group=args.point_group, contains=args.contains, exact=args.exact)
+        try:
+            if args.count:
+                print(count(conn, **filters))
+                return
+            page = search(conn, order_by=args.sort, descending=args.desc, limit=args.limit,
+                          after=json.loads(args.after) if args.after else None, **filters)
+        except ValueError as e:
+            parser.error(str(e))
+        print(json.dumps(page.to_dict(), ensure_ascii=False, indent=1))
+    finally:
+        conn.close()
@@ -0,0 +1,145 @@
+import os
+from array import array
+import numpy as np
+from lib.compressed import open_text, input_stat
+
+CACHE_SUFFIX = ".npz"
+
+
+class PopulationStore:
+    """
+    recover.txt 中所有种群结构的紧凑存储：
+      popnums (P,) int64, energies (P,) float64, offsets (P+1,) int64,
+      species_codes (M,) int16 -> species_table, coords (M, 3) float64
+    第 k 个结构的原子为 offsets[k]:offsets[k+1]。
+    可按下标或迭代得到与 parse_recover_file 原返回值相同的 (pop_num, energy, species, positions)。
+    """
+
+    def __init__(self, popnums, energies, offsets, species_codes, coords, species_table):
+        self.popnums = popnums
+        self.energies = energies
+        self.offsets = offsets
+        self.species_codes = species_codes
+        self.coords = coords
+        self.species_table = [str(s) for s in species_table]
+
+    def __len__(self):
+        return len(self.popnums)
+
+    def species(self, k):
+        table = self.species_table
+        return [table[c] for c in self.species_codes[self.offsets[k]:self.offsets[k + 1]]]
+
+    def positions(self, k):
+        return self.coords[self.offsets[k]:self.offsets[k + 1]]
+
+    def __getitem__(self, k):
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError(k)
+        return int(self.popnums[k]), float(self.energies[k]), self.species(k), self.positions(k)
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+
+    def save(self, path, signature=(0, 0)):
+        # np.savez 会自动补 .npz 后缀，用文件对象保证路径不变
+        with open(path, "wb") as f:
+            np.savez(f, popnums=self.popnums, energies=self.energies, offsets=self.offsets,
+                     species_codes=self.species_codes, coords=self.coords,
+                     species_table=np.array(self.species_table, dtype=str),
+                     signature=np.array(signature, dtype=np.int64))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            store = cls(data["popnums"], data["energies"], data["offsets"],
+                        data["species_codes"], data["coords"], data["species_table"])
+            store.signature = tuple(int(x) for x in data["signature"])
+        return store
+
+
+def parse_recover_lines(lines):
+    """ 流式解析 recover.txt，规则与原先的 readlines 版本一致 """
+    popnums, energies, offsets = array("q"), array("d"), array("q", [0])
+    species_codes, coords = array("h"), array("d")
+    table = {}
+
+    pop_num = None
+    expect_energy = False
+    in_block = False
+    natoms = 0
+
+    for line in lines:
+        if expect_energy:
+            # pop 行之后紧跟的一行是能量
+            energies.append(float(line.strip().split()[0]))
+            popnums.append(pop_num)
+            expect_energy = False
+            in_block = True
+            continue
+        if line.startswith("pop"):
+            if in_block:
+                offsets.append(natoms)
+            pop_num = int(line.strip().split()[1])
+            expect_energy = True
+            in_block = False
+            continue
+        if not in_block:
+            continue
+        if not line.strip():
+            offsets.append(natoms)
+            in_block = False
+            continue
+        parts = line.split()
+        if len(parts) >= 4:
+            x, y, z = (float(v) for v in parts[1:4])
+            code = table.setdefault(parts[0], len(table))
+            species_codes.append(code)
+            coords.extend((x, y, z))
+            natoms += 1
+
+    if in_block:
+        offsets.append(natoms)
+
+    species_table = sorted(table, key=table.get)
+    return PopulationStore(
+        np.frombuffer(popnums, dtype=np.int64).copy(),
+        np.frombuffer(energies, dtype=np.float64).copy(),
+        np.frombuffer(offsets, dtype=np.int64).copy(),
+        np.frombuffer(species_codes, dtype=np.int16).copy(),
+        np.frombuffer(coords, dtype=np.float64).reshape(-1, 3).copy(),
+        species_table,
+    )
+
+
+def _file_signature(path):
+    st = input_stat(path)
+    return st.st_size, st.st_mtime_ns
+
+def load_population_store(recover_path, cache=False):
+    """
+    读取 recover.txt 为 PopulationStore。
+    cache=True 时在 recover.txt 旁边保存/复用 recover.txt.npz（按文件大小和修改时间判断是否过期）。
+    """
+    cache_path = recover_path + CACHE_SUFFIX
+    signature = _file_signature(recover_path)
+    if cache and os.path.exists(cache_path):
+        try:
+            store = PopulationStore.load(cache_path)
+            if store.signature == signature:
+                return store
+        except (OSError, ValueError, KeyError):
+            pass
+
+    with open_text(recover_path) as f:
+        store = parse_recover_lines(f)
+
+    if cache:
+        try:
+            store.save(cache_path, signature)
+        except OSError:
+            pass  # 目录只读时不缓存
+    return store
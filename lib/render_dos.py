@@ -0,0 +1,127 @@
+import os
+import argparse
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from lib.calculate_dos import draw_dos, select_homo_window
+from lib.dos_store import DOSStore, DOS_TABLE
+from lib.instrument import metrics, peak_rss_mb
+
+# 渲染任务: (save_path, formula, eigenvalues, occupations)
+
+# 每个工作进程只创建一个 figure，每张图画完后清空复用
+_figure = None
+
+def _get_figure():
+    global _figure
+    if _figure is None:
+        # matplotlib 在第一次出图时才导入；无界面后端，可在计算节点和子进程中渲染
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+
+        _figure = plt.figure()
+    return _figure
+
+def render_job(job, width=0.1, resolution=0.01):
+    save_path, formula, eigenvalues, occupations = job
+    draw_dos(list(eigenvalues), list(occupations), save_path, formula, width, resolution, fig=_get_figure())
+    return save_path
+
+def _timed_render_job(job):
+    """ 子进程中渲染并返回 (save_path, 墙钟, CPU, 峰值 RSS, pid)，供主进程记录耗时 """
+    t0, c0 = time.perf_counter(), time.process_time()
+    save_path = render_job(job)
+    return save_path, time.perf_counter() - t0, time.process_time() - c0, peak_rss_mb(), os.getpid()
+
+def is_up_to_date(png_path, source_mtime):
+    """ PNG 已存在且不早于数据来源时跳过 """
+    return os.path.exists(png_path) and os.path.getmtime(png_path) >= source_mtime
+
+def render_jobs(jobs, workers=1):
+    """ 渲染一批任务，逐个返回已保存的路径；workers > 1 时分配到进程池 """
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield render_job(job)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(render_job, jobs, chunksize=max(1, len(jobs) // (4 * workers)))
+
+def png_name(db_id, filename):
+    return f"{db_id}_{filename}.png"
+
+def jobs_from_database(db_path, out_dir="dmol_dos", force=False, ids=None):
+    """ 从 dos_spectra 表生成渲染任务，跳过已是最新的 PNG """
+    conn = sqlite3.connect(db_path)
+    try:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name=?", (DOS_TABLE,)).fetchone():
+            return []
+        mtimes = dict(conn.execute(f"SELECT id, mtime FROM {DOS_TABLE}"))
+        jobs = []
+        for db_id, filename, formula, eigenvalues, occupations in DOSStore(conn).iter_spectra(ids):
+            save_path = os.path.join(out_dir, png_name(db_id, filename))
+            if not force and is_up_to_date(save_path, mtimes[db_id] or 0):
+                continue
+            window = select_homo_window(list(eigenvalues), list(occupations))
+            if window[0]:
+                jobs.append((save_path, formula, window[0], window[1]))
+        return jobs
+    finally:
+        conn.close()
+
+def render_database(db_path, out_dir="dmol_dos", workers=1, force=False):
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = jobs_from_database(db_path, out_dir, force)
+    return list(render_jobs(jobs, workers))
+
+
+class RenderQueue:
+    """
+    dmol2db 入库时使用的异步渲染队列：主进程写入数据库后提交任务，后台进程池渲染，
+    入库流程不等待出图；close() 时等待全部完成。
+    """
+
+    def __init__(self, out_dir="dmol_dos", workers=1):
+        self.out_dir = out_dir
+        os.makedirs(out_dir, exist_ok=True)
+        self.pool = ProcessPoolExecutor(max_workers=max(1, workers))
+        self.futures = []
+
+    def submit(self, db_id, filename, formula, eigenvalues, occupations, label=None):
+        """ label 用于耗时统计（lib.instrument），通常为输入文件路径 """
+        eigenvalues, occupations = select_homo_window(list(eigenvalues), list(occupations))
+        if not eigenvalues:
+            return None
+        save_path = os.path.join(self.out_dir, png_name(db_id, filename))
+        future = self.pool.submit(_timed_render_job, (save_path, formula, eigenvalues, occupations))
+        self.futures.append((future, label))
+        return future
+
+    def close(self):
+        """ 等待所有渲染完成，返回 (成功数, 失败列表) """
+        self.pool.shutdown(wait=True)
+        done, failed = 0, []
+        for future, label in self.futures:
+            if future.exception() is None:
+                save_path, wall, cpu, rss, pid = future.result()
+                metrics.add("dos_render", label or save_path, None, wall, cpu, rss=rss, pid=pid)
+                done += 1
+            else:
+                failed.append(future.exception())
+        self.futures = []
+        return done, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="根据数据库中的能级表批量渲染 DOS 图")
+    parser.add_argument("db", help="dmol2db 生成的数据库")
+    parser.add_argument("-o", "--out", default="dmol_dos", help="输出目录（默认 dmol_dos）")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="渲染进程数")
+    parser.add_argument("--force", action="store_true", help="忽略已存在的 PNG，全部重新渲染")
+    args = parser.parse_args(argv)
+
+    saved = render_database(args.db, args.out, args.jobs, args.force)
+    print(f"📊 共渲染 {len(saved)} 张 DOS 图，保存在 {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import numpy as np
+
+# 与 pymatgen KabschMatcher / HungarianOrderMatcher 相同的算法，但一次处理一整叠候选结构，
+# 不再为每一对结构构造 Molecule 和 Matcher 对象。
+# 约定: ref 为目标结构 (N, 3)，stack 为候选结构 (M, N, 3)，RMSD = sqrt(sum_i |p_i - q_i|^2 / N)
+
+def _rmsd_from_svd(p, q):
+    """ p, q: (M, N, 3) 已居中的坐标；批量 SVD 求最优旋转后的 RMSD """
+    cov = np.einsum("mni,mnj->mij", p, q)
+    u, s, vt = np.linalg.svd(cov)
+    # 保证是右手系旋转（与 KabschMatcher.kabsch 中 diag([1, 1, det]) 一致）
+    d = np.sign(np.linalg.det(u @ vt))
+    d[d == 0] = 1.0
+    e0 = np.einsum("mni,mni->m", p, p) + np.einsum("mni,mni->m", q, q)
+    msd = (e0 - 2.0 * (s[:, 0] + s[:, 1] + d * s[:, 2])) / p.shape[1]
+    return np.sqrt(np.clip(msd, 0.0, None))
+
+def kabsch_rmsd_batch(ref, stack):
+    """ 原子顺序固定时 ref 与每个候选结构的 Kabsch RMSD (M,) """
+    ref = np.asarray(ref, dtype=float)
+    stack = np.asarray(stack, dtype=float).reshape(-1, len(ref), 3)
+    p = stack - stack.mean(axis=1, keepdims=True)
+    q = np.broadcast_to(ref - ref.mean(axis=0), p.shape)
+    return _rmsd_from_svd(p, q)
+
+def _principal_axes(coords, weights):
+    """ coords: (M, N, 3) 已按质心居中；返回最小惯量主轴 (M, 3) """
+    x, y, z = coords[..., 0], coords[..., 1], coords[..., 2]
+    ixx = np.sum(weights * (y * y + z * z), axis=-1)
+    iyy = np.sum(weights * (x * x + z * z), axis=-1)
+    izz = np.sum(weights * (x * x + y * y), axis=-1)
+    ixy = -np.sum(weights * x * y, axis=-1)
+    ixz = -np.sum(weights * x * z, axis=-1)
+    iyz = -np.sum(weights * y * z, axis=-1)
+    tensor = np.stack([
+        np.stack([ixx, ixy, ixz], axis=-1),
+        np.stack([ixy, iyy, iyz], axis=-1),
+        np.stack([ixz, iyz, izz], axis=-1),
+    ], axis=-2)
+    _, eigvecs = np.linalg.eigh(tensor)
+    return eigvecs[..., :, 0]
+
+def _rotation_matrix_vectors(v1, v2):
+    """ Rodrigues 公式：把 v1 转到 v2 的旋转矩阵（同 HungarianOrderMatcher）；v1, v2: (..., 3)，批量计算 """
+    v1, v2 = np.broadcast_arrays(np.asarray(v1, dtype=float), np.asarray(v2, dtype=float))
+    v = np.cross(v1, v2)
+    norm2 = np.einsum("...i,...i->...", v, v)
+    c = np.einsum("...i,...i->...", v1, v2)
+    zero = np.zeros_like(c)
+    vx = np.stack([
+        np.stack([zero, -v[..., 2], v[..., 1]], axis=-1),
+        np.stack([v[..., 2], zero, -v[..., 0]], axis=-1),
+        np.stack([-v[..., 1], v[..., 0], zero], axis=-1),
+    ], axis=-2)
+    same = np.all(np.isclose(v1, v2), axis=-1)
+    opposite = np.all(np.isclose(v1, -v2), axis=-1) & ~same
+    scale = np.where(same | opposite, 0.0, (1.0 - c) / np.where(norm2 > 0, norm2, 1.0))
+    rot = np.eye(3) + vx + (vx @ vx) * scale[..., None, None]
+    rot[same] = np.eye(3)
+    rot[opposite] = np.array([[-1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, -1.0]])
+    return rot
+
+def _assignment(q, p, metric):
+    """ 同种元素内的最优原子对应（匈牙利算法）；scipy 在第一次需要重排原子时才导入 """
+    from scipy.optimize import linear_sum_assignment
+    from scipy.spatial.distance import cdist
+
+    return linear_sum_assignment(cdist(q, p, metric))[1]
+
+def _batched_assignment(q, p, squared=False):
+    """
+    q, p: (K, n, 3)，K 对结构中同一种元素的 n 个原子；返回每对的最优对应 (K, n)，
+    距离矩阵一次算出，只有匈牙利求解本身逐对进行（单个原子的元素不需要求解）。
+    squared=True 时以距离平方为代价（cdist 的 "sqeuclidean"）
+    """
+    if q.shape[1] == 1:
+        return np.zeros((len(q), 1), dtype=np.int64)
+    from scipy.optimize import linear_sum_assignment
+
+    diff = q[:, :, None, :] - p[:, None, :, :]
+    cost = np.einsum("knmi,knmi->knm", diff, diff)
+    if not squared:
+        cost = np.sqrt(cost)
+    return np.array([linear_sum_assignment(c)[1] for c in cost])
+
+def hungarian_rmsd_pairs(refs, stack, numbers, masses):
+    """
+    与 HungarianOrderMatcher 相同：按质心居中、主惯量轴预对齐（正反两个方向），
+    同种元素内用匈牙利算法重排原子，再做 Kabsch；refs[m] 为目标结构、stack[m] 为候选结构，
+    返回每一对的最小 RMSD (M,)。居中、主轴、旋转、距离矩阵和 SVD 都按整批计算。
+    numbers / masses: 每个原子的原子序数和质量（所有结构元素序列一致）。
+    """
+    stack = np.asarray(stack, dtype=float)
+    refs = np.broadcast_to(np.asarray(refs, dtype=float), stack.shape)
+    numbers = np.asarray(numbers)
+    masses = np.asarray(masses, dtype=float)
+    total = masses.sum()
+
+    q = refs - (np.einsum("n,mni->mi", masses, refs) / total)[:, None, :]
+    p = stack - (np.einsum("n,mni->mi", masses, stack) / total)[:, None, :]
+    q_axes = _principal_axes(q, masses)
+    p_axes = _principal_axes(p, masses)
+    signs = np.array([1.0, -1.0])[:, None, None]
+    rot = _rotation_matrix_vectors(q_axes[None], signs * p_axes[None])  # (2, M, 3, 3)
+    p_test = np.einsum("mni,kmij->kmnj", p, rot)
+
+    m = len(p)
+    perm = np.empty((2, m, p.shape[1]), dtype=np.int64)
+    q_both = np.broadcast_to(q, (2,) + q.shape)
+    for z in np.unique(numbers):
+        inds = np.nonzero(numbers == z)[0]
+        b = _batched_assignment(q_both[:, :, inds].reshape(2 * m, len(inds), 3),
+                                p_test[:, :, inds].reshape(2 * m, len(inds), 3))
+        perm[:, :, inds] = inds[b].reshape(2, m, len(inds))
+    permuted = p[np.arange(m)[None, :, None], perm]
+    return np.minimum(_rmsd_from_svd(permuted[0], q), _rmsd_from_svd(permuted[1], q))
+
+def hungarian_rmsd_batch(ref, stack, numbers, masses):
+    """ ref 与每个候选结构的 hungarian_rmsd_pairs (M,) """
+    stack = np.asarray(stack, dtype=float).reshape(-1, len(ref), 3)
+    return hungarian_rmsd_pairs(ref, stack, numbers, masses)
+
+def match_rmsd_batch(ref, stack, numbers, masses):
+    """ cluster_structures 使用的判据: min(Hungarian RMSD, Kabsch RMSD) """
+    return np.minimum(kabsch_rmsd_batch(ref, stack), hungarian_rmsd_batch(ref, stack, numbers, masses))
+
+
+def _kabsch_rotations(p, q):
+    """ p, q: (M, N, 3) 已居中；批量返回右手系旋转 R (M, 3, 3)，使 p[m] @ R[m] 与 q[m] 的 RMSD 最小 """
+    u, _, vt = np.linalg.svd(np.einsum("mni,mnj->mij", p, q))
+    d = np.sign(np.linalg.det(u @ vt))
+    d[d == 0] = 1.0
+    return (u * np.stack([np.ones_like(d), np.ones_like(d), d], axis=-1)[:, None, :]) @ vt
+
+def aligned_rmsd_batch(ref, stack, numbers, iterations=3):
+    """
+    与原子顺序和取向都无关的 RMSD（跨运行去重用）：
+    三个主惯量轴全部对齐（4 种右手系符号组合），同种元素内匈牙利算法重排，
+    再交替做 Kabsch 旋转和重排 iterations 次，取最小值 (M,)。
+    hungarian_rmsd_batch 只对齐一个主轴，绕该轴的转角没有确定，取向任意时常常找不到匹配。
+    所有候选的 4 种初始取向合成一批（4M 个），旋转、距离矩阵和 SVD 都按整批计算，只有匈牙利求解逐个进行。
+    """
+    ref = np.asarray(ref, dtype=float)
+    stack = np.asarray(stack, dtype=float).reshape(-1, len(ref), 3)
+    numbers = np.asarray(numbers)
+    groups = [np.nonzero(numbers == z)[0] for z in np.unique(numbers)]
+    m, n = stack.shape[:2]
+    if m == 0:
+        return np.zeros(0)
+
+    q = ref - ref.mean(axis=0)
+    p = stack - stack.mean(axis=1, keepdims=True)
+    _, q_axes = np.linalg.eigh(q.T @ q)
+    _, p_axes = np.linalg.eigh(np.einsum("mni,mnj->mij", p, p))
+    flips = 1.0 - 2.0 * np.array(list(np.ndindex(2, 2, 2)), dtype=float)  # (8, 3)
+    rot = (p_axes[None] * flips[:, None, None, :]) @ q_axes.T  # (8, M, 3, 3)
+    # 每个候选恰有 4 种符号组合给出右手系旋转
+    proper = np.linalg.det(rot) > 0
+    owner = np.nonzero(proper.T)[0]  # 每个初始取向属于哪个候选
+    rot = rot.transpose(1, 0, 2, 3)[proper.T]  # (4M, 3, 3)
+    p_all = p[owner]
+    q_all = np.broadcast_to(q, p_all.shape)
+
+    perm = np.zeros(p_all.shape[:2], dtype=np.int64)
+    rows = np.arange(len(p_all))[:, None]
+    for _ in range(iterations):
+        p_test = p_all @ rot
+        for inds in groups:
+            b = _batched_assignment(q_all[:, inds], p_test[:, inds], squared=True)
+            perm[:, inds] = inds[b]
+        rot = _kabsch_rotations(p_all[rows, perm], q_all)
+    msd = np.sum((p_all[rows, perm] @ rot - q_all) ** 2, axis=(1, 2)) / n
+    result = np.full(m, np.inf)
+    np.minimum.at(result, owner, np.sqrt(msd))
+    return result
+
+# ========== 贪心聚类：只与分组代表结构比较 ==========
+def cluster_greedy(coords, numbers, masses, rmsd_cutoff, energies=None, energy_window=None):
+    """
+    coords: (M, N, 3)，所有结构元素序列相同。按输入顺序贪心聚类：每个结构归入第一个
+    代表结构（分组中的第一个结构）min(Kabsch, Hungarian) RMSD < rmsd_cutoff 的分组。
+    只比较 N·G 对（G 为分组数），不建 M×M 矩阵：
+      - 距离指纹给出 RMSD 的严格下界，先排除不可能匹配的代表结构
+      - 剩下的代表结构一次批量 Kabsch；Hungarian 只对第一个 Kabsch 命中之前的代表结构批量计算
+    结果与对完整矩阵贪心聚类相同。返回分组列表，每个分组为结构下标列表。
+    """
+    from lib.fingerprint import FingerprintIndex, distance_fingerprint
+
+    coords = np.asarray(coords, dtype=float)
+    index = FingerprintIndex(coords.shape[1])
+    reps, groups = [], []
+    for j in range(len(coords)):
+        fp = distance_fingerprint(coords[j])
+        candidates = index.candidates(fp, rmsd_cutoff)
+        if energy_window is not None and candidates:
+            candidates = [g for g in candidates if abs(energies[j] - energies[reps[g]]) <= energy_window]
+        hit = None
+        if candidates:
+            rep_coords = coords[[reps[g] for g in candidates]]
+            kabsch_hits = np.nonzero(kabsch_rmsd_batch(coords[j], rep_coords) < rmsd_cutoff)[0]
+            first = kabsch_hits[0] if len(kabsch_hits) else len(candidates)
+            if first > 0:
+                # 目标结构为代表结构，与 HungarianOrderMatcher(ref_mol).fit(mol) 的方向一致
+                refs = rep_coords[:first]
+                hungarian = hungarian_rmsd_pairs(refs, np.broadcast_to(coords[j], refs.shape), numbers, masses)
+                hungarian_hits = np.nonzero(hungarian < rmsd_cutoff)[0]
+                if len(hungarian_hits):
+                    first = hungarian_hits[0]
+            if first < len(candidates):
+                hit = candidates[first]
+        if hit is None:
+            index.add(fp, len(groups))
+            reps.append(j)
+            groups.append([j])
+        else:
+            groups[hit].append(j)
+    return groups
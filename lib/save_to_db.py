@@ -1,20 +1,125 @@
-from ase.db import connect
-from ase import Atoms
+import time
 import numpy as np
+from lib.instrument import metrics
+from lib.query import PropertyIndex
+
+
+class DBWriter:
+    """
+    整个运行期间保持打开的数据库写入器：记录先缓存，每 batch_size 条在一个事务中写入并提交，
+    避免每条记录都重新连接数据库、单独提交（在 NFS 上每次 fsync 都很慢）。
+
+        with DBWriter("DMOL_RESULTS.db", batch_size=500, wal=True) as writer:
+            writer.write(parameters, atom_species, atom_positions)
+
+    callback(row_id) 在记录写入后、同一事务提交前调用，可用于在同一事务中写入附加信息。
+    同一事务中同时维护物化属性表和覆盖索引（lib.query），查询不需要再扫描 EAV 表。
+    label 用于耗时统计（lib.instrument），通常为输入文件路径。
+    flush_interval（秒）：距上次提交超过该时间时不等凑满 batch_size 就提交，限制被抢占时丢失的工作量。
+    被 Ctrl-C / SIGTERM（SystemExit）中断时，已完成的记录先提交再退出。
+    """
+
+    def __init__(self, db_path, batch_size=500, wal=False, flush_interval=None):
+        self.db_path = db_path
+        self.batch_size = max(1, batch_size)
+        self.wal = wal
+        self.flush_interval = flush_interval
+        self.db = None
+        self.properties = None
+        self._indexed = False
+        self._pending = []
+        self._flushing = False
+        self._last_commit = time.monotonic()
+
+    def open(self):
+        from ase.db import connect  # ase.db 导入较慢，只在真正写数据库时导入
+
+        self.db = connect(self.db_path, type="db")
+        self.db.__enter__()
+        if self.wal:
+            self.db.connection.execute("PRAGMA journal_mode=WAL")
+            self.db.connection.execute("PRAGMA synchronous=NORMAL")
+        self.properties = PropertyIndex(self.db.connection)
+        return self
+
+    @property
+    def connection(self):
+        return self.db.connection
+
+    def write(self, parameters, atom_species, atom_positions, callback=None, label=None):
+        # **确保 atom_species 和 atom_positions 不为空**
+        if len(atom_species) == 0 or len(atom_positions) == 0:
+            print("Error: Missing atomic data, cannot create Atoms object.")
+            return
+
+        from ase import Atoms  # ase 在第一次写入时才导入
+
+        # **构造 Atoms 对象**
+        atoms = Atoms(symbols=atom_species, positions=np.array(atom_positions), pbc=[False, False, False])
+        self._pending.append((atoms, dict(parameters), callback, label))
+        if len(self._pending) >= self.batch_size or self._interval_elapsed():
+            self.flush()
+
+    def _interval_elapsed(self):
+        return self.flush_interval is not None and time.monotonic() - self._last_commit >= self.flush_interval
+
+    def delete(self, ids):
+        """ 在当前事务中删除旧记录（不像 ase 的 delete 那样每次 VACUUM） """
+        ids = [int(i) for i in ids]
+        if not ids:
+            return
+        placeholders = ", ".join("?" * len(ids))
+        for table in ["number_key_values", "text_key_values", "keys", "species", "systems"]:
+            self.db.connection.execute(f"DELETE FROM {table} WHERE id IN ({placeholders})", ids)
+        self.properties.delete(ids)
+
+    def flush(self):
+        """ 把缓存的记录写入数据库并提交，返回新行的 id """
+        ids = []
+        self._flushing = True
+        for atoms, key_value_pairs, callback, label in self._pending:
+            with metrics.stage("db_write", item=label):
+                # ase 每写 5000 行会自行提交一次，那样新行和 callback 中的附加信息就不在同一事务里了
+                self.db.change_count = 0
+                row_id = self.db.write(atoms=atoms, key_value_pairs=key_value_pairs)
+                self.properties.put(row_id, key_value_pairs, atoms.get_chemical_symbols())
+                if callback is not None:
+                    callback(row_id)
+            ids.append(row_id)
+        self._pending = []
+        if ids and not self._indexed:
+            # ASE 表在第一次写入时才创建
+            self._indexed = self.properties.ensure_covering_indexes()
+        with metrics.stage("db_commit"):
+            self.db.connection.commit()
+        self._flushing = False
+        self._last_commit = time.monotonic()
+        return ids
+
+    def close(self):
+        if self.db is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self.db.__exit__(None, None, None)
+            self.db = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None or (issubclass(exc_type, (KeyboardInterrupt, SystemExit)) and not self._flushing):
+            # 正常结束，或在两次提交之间被中断：缓存中都是完整的记录，提交后退出
+            self.close()
+        elif self.db is not None:
+            # 出错时已提交的批次保留，未提交的丢弃
+            self._pending = []
+            self.db.__exit__(exc_type, exc_value, tb)
+            self.db = None
+
 
 def save_to_db(db_path, parameters, atom_species, atom_positions):
-    # **确保 atom_species 和 atom_positions 不为空**
-    if not atom_species or not atom_positions:
-        print("Error: Missing atomic data, cannot create Atoms object.")
-        return
-
-    # **构造 Atoms 对象**
-    atoms = Atoms(symbols=atom_species, positions=np.array(atom_positions), pbc=[False, False, False])
-    print(atoms)
-    # **写入数据库**
-    with connect(db_path) as db:
-        db.write(
-            atoms=atoms,  # **存入 Atoms 结构**
-            key_value_pairs={k: v for k, v in parameters.items()}  # **存储能量等参数**
-        )
-        
+    """ 写入单条记录（兼容旧接口）；批量写入请使用 DBWriter """
+    with DBWriter(db_path, batch_size=1) as writer:
+        writer.write(parameters, atom_species, atom_positions)
@@ -0,0 +1,361 @@
+import os
+import json
+import math
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+from lib.query import (PROPERTY_TABLE, COLUMNS, NUMERIC_COLUMNS, iter_search, count, parse_range,
+                       connect_readonly)
+from lib.dos_store import DOS_TABLE
+
+# 只读 HTTP/JSON 查询服务，例如:
+#   python tool_serve.py DATABASE.db --port 8000
+#   curl 'http://127.0.0.1:8000/systems?GAP_DFT=1.5:3&contains=Al,B&sort=TOTEN&limit=20'
+
+STREAM_LIMIT = 100000     # 流式输出时每页行数上限
+STREAM_CHUNK = 1000       # 流式输出时每次取连接读取的行数，写出时不占用连接
+CACHE_MAX_BYTES = 1 << 20  # 超过该大小的响应不缓存
+DOS_MAX_POINTS = 100000    # DOS 曲线能量网格点数上限，(emax - emin) / resolution 超过时返回 400
+
+
+class ConnectionPool:
+    """ 固定数量的只读 SQLite 连接，请求之间复用，不为每个请求重新打开数据库 """
+
+    def __init__(self, db_path, size=8):
+        self.db_path = db_path
+        self._idle = queue.Queue()
+        for _ in range(max(1, size)):
+            conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute("PRAGMA query_only=ON")
+            self._idle.put(conn)
+        self.size = self._idle.qsize()
+
+    @contextmanager
+    def connection(self):
+        conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        for _ in range(self.size):
+            self._idle.get().close()
+
+
+class ResponseCache:
+    """ 最近响应的 LRU 缓存；数据库文件（或其 WAL）大小、修改时间变化时整体清空 """
+
+    def __init__(self, db_path, maxsize=1024):
+        self.db_path = db_path
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def _file_signature(self):
+        signature = []
+        for path in (self.db_path, self.db_path + "-wal"):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def get(self, key):
+        """
+        返回 (缓存的响应或 None, 文件签名)；签名在查询数据库之前取得，
+        put 时原样传回，查询期间数据库有变化的响应不会被缓存
+        """
+        signature = self._file_signature()
+        with self._lock:
+            if signature != self._signature:
+                self._entries.clear()
+                self._signature = signature
+                return None, signature
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry, signature
+
+    def put(self, key, entry, signature):
+        if self.maxsize <= 0:
+            return
+        current = self._file_signature()
+        with self._lock:
+            if signature != current or signature != self._signature:
+                return  # 响应可能来自修改前的数据库
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _filters(params):
+    """ 查询参数 → lib.query 的过滤条件；数值列写成 列=下限:上限，例如 GAP_DFT=1.5:3 """
+    ranges = {}
+    for column in NUMERIC_COLUMNS:
+        if column in params:
+            ranges.update([parse_range(f"{column}={params[column]}")])
+    split = lambda name: [s for s in params[name].split(",") if s] if name in params else None  # noqa: E731
+    return dict(ranges=ranges, point_group=params.get("point_group"),
+                contains=split("contains"), exact=split("exact"))
+
+def _dos_params(params):
+    """ DOS 展宽参数 → (width, resolution, (emin, emax))；非有限值、非正的展宽或步长、网格过大时返回 400 """
+    width = float(params["width"])
+    resolution = float(params.get("resolution", 0.01))
+    emin, emax = float(params.get("emin", -20)), float(params.get("emax", 10))
+    if not all(math.isfinite(v) for v in (width, resolution, emin, emax)):
+        raise HTTPError(400, "width、resolution、emin、emax 必须是有限的数")
+    if width <= 0 or resolution <= 0:
+        raise HTTPError(400, "width 和 resolution 必须大于 0")
+    if emin >= emax:
+        raise HTTPError(400, "emin 必须小于 emax")
+    # 每个能级在 ±5 width 内计算，展宽窗口同样受网格点数限制
+    if (emax - emin) / resolution > DOS_MAX_POINTS or 10 * width / resolution > DOS_MAX_POINTS:
+        raise HTTPError(400, f"能量网格超过 {DOS_MAX_POINTS} 个点，请增大 resolution 或缩小 emin/emax 范围")
+    return width, resolution, (emin, emax)
+
+def _system_atoms(conn, db_id):
+    row = conn.execute("SELECT numbers, positions FROM systems WHERE id=?", (db_id,)).fetchone()
+    if row is None:
+        raise HTTPError(404, f"没有 id={db_id} 的结构")
+    numbers = np.frombuffer(row[0], dtype=np.int32)
+    positions = np.frombuffer(row[1], dtype=np.float64).reshape(-1, 3)
+    from ase.data import chemical_symbols
+
+    return [chemical_symbols[z] for z in numbers], positions
+
+def _system_properties(conn, db_id):
+    row = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM {PROPERTY_TABLE} WHERE id=?", (db_id,)).fetchone()
+    if row is None:
+        raise HTTPError(404, f"没有 id={db_id} 的结构")
+    return dict(zip(COLUMNS, row))
+
+def _xyz(symbols, positions, comment=""):
+    lines = [str(len(symbols)), comment]
+    lines += [f"{s} {x:.8f} {y:.8f} {z:.8f}" for s, (x, y, z) in zip(symbols, positions)]
+    return "\n".join(lines) + "\n"
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    GET /                       数据库概况
+    GET /systems                分页列表（过滤参数同 lib.query.search；limit 大于 lib.query.MAX_LIMIT 时流式输出）
+    GET /systems/count          满足条件的结构数
+    GET /systems/<id>           属性、元素和坐标
+    GET /systems/<id>.xyz       下载 xyz 结构
+    GET /systems/<id>/dos       能级表；给出 width（可选 resolution、emin、emax）时同时返回展宽后的 DOS 曲线
+    """
+
+    protocol_version = "HTTP/1.1"
+    server_version = "dmol_webdb"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        key = self.path
+        cached, signature = self.server.cache.get(key)
+        if cached is not None:
+            self._send(*cached)
+            return
+        try:
+            response = self._route(url.path.rstrip("/") or "/", params)
+        except HTTPError as e:
+            self._send_json({"error": str(e)}, status=e.status)
+            return
+        except (ValueError, TypeError) as e:
+            self._send_json({"error": str(e)}, status=400)
+            return
+        except sqlite3.Error as e:
+            self._send_json({"error": f"数据库错误: {e}"}, status=500)
+            return
+        except Exception as e:
+            # 其余异常也返回 JSON，不让处理线程直接断开连接
+            self.log_error("%s 处理失败: %r", self.path, e)
+            self._send_json({"error": f"服务器内部错误: {type(e).__name__}"}, status=500)
+            return
+        if response is None:
+            return  # 已流式输出
+        status, content_type, body = response
+        if len(body) <= CACHE_MAX_BYTES:
+            self.server.cache.put(key, response, signature)
+        self._send(status, content_type, body)
+
+    def _route(self, path, params):
+        parts = path.strip("/").split("/")
+        if parts == ["systems"]:
+            return self._list(params)  # 自行取用连接：流式输出时不能在写 socket 期间占着连接
+        with self.server.pool.connection() as conn:
+            if path == "/":
+                return self._json({"systems": count(conn), "endpoints": [
+                    "/systems", "/systems/count", "/systems/<id>", "/systems/<id>.xyz", "/systems/<id>/dos"]})
+            if parts[0] != "systems":
+                raise HTTPError(404, f"未知路径: {path}")
+            if len(parts) == 2 and parts[1] == "count":
+                return self._json({"count": count(conn, **_filters(params))})
+            if len(parts) == 2 and parts[1].endswith(".xyz"):
+                db_id = int(parts[1][:-4])
+                symbols, positions = _system_atoms(conn, db_id)
+                properties = _system_properties(conn, db_id)
+                body = _xyz(symbols, positions, properties["filename"] or f"id={db_id}").encode()
+                return 200, "chemical/x-xyz", body
+            if len(parts) == 2:
+                db_id = int(parts[1])
+                result = _system_properties(conn, db_id)
+                symbols, positions = _system_atoms(conn, db_id)
+                result["symbols"] = symbols
+                result["positions"] = positions.tolist()
+                return self._json(result)
+            if len(parts) == 3 and parts[2] == "dos":
+                return self._dos(conn, int(parts[1]), params)
+        raise HTTPError(404, f"未知路径: {path}")
+
+    def _search(self, params, limit, after):
+        with self.server.pool.connection() as conn:
+            result = iter_search(conn, order_by=params.get("sort", "id"),
+                                 descending=params.get("desc") in ("1", "true"),
+                                 limit=limit, after=after, max_limit=STREAM_LIMIT, **_filters(params))
+            return list(result), result.next_cursor
+
+    def _list(self, params):
+        after = json.loads(params["after"]) if "after" in params else None
+        limit = max(1, min(int(params.get("limit", 50)), STREAM_LIMIT))
+        if limit <= self.server.max_buffered:
+            rows, next_cursor = self._search(params, limit, after)
+            return self._json({"rows": rows, "next_cursor": next_cursor})
+        self._stream_rows(params, limit, after)
+        return None
+
+    def _stream_rows(self, params, limit, after):
+        """
+        大页用分块传输编码输出，不在内存中拼出整页：按 (排序列, id) 游标每次读取 STREAM_CHUNK 行，
+        读完即归还连接再写 socket，客户端读得慢也不会占满连接池。
+        HTTP/1.0 客户端不支持分块编码：直接写出响应体，以关闭连接表示结束
+        """
+        # 第一块在发送响应头之前读取，参数错误仍可返回 400
+        rows, cursor = self._search(params, min(limit, STREAM_CHUNK), after)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self._chunked = self.request_version != "HTTP/1.0"
+        if self._chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        else:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self._write_chunk('{"rows": [' + ",".join(json.dumps(row, ensure_ascii=False) for row in rows))
+        remaining = limit - len(rows)
+        while remaining > 0 and cursor is not None:
+            rows, cursor = self._search(params, min(remaining, STREAM_CHUNK), cursor)
+            if rows:
+                self._write_chunk("," + ",".join(json.dumps(row, ensure_ascii=False) for row in rows))
+            remaining -= len(rows)
+        self._write_chunk(f'], "next_cursor": {json.dumps(cursor)}}}')
+        if self._chunked:
+            self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        if self._chunked:
+            data = f"{len(data):X}\r\n".encode() + data + b"\r\n"
+        self.wfile.write(data)
+
+    def _dos(self, conn, db_id, params):
+        row = conn.execute(
+            f"SELECT filename, formula, eigenvalues, occupations FROM {DOS_TABLE} WHERE id=?", (db_id,)).fetchone()
+        if row is None:
+            raise HTTPError(404, f"id={db_id} 没有能级数据")
+        eigenvalues = np.frombuffer(row[2], dtype=np.float64)
+        occupations = np.frombuffer(row[3], dtype=np.float64)
+        result = {"id": db_id, "filename": row[0], "formula": row[1],
+                  "eigenvalues": eigenvalues.tolist(), "occupations": occupations.tolist()}
+        if "width" in params:
+            from lib.calculate_dos import batch_gaussian_broadening
+
+            width, resolution, window = _dos_params(params)
+            energy, dos = batch_gaussian_broadening([(eigenvalues, occupations)], width, resolution, window)
+            result["energy"] = energy.tolist()
+            result["dos"] = dos[0].tolist()
+        return self._json(result)
+
+    @staticmethod
+    def _json(payload, status=200):
+        return status, "application/json; charset=utf-8", json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+    def _send_json(self, payload, status=200):
+        self._send(*self._json(payload, status))
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class QueryServer(ThreadingHTTPServer):
+    """ 每个连接一个线程；数据库访问受连接池大小限制，相同请求由 LRU 缓存直接返回 """
+
+    daemon_threads = True
+    request_queue_size = 512  # 浏览器前端的大量并发连接
+
+    def __init__(self, address, db_path, pool_size=8, cache_size=1024, max_buffered=1000, verbose=False):
+        super().__init__(address, QueryHandler)
+        self.pool = ConnectionPool(db_path, pool_size)
+        self.cache = ResponseCache(db_path, cache_size)
+        self.max_buffered = max_buffered
+        self.verbose = verbose
+
+    def server_close(self):
+        super().server_close()
+        self.pool.close()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DATABASE.db 的本地只读 HTTP/JSON 查询服务")
+    parser.add_argument("db", help="数据库文件（需先用 tool_query.py --build-index 建立物化属性表）")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址，默认 127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000, help="端口，默认 8000")
+    parser.add_argument("--pool-size", type=int, default=8, help="只读连接数，默认 8")
+    parser.add_argument("--cache-size", type=int, default=1024, help="缓存的响应个数，0 表示不缓存，默认 1024")
+    parser.add_argument("-v", "--verbose", action="store_true", help="打印每个请求")
+    args = parser.parse_args(argv)
+
+    conn = connect_readonly(args.db)
+    try:
+        ready = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                             (PROPERTY_TABLE,)).fetchone() is not None
+    finally:
+        conn.close()
+    if not ready:
+        print(f"❌ {args.db} 还没有物化属性表，请先运行 python tool_query.py {args.db} --build-index")
+        return
+
+    server = QueryServer((args.host, args.port), args.db, args.pool_size, args.cache_size, verbose=args.verbose)
+    print(f"🌐 http://{args.host}:{server.server_address[1]}/  ({args.db})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
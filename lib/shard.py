@@ -0,0 +1,53 @@
+import os
+import hashlib
+
+# 多节点分片入库：每个作业用 --shard i/N 只处理哈希落在第 i 片的 search 目录，写入各自的分片数据库，
+# 最后用 tool_merge_db.py --reduce 归并成一个数据库，例如:
+#   python dmol2db.py /path/to/root --shard $SLURM_ARRAY_TASK_ID/16
+#   python tool_merge_db.py --reduce -t DMOL_RESULTS.db DMOL_RESULTS_shard*.db
+
+SHARD_TABLE = "dmol2db_shard"
+
+
+def parse_shard(text):
+    """ "i/N"（0 <= i < N）-> (i, N) """
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise ValueError(f"分片格式应为 i/N，例如 0/16: {text!r}")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"分片序号须满足 0 <= i < N: {text!r}")
+    return index, count
+
+def _relative_key(search_dir, root):
+    """ 相对根目录的路径（/ 分隔）：不同节点上挂载点不同时分片结果仍一致 """
+    path = os.path.relpath(search_dir, root) if root is not None else os.path.abspath(search_dir)
+    return path.replace(os.sep, "/")
+
+def _digest(search_dir, root):
+    return hashlib.sha1(_relative_key(search_dir, root).encode("utf-8")).hexdigest()
+
+def shard_of(search_dir, root, count):
+    """ search 目录所属的分片：相对路径的稳定哈希（与遍历顺序、线程数、进程无关） """
+    return int(_digest(search_dir, root), 16) % count
+
+def search_tag(search_dir, root=None):
+    """ 8 位十六进制的 search 目录标签，写入 filename（{formula}_{tag}_{序号}），不同目录之间不再重名 """
+    return _digest(search_dir, root)[:8]
+
+def shard_db_name(index, count):
+    width = len(str(count - 1))
+    return f"DMOL_RESULTS_shard{index:0{width}d}of{count}.db"
+
+# ========== 分片数据库中记录自己是哪一片，归并时检查是否齐全 ==========
+def record_shard(connection, index, count, root):
+    connection.execute(f"CREATE TABLE IF NOT EXISTS {SHARD_TABLE} (shard INTEGER, count INTEGER, root TEXT)")
+    connection.execute(f"DELETE FROM {SHARD_TABLE}")
+    connection.execute(f"INSERT INTO {SHARD_TABLE} VALUES (?, ?, ?)", (index, count, os.path.abspath(root)))
+
+def read_shard(connection, schema="main"):
+    """ (i, N, 根目录)；不是分片数据库时返回 None """
+    if connection.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type='table' AND name=?",
+                          (SHARD_TABLE,)).fetchone() is None:
+        return None
+    return connection.execute(f"SELECT shard, count, root FROM {schema}.{SHARD_TABLE}").fetchone()
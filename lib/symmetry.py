@@ -0,0 +1,198 @@
+import os
+import signal
+import sqlite3
+import hashlib
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from lib.instrument import metrics
+
+SYMMETRY_TABLE = "point_groups"
+UNKNOWN_POINT_GROUP = "unknown"
+
+
+class SymmetryTimeout(Exception):
+    pass
+
+
+def structure_key(species, positions, tolerance=0.3, eigen_tolerance=0.01, decimals=2):
+    """
+    结构的规范哈希：组成 + 按元素对分组、排序并取整到 10^-decimals Å 的原子间距离 + 点群容差。
+    对平移、旋转、镜像和原子编号顺序都不变，GA 中几乎相同的结构得到同一个键。
+    """
+    elements, codes = np.unique(np.asarray(species), return_inverse=True)
+    pos = np.asarray(positions, dtype=float)
+    h = hashlib.sha1()
+    counts = sorted(Counter(species).items())
+    h.update("".join(f"{el}{n}" for el, n in counts).encode())
+    h.update(f"|tol={tolerance}|eig={eigen_tolerance}|dec={decimals}".encode())
+
+    diff = pos[:, None, :] - pos[None, :, :]
+    dist = np.sqrt(np.einsum("ijk,ijk->ij", diff, diff))
+    iu, ju = np.triu_indices(len(pos), k=1)
+    pair_a = np.minimum(codes[iu], codes[ju])
+    pair_b = np.maximum(codes[iu], codes[ju])
+    rounded = np.round(dist[iu, ju] * 10 ** decimals).astype(np.int64)
+    for a, b in sorted(set(zip(pair_a.tolist(), pair_b.tolist()))):
+        mask = (pair_a == a) & (pair_b == b)
+        h.update(f"|{elements[a]}-{elements[b]}:".encode())
+        h.update(np.sort(rounded[mask]).tobytes())
+    return h.hexdigest()
+
+
+def _point_group_symbol(species, positions, tolerance, eigen_tolerance):
+    from pymatgen.core.structure import Molecule
+    from pymatgen.symmetry.analyzer import PointGroupAnalyzer
+
+    mol = Molecule(species, positions)
+    point_group = PointGroupAnalyzer(mol, tolerance=tolerance, eigen_tolerance=eigen_tolerance).sch_symbol
+    # 修正某些字符错误
+    if point_group == "C*v":
+        point_group = "C∞v"
+    return point_group
+
+
+def _raise_timeout(signum, frame):
+    raise SymmetryTimeout()
+
+
+class SymmetryStage:
+    """
+    点群分析阶段：
+      - cache_path: 持久化缓存（SQLite），键为 structure_key，几乎相同的结构只算一次
+      - tolerance / eigen_tolerance: 传给 PointGroupAnalyzer
+      - timeout: 每个结构的时间上限（秒），超时返回 UNKNOWN_POINT_GROUP 且不写入缓存；
+        依赖 SIGALRM，只在进程主线程中生效（进程池的子进程也是主线程）
+    可以被 pickle 传给子进程，每个进程各自打开缓存连接。
+    """
+
+    def __init__(self, cache_path=None, tolerance=0.3, eigen_tolerance=0.01, timeout=None):
+        self.cache_path = cache_path
+        self.tolerance = tolerance
+        self.eigen_tolerance = eigen_tolerance
+        self.timeout = timeout
+        self._connection = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_connection"] = None
+        return state
+
+    def _cache(self):
+        if self.cache_path is None:
+            return None
+        if self._connection is None:
+            # 多个进程共用同一个缓存文件，写入很少，靠 busy timeout 等锁即可
+            self._connection = sqlite3.connect(self.cache_path, timeout=60, isolation_level=None)
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {SYMMETRY_TABLE} (key TEXT PRIMARY KEY, point_group TEXT)")
+        return self._connection
+
+    def _compute(self, species, positions):
+        use_alarm = (self.timeout and hasattr(signal, "SIGALRM")
+                     and threading.current_thread() is threading.main_thread())
+        if not use_alarm:
+            return _point_group_symbol(species, positions, self.tolerance, self.eigen_tolerance)
+
+        previous = signal.signal(signal.SIGALRM, _raise_timeout)
+        try:
+            try:
+                signal.setitimer(signal.ITIMER_REAL, self.timeout)
+                return _point_group_symbol(species, positions, self.tolerance, self.eigen_tolerance)
+            finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        except SymmetryTimeout:
+            return None
+        finally:
+            signal.signal(signal.SIGALRM, previous)
+
+    def point_group(self, species, positions):
+        with metrics.stage("symmetry"):
+            return self._point_group(species, positions)
+
+    def _point_group(self, species, positions):
+        cache = self._cache()
+        key = None
+        if cache is not None:
+            key = structure_key(species, positions, self.tolerance, self.eigen_tolerance)
+            row = cache.execute(f"SELECT point_group FROM {SYMMETRY_TABLE} WHERE key=?", (key,)).fetchone()
+            if row is not None:
+                return row[0]
+
+        point_group = self._compute(species, positions)
+        if point_group is None:
+            return UNKNOWN_POINT_GROUP
+        if cache is not None:
+            cache.execute(f"INSERT OR REPLACE INTO {SYMMETRY_TABLE} VALUES (?, ?)", (key, point_group))
+        return point_group
+
+    def __call__(self, job):
+        """ 进程池任务: (id, species, positions) -> (id, point_group) """
+        row_id, species, positions = job
+        return row_id, self.point_group(species, positions)
+
+
+def _rows_to_backfill(db, retry_unknown):
+    sql = ("SELECT id FROM systems WHERE id NOT IN "
+           "(SELECT id FROM text_key_values WHERE key='Point_Group')")
+    if retry_unknown:
+        sql += f" OR id IN (SELECT id FROM text_key_values WHERE key='Point_Group' AND value='{UNKNOWN_POINT_GROUP}')"
+    with db.managed_connection() as conn:
+        if not conn.execute("SELECT name FROM sqlite_master WHERE name='systems'").fetchone():
+            return []
+        return [row[0] for row in conn.execute(sql + " ORDER BY id")]
+
+def backfill_point_groups(db_path, stage, jobs=1, retry_unknown=False, batch_size=500):
+    """
+    延后的点群补算：为数据库中还没有 Point_Group 的行计算点群（可用进程池），
+    每 batch_size 行在一个事务中写回。返回更新的行数。
+    """
+    from ase.db import connect
+    from lib.query import PropertyIndex
+
+    db = connect(db_path, type="db")
+    ids = _rows_to_backfill(db, retry_unknown)
+    updated = 0
+    pool = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 and len(ids) > 1 else None
+    try:
+        for start in range(0, len(ids), batch_size):
+            chunk = ids[start:start + batch_size]
+            jobs_chunk = []
+            for row_id in chunk:
+                row = db.get(id=row_id)
+                jobs_chunk.append((row_id, row.symbols, row.positions.tolist()))
+            if pool is not None:
+                results = pool.map(stage, jobs_chunk, chunksize=max(1, len(jobs_chunk) // (4 * jobs)))
+            else:
+                results = map(stage, jobs_chunk)
+            with db:
+                properties = PropertyIndex(db.connection)
+                for row_id, point_group in results:
+                    db.update(row_id, Point_Group=point_group)
+                    properties.set_point_group(row_id, point_group)
+                    updated += 1
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return updated
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="为数据库中缺少 Point_Group 的结构补算点群")
+    parser.add_argument("db", help="dmol2db 生成的数据库")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="并行进程数")
+    parser.add_argument("--symmetry-cache", default="SYMMETRY_CACHE.db", help="点群缓存文件（默认 SYMMETRY_CACHE.db）")
+    parser.add_argument("--symmetry-tolerance", type=float, default=0.3, help="PointGroupAnalyzer 距离容差，默认 0.3")
+    parser.add_argument("--symmetry-timeout", type=float, help="每个结构点群分析的时间上限（秒），超时记为 unknown")
+    parser.add_argument("--retry-unknown", action="store_true", help="同时重算之前超时记为 unknown 的结构")
+    args = parser.parse_args(argv)
+
+    stage = SymmetryStage(args.symmetry_cache, args.symmetry_tolerance, timeout=args.symmetry_timeout)
+    updated = backfill_point_groups(args.db, stage, args.jobs, args.retry_unknown)
+    print(f"✅ 已补算 {updated} 个结构的点群")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import random
+
+import pytest
+
+# 测试直接导入仓库根目录下的 lib 和 benchmarks
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def sample_structures():
+    """ n 个随机团簇 [(species, positions, parameters)]，参数与 extract_parameters 的键一致 """
+    from benchmarks.fixtures import random_cluster
+
+    def make(n, seed=0, natoms=6, prefix="Al3B3", elements=("B", "Al")):
+        rng = random.Random(seed)
+        structures = []
+        for i in range(n):
+            species, positions = random_cluster(natoms, rng, elements=list(elements))
+            parameters = {"filename": f"{prefix}_{i + 1}", "TOTEN": -100.0 + 0.5 * i,
+                          "GAP_DFT": round(1.0 + 0.1 * i, 3), "Calculator": "DMol3"}
+            structures.append((species, positions, parameters))
+        return structures
+    return make
+
+
+def sample_levels(seed):
+    """ 一组能级和占据数（测试用），seed 不同时能级略有平移 """
+    import numpy as np
+
+    eigenvalues = np.linspace(-12.0, 2.0, 8) + 0.01 * seed
+    return eigenvalues, np.where(eigenvalues < 0, 2.0, 0.0)
+
+
+@pytest.fixture
+def make_results_db(tmp_path):
+    """ 用 DBWriter 把 structures 写入 tmp_path 下的结果数据库，返回路径；dos=True 时同时写入能级表 """
+    from lib.dos_store import DOSStore
+    from lib.save_to_db import DBWriter
+
+    def make(name, structures, dos=False, **options):
+        path = str(tmp_path / name)
+        with DBWriter(path, **options) as writer:
+            store = DOSStore(writer.connection) if dos else None
+            for i, (species, positions, parameters) in enumerate(structures):
+                def on_written(row_id, i=i, filename=parameters["filename"]):
+                    if store is not None:
+                        store.put(row_id, *sample_levels(i), filename=filename, formula="Al3B3")
+                writer.write(parameters, species, positions, callback=on_written)
+        return path
+    return make
+
+
+@pytest.fixture
+def search_tree(tmp_path, monkeypatch):
+    """
+    合成的 root/run{i}/search 目录树（benchmarks.fixtures.make_tree，规模很小）；
+    当前目录切换到 tmp_path，dmol2db 的日志、耗时统计和数据库都写在这里
+    """
+    import dmol2db
+    from benchmarks.fixtures import make_tree
+
+    root = tmp_path / "root"
+    make_tree(str(root), search_dirs=2, n_pops=8, natoms=6, n_distinct=4, scf_iterations=2, opt_steps=2)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dmol2db, "log_filename", str(tmp_path / "dmol2db.log"))
+    monkeypatch.setattr(dmol2db, "_log_file", None)
+    return str(root)
@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import sample_levels
+from lib.calculate_dos import batch_gaussian_broadening, gaussian_broadening
+
+
+def _dense_broadening(eigenvalues, occupations, width, resolution, energy_window):
+    """ 参考实现：每个能级在整条网格上计算高斯值 """
+    grid = np.arange(energy_window[0], energy_window[1], resolution)
+    dos = np.zeros_like(grid)
+    for e, occ in zip(eigenvalues, occupations):
+        dos += occ * np.exp(-((grid - e) ** 2) / (2 * width ** 2))
+    return grid, dos / (width * np.sqrt(2 * np.pi))
+
+
+@pytest.mark.parametrize("width,resolution", [(0.1, 0.01), (0.3, 0.05), (0.05, 0.02)])
+def test_broadening_matches_dense_reference(width, resolution):
+    eigenvalues, occupations = sample_levels(3)
+    window = (-15, 5)
+    grid, dos = gaussian_broadening(eigenvalues, occupations, width, resolution, window)
+    ref_grid, ref = _dense_broadening(eigenvalues, occupations, width, resolution, window)
+    assert np.array_equal(grid, ref_grid)
+    # 截断在 ±5σ，丢掉的尾部 < exp(-12.5)
+    assert np.allclose(dos, ref, atol=1e-5 * ref.max())
+
+
+def test_broadening_is_normalised():
+    eigenvalues, occupations = sample_levels(1)
+    resolution = 0.01
+    _, dos = gaussian_broadening(eigenvalues, occupations, 0.1, resolution, (-20, 10))
+    assert dos.sum() * resolution == pytest.approx(sum(occupations), rel=1e-4)
+
+
+def test_peak_sits_on_level():
+    _, dos = gaussian_broadening([-1.0], [2.0], 0.1, 0.01, (-3, 1))
+    grid = np.arange(-3, 1, 0.01)
+    assert grid[np.argmax(dos)] == pytest.approx(-1.0, abs=0.01)
+    assert dos.max() == pytest.approx(2.0 / (0.1 * np.sqrt(2 * np.pi)), rel=1e-3)
+
+
+def test_batch_equals_single_calls():
+    spectra = [sample_levels(seed) for seed in range(5)]
+    spectra.append(([], []))
+    grid, batch = batch_gaussian_broadening(spectra, 0.2, 0.02, (-14, 4))
+    assert batch.shape == (len(spectra), len(grid))
+    for row, (eigenvalues, occupations) in zip(batch, spectra):
+        _, single = gaussian_broadening(eigenvalues, occupations, 0.2, 0.02, (-14, 4))
+        assert np.allclose(row, single)
+    assert not batch[-1].any()
+
+
+def test_levels_outside_window_are_dropped():
+    _, dos = gaussian_broadening([-50.0, 50.0], [2.0, 2.0], 0.1, 0.01, (-5, 5))
+    assert not dos.any()
+    grid, dos = gaussian_broadening([1.0], [2.0], 0.1, 0.01, (3, 3))
+    assert len(grid) == 0 and len(dos) == 0
+
+
+def test_batch_mode_renders_compressed_copies_once(tmp_path, monkeypatch, capsys):
+    import gzip
+
+    from benchmarks.fixtures import outmol_lines
+    from lib import calculate_dos, render_dos
+
+    def write(path, seed, compress=False):
+        path.parent.mkdir(exist_ok=True)
+        text = "\n".join(outmol_lines(natoms=6, scf_iterations=2, opt_steps=2, seed=seed)) + "\n"
+        with (gzip.open(path, "wt") if compress else open(path, "w")) as f:
+            f.write(text)
+
+    write(tmp_path / "a" / "foo.outmol", seed=1)
+    write(tmp_path / "a" / "foo.outmol.gz", seed=2, compress=True)
+    write(tmp_path / "a" / "bar.outmol.gz", seed=3, compress=True)
+    rendered = []
+
+    def render_jobs(jobs, workers=1):
+        rendered.extend(jobs)
+        return [job[0] for job in jobs]
+    monkeypatch.setattr(render_dos, "render_jobs", render_jobs)
+    monkeypatch.chdir(tmp_path)
+    calculate_dos.main()
+
+    names = sorted(os.path.relpath(job[0], tmp_path) for job in rendered)
+    assert names == [os.path.join("dmol_dos", "bar_dos.png"), os.path.join("dmol_dos", "foo_dos.png")]
+    # foo.outmol 和 foo.outmol.gz 只渲染一次，未压缩的原文件优先
+    foo = next(job for job in rendered if job[1] == "foo")
+    assert foo[2] == calculate_dos.read_eigenvalues(str(tmp_path / "a" / "foo.outmol"))[0]
+    assert foo[2] != calculate_dos.read_eigenvalues(str(tmp_path / "a" / "foo.outmol.gz"))[0]
+    assert "foo.outmol, foo.outmol.gz" in capsys.readouterr().out
@@ -0,0 +1,44 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from lib.db_stats import collect_statistics, hill_formula, hill_label
+
+
+def test_hill_order():
+    assert hill_label([13, 5, 13]) == "AlB"
+    assert hill_label([8, 1, 6]) == "CHO"
+    assert hill_label([8, 6]) == "CO"
+    assert hill_formula({13: 2, 5: 4}) == "Al2B4"
+    assert hill_formula({1: 4, 6: 1}) == "CH4"
+
+
+def test_statistics_match_per_row_decoding(make_results_db, sample_structures):
+    structures = (sample_structures(10) + sample_structures(4, seed=1, natoms=5, prefix="Al5", elements=("Al",))
+                  + sample_structures(3, seed=2, natoms=4, prefix="B4", elements=("B",)))
+    path = make_results_db("results.db", structures)
+    stats = collect_statistics(path, gap_bins=7)
+
+    # 参考结果：逐行 toatoms()，即改为 SQL 聚合之前 tool_plot 的做法
+    from ase.db import connect
+
+    rows = list(connect(path).select())
+    assert stats["compositions"] == Counter(hill_label(row.toatoms().numbers) for row in rows)
+    assert stats["sizes"] == dict(sorted(Counter(row.natoms for row in rows).items()))
+    counts, edges = stats["gap"]
+    ref_counts, ref_edges = np.histogram([row.GAP_DFT for row in rows], bins=7)
+    assert np.array_equal(counts, ref_counts)
+    assert np.allclose(edges, ref_edges)
+
+
+def test_statistics_of_missing_or_constant_data(make_results_db, sample_structures):
+    empty = collect_statistics(make_results_db("empty.db", []))
+    assert empty == {"compositions": Counter(), "sizes": {}, "gap": None}
+
+    structures = sample_structures(3)
+    for _, _, parameters in structures:
+        parameters["GAP_DFT"] = 2.0
+    counts, edges = collect_statistics(make_results_db("flat.db", structures), gap_bins=4)["gap"]
+    assert counts.tolist() == [0, 0, 3, 0]  # 与 numpy.histogram 一致，单一取值放在中间的分箱
+    assert edges[0] == pytest.approx(1.5) and edges[-1] == pytest.approx(2.5)
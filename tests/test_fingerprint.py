@@ -0,0 +1,75 @@
+import random
+import sqlite3
+
+import numpy as np
+import pytest
+
+from benchmarks.fixtures import random_cluster
+from lib.fingerprint import FingerprintStore, distance_fingerprint, shape_descriptor
+from lib.rmsd import kabsch_rmsd_batch
+
+AL10 = np.full(10, 13)
+CUTOFF = 0.2
+
+
+def _cluster(seed, spacing=2.2, natoms=10):
+    return np.array(random_cluster(natoms, random.Random(seed), spacing=spacing)[1])
+
+def _moved(positions, seed, noise=0.05):
+    """ 加噪声后任意旋转、平移并打乱原子顺序 """
+    rng = np.random.default_rng(seed)
+    rot, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+    moved = (positions + rng.normal(scale=noise, size=positions.shape)) @ rot + rng.normal(size=3)
+    return moved[rng.permutation(len(positions))]
+
+def _put(store, db_id, positions, numbers=AL10, toten=None):
+    store.put(db_id, numbers, distance_fingerprint(positions), shape_descriptor(positions), toten)
+
+def _candidates(store, positions, numbers=AL10):
+    return [db_id for db_id, _ in store.candidates(
+        numbers, distance_fingerprint(positions), shape_descriptor(positions), CUTOFF)]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_shape_descriptor_difference_is_bounded_by_rmsd(seed):
+    x = _cluster(seed)
+    rng = np.random.default_rng(seed)
+    y = x + rng.normal(scale=0.1, size=x.shape)
+    rmsd = kabsch_rmsd_batch(x, y[None])[0]
+    assert np.all(np.abs(shape_descriptor(x) - shape_descriptor(_moved(y, seed, noise=0.0))) <= rmsd + 1e-9)
+
+
+def test_candidates_contain_near_duplicates():
+    store = FingerprintStore(sqlite3.connect(":memory:"))
+    query = _cluster(0)
+    for i in range(1, 6):
+        _put(store, i, _moved(query, i))
+    for i in range(6, 206):
+        _put(store, i, _cluster(i))
+    found = _candidates(store, query)
+    assert found[:5] == [1, 2, 3, 4, 5]
+
+
+def test_candidate_count_stays_bounded_as_table_grows():
+    """ 其他组成、其他形状的结构不进入候选，表变大时候选数不变 """
+    store = FingerprintStore(sqlite3.connect(":memory:"))
+    query = _cluster(0)
+    for i in range(1, 6):
+        _put(store, i, _moved(query, i))
+    counts, db_id = [], 100
+    for _ in range(4):
+        for _ in range(100):
+            db_id += 1
+            _put(store, db_id, _cluster(db_id, spacing=2.9 + (db_id % 10) * 0.1))
+            db_id += 1
+            _put(store, db_id, _cluster(db_id), numbers=np.full(10, 5))
+        counts.append(len(_candidates(store, query)))
+    assert counts == [5, 5, 5, 5]
+
+
+def test_delete_removes_candidates():
+    store = FingerprintStore(sqlite3.connect(":memory:"))
+    query = _cluster(0)
+    _put(store, 1, _moved(query, 1))
+    store.delete([1])
+    assert _candidates(store, query) == []
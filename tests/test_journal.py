@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+
+import dmol2db
+from lib.journal import Journal
+
+ARGS = ["--symmetry", "off", "--metrics", "metrics.json", "--checkpoint-interval", "0"]
+
+
+def _filenames(path):
+    conn = sqlite3.connect(path)
+    try:
+        return sorted(v for v, in conn.execute("SELECT value FROM text_key_values WHERE key='filename'"))
+    finally:
+        conn.close()
+
+
+def test_journal_records_progress():
+    journal = Journal(sqlite3.connect(":memory:"))
+    assert journal.folders("a") is None
+    journal.record_folders("a", ["calc1", None, "calc3"])
+    journal.record_structure("a", 0, 1)
+    journal.record_structure("a", 1)
+    assert journal.folders("a") == ["calc1", None, "calc3"]
+    assert journal.finished_structures("a") == {0, 1}
+    assert not journal.search_done("a")
+    journal.finish_search("a")
+    assert journal.search_done("a")
+    assert journal.progress() == (1, 2)
+    journal.clear()
+    assert journal.progress() == (0, 0)
+
+
+def test_resume_after_interrupt_matches_full_run(search_tree, monkeypatch):
+    dmol2db.main([search_tree, "--db", "full.db"] + ARGS)
+    expected = _filenames("full.db")
+    assert expected
+
+    calls = []
+    process_folder = dmol2db.process_folder
+
+    def interrupted(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 5:
+            raise SystemExit("SIGTERM")  # _terminate 把 SIGTERM 变成 SystemExit
+        return process_folder(*args, **kwargs)
+
+    monkeypatch.setattr(dmol2db, "process_folder", interrupted)
+    with pytest.raises(SystemExit):
+        dmol2db.main([search_tree, "--db", "partial.db"] + ARGS)
+    # 中断之前完成的结构已经提交
+    assert len(_filenames("partial.db")) == 4
+
+    monkeypatch.setattr(dmol2db, "process_folder", process_folder)
+    dmol2db.main([search_tree, "--resume", "partial.db"] + ARGS)
+    assert _filenames("partial.db") == expected
@@ -0,0 +1,63 @@
+import gzip
+import os
+import random
+
+import pytest
+
+from benchmarks.fixtures import log_lines
+from lib.log_index import build_log_index, get_log_index, lookup_folders
+
+
+def _two_pass_lookup(lines, pop):
+    """ 原先的逐 pop 查找：最后一条 replace 行之前最近的 folder name 优先，否则取 init 之后第一条 folder name """
+    stripped = [line.strip() for line in lines]
+    for i in range(len(stripped) - 1, -1, -1):
+        parts = stripped[i].split()
+        if stripped[i].startswith("replace") and parts and parts[-1] == str(pop):
+            for j in range(i - 1, -1, -1):
+                if stripped[j].startswith("folder name"):
+                    return stripped[j].split(":")[-1].strip()
+            break
+    for i, line in enumerate(stripped):
+        if line == f"init {pop}":
+            for later in stripped[i + 1:]:
+                if later.startswith("folder name"):
+                    return later.split(":")[-1].strip()
+            return None
+    return None
+
+def _write(path, lines):
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return str(path)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_index_matches_two_pass_lookup(tmp_path, seed):
+    lines, folders = log_lines(40, random.Random(seed), replace_fraction=0.4, noise_lines=3)
+    # 无关的 init 变体、没有 folder 的 replace、末尾没等到 folder name 的 init
+    lines = ["replace population member 7", "init 007", "init 3x"] + lines + ["init 99"]
+    path = _write(tmp_path / "log.txt", lines)
+    pops = list(range(40)) + [99, 100]
+    found = lookup_folders(build_log_index(path), pops)
+    assert found == [_two_pass_lookup(lines, pop) for pop in pops]
+    assert found[:40] == [folders[pop] for pop in range(40)]
+    assert found[40:] == [None, None]
+
+
+def test_compressed_log(tmp_path):
+    lines, folders = log_lines(10, random.Random(1))
+    with gzip.open(tmp_path / "log.txt.gz", "wt") as f:
+        f.write("\n".join(lines) + "\n")
+    assert lookup_folders(build_log_index(str(tmp_path / "log.txt.gz")), range(10)) == \
+        [folders[pop] for pop in range(10)]
+
+
+def test_cached_index_is_rebuilt_when_log_changes(tmp_path):
+    path = _write(tmp_path / "log.txt", ["init 0", "folder name: calc_0"])
+    first = get_log_index(path)
+    assert get_log_index(path) is first
+    _write(path, ["init 0", "folder name: calc_0", "folder name: calc_1", "replace population member 0"])
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert lookup_folders(get_log_index(path), [0]) == ["calc_1"]
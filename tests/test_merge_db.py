@@ -0,0 +1,92 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+import tool_merge_db
+from lib.dos_store import DOS_TABLE
+from lib.query import PROPERTY_TABLE
+
+
+def _query(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+def _filenames(path):
+    return _query(path, "SELECT s.id, t.value FROM systems s "
+                        "JOIN text_key_values t ON t.id = s.id AND t.key = 'filename' ORDER BY s.id")
+
+
+def test_merge_renumbers_rows_and_side_tables(tmp_path, make_results_db, sample_structures):
+    first = make_results_db("first.db", sample_structures(3, seed=1, prefix="A"), dos=True)
+    second = make_results_db("second.db", sample_structures(2, seed=2, prefix="B"), dos=True)
+    target = str(tmp_path / "DATABASE.db")
+
+    merged = tool_merge_db.merge_databases(target, [first, second])
+    assert merged == {first: 3, second: 2}
+    assert _filenames(target) == [(1, "A_1"), (2, "A_2"), (3, "A_3"), (4, "B_1"), (5, "B_2")]
+    # 每张以 id 关联的表都平移到新的 id
+    for table in ("species", "keys", "number_key_values"):
+        assert [i for i, in _query(target, f"SELECT DISTINCT id FROM {table} ORDER BY id")] == [1, 2, 3, 4, 5]
+    assert _query(target, f"SELECT id, filename FROM {DOS_TABLE} ORDER BY id") == _filenames(target)
+    assert _query(target, f"SELECT id, filename FROM {PROPERTY_TABLE} ORDER BY id") == _filenames(target)
+    # 被合并的库不变
+    assert _filenames(second) == [(1, "B_1"), (2, "B_2")]
+
+
+def test_merging_the_same_database_twice_rolls_back(tmp_path, make_results_db, sample_structures):
+    source = make_results_db("source.db", sample_structures(2))
+    target = str(tmp_path / "DATABASE.db")
+    tool_merge_db.merge_databases(target, [source])
+    with pytest.raises(sqlite3.IntegrityError):
+        tool_merge_db.merge_databases(target, [source])
+    assert len(_filenames(target)) == 2
+
+
+def _rotated(structures, toten_shift, seed=0):
+    """ 同一批结构任意旋转、平移并加微小噪声（另一次运行得到的相同异构体），TOTEN 平移 toten_shift """
+    rng = np.random.default_rng(seed)
+    moved = []
+    for species, positions, parameters in structures:
+        rot, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+        positions = (np.array(positions) + rng.normal(scale=0.02, size=(len(positions), 3))) @ rot + 5.0
+        parameters = dict(parameters, filename="again_" + parameters["filename"],
+                          TOTEN=parameters["TOTEN"] + toten_shift)
+        moved.append((species, positions.tolist(), parameters))
+    return moved
+
+
+def test_dedup_skips_higher_energy_duplicates(tmp_path, make_results_db, sample_structures):
+    structures = sample_structures(4, seed=3)
+    first = make_results_db("first.db", structures)
+    again = make_results_db("again.db", _rotated(structures[:2], +1.0) + sample_structures(1, seed=4, prefix="new"))
+    target = str(tmp_path / "DATABASE.db")
+
+    tool_merge_db.merge_databases(target, [first, again], rmsd_cutoff=0.2)
+    assert [name for _, name in _filenames(target)] == ["Al3B3_1", "Al3B3_2", "Al3B3_3", "Al3B3_4", "new_1"]
+    assert len(_query(target, f"SELECT id FROM {PROPERTY_TABLE}")) == 5
+
+
+def test_dedup_replaces_rows_with_lower_energy(tmp_path, make_results_db, sample_structures):
+    structures = sample_structures(3, seed=3)
+    first = make_results_db("first.db", structures)
+    lower = make_results_db("lower.db", _rotated(structures[1:2], -1.0))
+    target = str(tmp_path / "DATABASE.db")
+
+    tool_merge_db.merge_databases(target, [first, lower], rmsd_cutoff=0.2)
+    assert [name for _, name in _filenames(target)] == ["Al3B3_1", "Al3B3_3", "again_Al3B3_2"]
+    assert sorted(_query(target, f"SELECT filename, TOTEN FROM {PROPERTY_TABLE}")) == [
+        ("Al3B3_1", -100.0), ("Al3B3_3", -99.0), ("again_Al3B3_2", -100.5)]
+
+
+def test_no_dedup_appends_everything(tmp_path, make_results_db, sample_structures):
+    structures = sample_structures(2, seed=3)
+    first = make_results_db("first.db", structures)
+    again = make_results_db("again.db", _rotated(structures, +1.0))
+    target = str(tmp_path / "DATABASE.db")
+
+    tool_merge_db.merge_databases(target, [first, again])
+    assert len(_filenames(target)) == 4
@@ -0,0 +1,66 @@
+import gzip
+import mmap
+import random
+
+import pytest
+
+from benchmarks.fixtures import outmol_lines, random_cluster, _coordinate_block
+from lib.parse_outmol import parse_lines, parse_mapped, parse_outmol, OPT_SECTION_MARKER, GEO_OPT_MARKER
+
+
+def _fields(parsed):
+    return (parsed.has_opt_section, parsed.parameters, parsed.atom_species, parsed.atom_positions,
+            parsed.eigenvalues, parsed.occupations)
+
+def _input_block(seed):
+    species, positions = random_cluster(6, random.Random(seed + 100))  # 与段前的坐标不同
+    return _coordinate_block("Input Coordinates (Angstroms)", species, positions)
+
+def _insert_after_last_section(lines, extra):
+    """ 在最后一个 Total Energy ... Iter 段的第一个 SCF 行之后插入 extra """
+    last = max(i for i, line in enumerate(lines) if OPT_SECTION_MARKER in line)
+    return lines[:last + 2] + extra + lines[last + 2:]
+
+def _killed_job(seed=1):
+    """ 没有 Final Coordinates；最后一个优化段之后又打印了 Input Coordinates（GEOMETRY 标记在段前） """
+    return _insert_after_last_section(outmol_lines(natoms=6, opt_steps=3, seed=seed, final=False), _input_block(seed))
+
+def _killed_job_with_marker(seed=2):
+    """ 同上，但 GEOMETRY OPTIMIZATION 标记和 Input Coordinates 都在最后一个优化段之后 """
+    extra = ["", f" {GEO_OPT_MARKER}", ""] + _input_block(seed)
+    return _insert_after_last_section(outmol_lines(natoms=6, opt_steps=3, seed=seed, final=False), extra)
+
+def _marker_without_input(seed=3):
+    """ 最后一个优化段之后只有 GEOMETRY 标记：顺序扫描时 Input Coordinates 被清空 """
+    extra = ["", f" {GEO_OPT_MARKER}", ""]
+    return _insert_after_last_section(outmol_lines(natoms=6, opt_steps=3, seed=seed, final=False), extra)
+
+FIXTURES = {
+    "final": lambda: outmol_lines(natoms=6, opt_steps=3, seed=0),
+    "no_final": lambda: outmol_lines(natoms=6, opt_steps=3, seed=4, final=False),
+    "killed_job": _killed_job,
+    "killed_job_with_marker": _killed_job_with_marker,
+    "marker_without_input": _marker_without_input,
+}
+
+
+@pytest.mark.parametrize("name", FIXTURES)
+def test_parse_mapped_matches_parse_lines(tmp_path, name):
+    text = "\n".join(FIXTURES[name]()) + "\n"
+    path = tmp_path / "dmol.outmol"
+    path.write_text(text)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        mapped = parse_mapped(mm, str(path))
+    assert _fields(mapped) == _fields(parse_lines(text.splitlines(keepends=True), str(path)))
+
+
+def test_compressed_copy_matches_uncompressed(tmp_path):
+    text = "\n".join(_killed_job()) + "\n"
+    plain = tmp_path / "plain" / "dmol.outmol"
+    packed = tmp_path / "packed" / "dmol.outmol"
+    plain.parent.mkdir()
+    packed.parent.mkdir()
+    plain.write_text(text)
+    with gzip.open(str(packed) + ".gz", "wt") as f:
+        f.write(text)
+    assert _fields(parse_outmol(str(plain))) == _fields(parse_outmol(str(packed)))
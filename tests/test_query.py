@@ -0,0 +1,67 @@
+import sqlite3
+
+import pytest
+
+from lib.query import build_index, count, parse_range, search, PROPERTY_TABLE
+
+
+@pytest.fixture
+def db_path(make_results_db, sample_structures):
+    """ 12 个 Al/B 团簇和 4 个纯 Al 团簇；GAP_DFT 只有 3 个不同的值，用来检验相同值时按 id 续读 """
+    structures = sample_structures(12) + sample_structures(4, seed=1, prefix="Al6", elements=("Al",))
+    for i, (_, _, parameters) in enumerate(structures):
+        parameters["GAP_DFT"] = [1.0, 2.0, 3.0][i % 3]
+    return make_results_db("results.db", structures)
+
+def _all_pages(conn, **kwargs):
+    pages, after = [], None
+    while True:
+        page = search(conn, after=after, **kwargs)
+        pages.append([row["id"] for row in page.rows])
+        if page.next_cursor is None:
+            return pages
+        after = page.next_cursor
+
+
+@pytest.mark.parametrize("order_by", ["id", "GAP_DFT", "TOTEN"])
+@pytest.mark.parametrize("descending", [False, True])
+def test_keyset_pages_cover_every_row_once_in_order(db_path, order_by, descending):
+    conn = sqlite3.connect(db_path)
+    pages = _all_pages(conn, order_by=order_by, descending=descending, limit=5)
+    ids = [i for page in pages for i in page]
+    expected = [i for i, in conn.execute(
+        f"SELECT id FROM {PROPERTY_TABLE} ORDER BY {order_by} {'DESC' if descending else ''}, "
+        f"id {'DESC' if descending else ''}")]
+    assert ids == expected
+    assert [len(page) for page in pages] == [5, 5, 5, 1]
+
+
+def test_filters(db_path):
+    conn = sqlite3.connect(db_path)
+    assert count(conn) == 16
+    assert count(conn, exact=["Al"]) == 4
+    assert count(conn, contains=["B"]) == 12
+    assert count(conn, contains=["Al"]) == 16
+    assert count(conn, ranges={"GAP_DFT": (1.5, 2.5)}) == 5
+    rows = search(conn, ranges=dict([parse_range("GAP_DFT=2.5:")]), exact=["Al"], limit=50).rows
+    assert [row["filename"] for row in rows] == ["Al6_3"]
+    assert rows[0]["composition"] == "Al" and rows[0]["natoms"] == 6
+
+
+def test_invalid_arguments(db_path):
+    conn = sqlite3.connect(db_path)
+    with pytest.raises(ValueError):
+        search(conn, order_by="no_such_column")
+    with pytest.raises(ValueError):
+        count(conn, contains=["Xx"])
+    with pytest.raises(ValueError):
+        parse_range("GAP_DFT=1.5")
+
+
+def test_build_index_rebuilds_missing_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute(f"DELETE FROM {PROPERTY_TABLE} WHERE id > 10")
+    conn.commit()
+    conn.close()
+    assert build_index(db_path) == 16
+    assert count(sqlite3.connect(db_path)) == 16
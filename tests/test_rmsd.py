@@ -0,0 +1,37 @@
+import random
+
+import numpy as np
+
+from benchmarks.fixtures import random_cluster
+from lib.rmsd import aligned_rmsd_batch, kabsch_rmsd_batch
+
+NUMBERS = np.array([5] * 4 + [13] * 6)
+
+
+def _cluster(seed):
+    return np.array(random_cluster(len(NUMBERS), random.Random(seed))[1])
+
+def _rotated_and_permuted(positions, seed):
+    """ 任意旋转、平移，并在同种元素内打乱原子顺序 """
+    rng = np.random.default_rng(seed)
+    rot, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+    rot *= np.sign(np.linalg.det(rot))
+    order = np.concatenate([rng.permutation(np.nonzero(NUMBERS == z)[0]) for z in np.unique(NUMBERS)])
+    return (positions @ rot + rng.normal(size=3))[order]
+
+
+def test_aligned_rmsd_finds_rotated_and_permuted_copy():
+    ref = _cluster(0)
+    stack = np.array([_rotated_and_permuted(ref, seed) for seed in range(4)])
+    assert np.all(aligned_rmsd_batch(ref, stack, NUMBERS) < 1e-6)
+    # 原子顺序打乱后 Kabsch（固定原子顺序）找不到匹配
+    assert np.all(kabsch_rmsd_batch(ref, stack) > 0.5)
+
+
+def test_aligned_rmsd_batch_matches_single_candidates():
+    ref = _cluster(0)
+    stack = np.array([_cluster(seed) for seed in range(1, 6)] + [_rotated_and_permuted(ref + 0.05, 9)])
+    batch = aligned_rmsd_batch(ref, stack, NUMBERS)
+    single = [aligned_rmsd_batch(ref, candidate[None], NUMBERS)[0] for candidate in stack]
+    assert np.allclose(batch, single)
+    assert len(aligned_rmsd_batch(ref, stack[:0], NUMBERS)) == 0
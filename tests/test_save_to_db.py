@@ -0,0 +1,78 @@
+import sqlite3
+
+import pytest
+
+from lib.query import PROPERTY_TABLE
+from lib.save_to_db import DBWriter
+
+
+def _rows(path, table="systems"):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0  # 还没有提交过任何批次，表不存在
+    finally:
+        conn.close()
+
+
+def test_records_are_committed_in_batches(tmp_path, sample_structures):
+    path = str(tmp_path / "results.db")
+    committed = []
+    with DBWriter(path, batch_size=3) as writer:
+        for species, positions, parameters in sample_structures(7):
+            writer.write(parameters, species, positions)
+            committed.append(_rows(path))
+    assert committed == [0, 0, 3, 3, 3, 6, 6]
+    assert _rows(path) == 7
+    assert _rows(path, PROPERTY_TABLE) == 7
+
+
+def test_flush_interval_commits_without_a_full_batch(tmp_path, sample_structures):
+    path = str(tmp_path / "results.db")
+    committed = []
+    with DBWriter(path, batch_size=100, flush_interval=0) as writer:
+        for species, positions, parameters in sample_structures(2):
+            writer.write(parameters, species, positions)
+            committed.append(_rows(path))
+    assert committed == [1, 2]
+
+
+def test_callback_runs_in_the_same_transaction(tmp_path, sample_structures):
+    path = str(tmp_path / "results.db")
+    with DBWriter(path, batch_size=10) as writer:
+        writer.connection.execute("CREATE TABLE side (id INTEGER PRIMARY KEY)")
+        for species, positions, parameters in sample_structures(3):
+            writer.write(parameters, species, positions,
+                         callback=lambda row_id: writer.connection.execute("INSERT INTO side VALUES (?)", (row_id,)))
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT id FROM side").fetchall() == conn.execute("SELECT id FROM systems").fetchall()
+
+
+def test_error_keeps_committed_batches_and_drops_pending(tmp_path, sample_structures):
+    path = str(tmp_path / "results.db")
+    with pytest.raises(RuntimeError):
+        with DBWriter(path, batch_size=2) as writer:
+            for species, positions, parameters in sample_structures(3):
+                writer.write(parameters, species, positions)
+            raise RuntimeError("解析失败")
+    assert _rows(path) == 2
+
+
+def test_interrupt_between_batches_commits_pending(tmp_path, sample_structures):
+    path = str(tmp_path / "results.db")
+    with pytest.raises(KeyboardInterrupt):
+        with DBWriter(path, batch_size=2) as writer:
+            for species, positions, parameters in sample_structures(3):
+                writer.write(parameters, species, positions)
+            raise KeyboardInterrupt
+    assert _rows(path) == 3
+
+
+def test_property_index_matches_parameters(make_results_db, sample_structures):
+    path = make_results_db("results.db", sample_structures(4))
+    conn = sqlite3.connect(path)
+    rows = conn.execute(f"SELECT filename, natoms, nelements, composition, GAP_DFT FROM {PROPERTY_TABLE} "
+                        f"ORDER BY id").fetchall()
+    assert rows[0] == ("Al3B3_1", 6, 2, "Al, B", 1.0)
+    assert [r[0] for r in rows] == ["Al3B3_1", "Al3B3_2", "Al3B3_3", "Al3B3_4"]
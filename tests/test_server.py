@@ -0,0 +1,133 @@
+import http.client
+import json
+import socket
+import threading
+from urllib.parse import quote
+
+import pytest
+
+from lib.save_to_db import DBWriter
+from lib.server import QueryServer
+
+
+@pytest.fixture
+def db_path(make_results_db, sample_structures):
+    return make_results_db("results.db", sample_structures(12), dos=True)
+
+@pytest.fixture
+def start_server(db_path):
+    """ 在后台线程启动 QueryServer（随机端口），返回 get(path) -> (status, headers, body) """
+    servers = []
+
+    def start(**options):
+        server = QueryServer(("127.0.0.1", 0), db_path, pool_size=2, **options)
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        port = server.server_address[1]
+
+        def get(path):
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+                return response.status, dict(response.getheaders()), response.read()
+            finally:
+                conn.close()
+        get.server = server
+        return get
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def _json(response):
+    status, _, body = response
+    return status, json.loads(body)
+
+
+def test_endpoints(start_server):
+    get = start_server()
+    assert _json(get("/"))[1]["systems"] == 12
+    assert _json(get("/systems/count?GAP_DFT=1.0:1.45")) == (200, {"count": 5})
+
+    status, page = _json(get("/systems?sort=TOTEN&desc=1&limit=3"))
+    assert status == 200
+    assert [row["TOTEN"] for row in page["rows"]] == [-94.5, -95.0, -95.5]
+    status, rest = _json(get(f"/systems?sort=TOTEN&desc=1&limit=20&after={quote(json.dumps(page['next_cursor']))}"))
+    assert len(rest["rows"]) == 9 and rest["next_cursor"] is None
+
+    status, system = _json(get("/systems/2"))
+    assert status == 200 and system["filename"] == "Al3B3_2"
+    assert len(system["symbols"]) == len(system["positions"]) == 6
+
+    status, headers, body = get("/systems/2.xyz")
+    lines = body.decode().splitlines()
+    assert status == 200 and headers["Content-Type"] == "chemical/x-xyz"
+    assert lines[0] == "6" and lines[1] == "Al3B3_2" and len(lines) == 8
+
+    status, dos = _json(get("/systems/2/dos?width=0.1&resolution=0.05&emin=-15&emax=5"))
+    assert status == 200 and dos["formula"] == "Al3B3"
+    assert len(dos["eigenvalues"]) == 8 and len(dos["energy"]) == len(dos["dos"]) == 400
+
+
+@pytest.mark.parametrize("path", ["/unknown", "/systems/99", "/systems/99.xyz", "/systems/99/dos",
+                                  "/systems/2/spectrum"])
+def test_not_found(start_server, path):
+    status, payload = _json(start_server()(path))
+    assert status == 404 and "error" in payload
+
+
+@pytest.mark.parametrize("query", [
+    "width=0", "width=-0.1", "width=0.1&resolution=0", "width=0.1&emin=5&emax=5", "width=0.1&emin=6&emax=5",
+    "width=nan", "width=0.1&emax=inf", "width=0.1&resolution=1e-9", "width=1000&resolution=0.001",
+    "width=abc", "limit=abc",
+])
+def test_invalid_parameters_return_400(start_server, query):
+    get = start_server()
+    path = "/systems?" + query if query.startswith("limit") else "/systems/2/dos?" + query
+    status, payload = _json(get(path))
+    assert status == 400 and payload["error"]
+
+
+def test_unexpected_exception_returns_json_500(start_server, monkeypatch):
+    get = start_server()
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("boom")
+    monkeypatch.setattr("lib.server._xyz", broken)
+    status, payload = _json(get("/systems/2.xyz"))
+    assert status == 500 and payload["error"] == "服务器内部错误: RuntimeError"
+    assert _json(get("/systems/count"))[1] == {"count": 12}  # 服务器仍在正常处理请求
+
+
+def test_streamed_page_matches_buffered_page(start_server):
+    buffered = _json(start_server()("/systems?sort=GAP_DFT&limit=10"))[1]
+    status, headers, body = start_server(max_buffered=2)("/systems?sort=GAP_DFT&limit=10")
+    assert status == 200 and headers.get("Transfer-Encoding") == "chunked"
+    assert json.loads(body) == buffered
+
+
+def test_streamed_page_for_http10_client_is_not_chunked(start_server, monkeypatch):
+    monkeypatch.setattr("lib.server.STREAM_CHUNK", 4)  # 多次取行，多次写出
+    get = start_server(max_buffered=2)
+    expected = _json(start_server()("/systems?limit=10"))[1]
+    with socket.create_connection(("127.0.0.1", get.server.server_address[1]), timeout=10) as sock:
+        sock.sendall(b"GET /systems?limit=10 HTTP/1.0\r\nHost: localhost\r\n\r\n")
+        data = b""
+        while chunk := sock.recv(65536):
+            data += chunk
+    head, body = data.split(b"\r\n\r\n", 1)
+    assert head.split(b"\r\n")[0].endswith(b"200 OK")
+    assert b"chunked" not in head.lower()
+    assert json.loads(body) == expected
+
+
+def test_cache_is_invalidated_when_database_changes(start_server, db_path, sample_structures):
+    get = start_server()
+    assert _json(get("/systems/count")) == (200, {"count": 12})
+    assert _json(get("/systems/count")) == (200, {"count": 12})  # 第二次来自缓存
+    with DBWriter(db_path) as writer:
+        species, positions, parameters = sample_structures(1, seed=5, prefix="Al3B3_new")[0]
+        writer.write(parameters, species, positions)
+    assert _json(get("/systems/count")) == (200, {"count": 13})
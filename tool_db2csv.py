@@ -1,6 +1,18 @@
 import sqlite3
-import pandas as pd
+import argparse
+import json
+import csv
 import os
+from collections import Counter
+import numpy as np
+from lib.db_stats import hill_formula
+from lib.cli import interactive
+
+# 逐块读取（fetchmany）、逐块写出，内存占用只和 chunk_size 有关，与数据库大小无关
+CHUNK_SIZE = 10000
+
+# 宽表中 systems 自带的列（其余列来自 key_value_pairs）
+WIDE_SYSTEM_COLUMNS = ["id", "unique_id", "ctime", "mtime", "natoms", "energy", "fmax", "mass", "charge"]
 
 def select_db_file():
     """
@@ -12,6 +24,10 @@ def select_db_file():
         print("当前目录下没有找到任何 .db 文件！")
         return None
 
+    if not interactive():
+        print("❌ 缺少数据库文件（非交互运行时请在命令行中给出）")
+        return None
+
     print("可用的数据库文件:")
     for idx, db_file in enumerate(db_files, start=1):
         print(f"{idx}. {db_file}")
@@ -26,43 +42,236 @@ def select_db_file():
         except ValueError:
             print("请输入数字编号！")
 
-def convert_db_to_single_csv(db_file):
+def _connect(db_file):
+    return sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+
+def _tables(conn):
+    return [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+
+def _columns(conn, table):
+    """ [(列名, 声明类型)] """
+    return [(row[1], row[2]) for row in conn.execute(f"PRAGMA table_info({table})")]
+
+def _iter_chunks(cursor, chunk_size):
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows
+
+# ========== 输出格式 ==========
+def _arrow_type(pa, declared):
+    declared = (declared or "").upper()
+    if "INT" in declared:
+        return pa.int64()
+    if "REAL" in declared or "FLOA" in declared or "DOUB" in declared:
+        return pa.float64()
+    if "BLOB" in declared:
+        return pa.binary()
+    return pa.string()
+
+def _arrow_array(pa, values, arrow_type):
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+        pass
+    # SQLite 的列类型只是建议，个别值与声明类型不符时按声明类型转换
+    if pa.types.is_binary(arrow_type):
+        values = [v if v is None or isinstance(v, bytes) else str(v).encode() for v in values]
+    elif pa.types.is_string(arrow_type):
+        values = [v if v is None or isinstance(v, str)
+                  else v.decode(errors="replace") if isinstance(v, bytes) else str(v) for v in values]
+    elif pa.types.is_integer(arrow_type):
+        values = [int(v) if isinstance(v, (int, float)) and float(v).is_integer() else None for v in values]
+    else:
+        values = [float(v) if isinstance(v, (int, float)) else None for v in values]
+    return pa.array(values, type=arrow_type)
+
+class _CSVSink:
+    def __init__(self, path, columns, types=None):
+        self.file = open(path, "w", newline="", encoding="utf-8-sig")  # 适用于中文
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+class _ArrowSink:
+    """ Parquet / Arrow IPC：每个数据块转成一个 RecordBatch 写出（pyarrow 只在需要时导入） """
+
+    def __init__(self, path, columns, types, fmt):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise SystemExit("❌ 导出 Parquet/Arrow 需要安装 pyarrow: pip install pyarrow")
+        self.pa = pa
+        self.schema = pa.schema([(name, _arrow_type(pa, declared)) for name, declared in zip(columns, types)])
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(path, self.schema)
+        else:
+            self.writer = pa.ipc.new_file(path, self.schema)
+
+    def write(self, rows):
+        arrays = [_arrow_array(self.pa, list(col), field.type) for col, field in zip(zip(*rows), self.schema)]
+        self.writer.write_batch(self.pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+FORMATS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+
+def _open_sink(path, fmt, columns, types):
+    if fmt == "csv":
+        return _CSVSink(path, columns)
+    return _ArrowSink(path, columns, types, fmt)
+
+# ========== 导出方式 ==========
+def convert_db_to_single_csv(db_file, chunk_size=CHUNK_SIZE):
     """
-    读取 SQLite 数据库文件，并将所有表的数据合并到一个 CSV 文件。
+    读取 SQLite 数据库文件，并将所有表的数据写入一个 CSV 文件（旧格式：table_name + 所有表列的并集）。
+    逐表、逐块流式写出，不再把整个数据库读进内存。
     """
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
+    conn = _connect(db_file)
+    try:
+        tables = _tables(conn)
+        if not tables:
+            print(f"数据库 {db_file} 中没有可用的表。")
+            return None
 
-    # 获取所有表名
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cursor.fetchall()
+        db_name = os.path.splitext(db_file)[0]  # 去掉 .db 后缀
+        csv_filename = f"{db_name}_all_tables.csv"
 
-    if not tables:
-        print(f"数据库 {db_file} 中没有可用的表。")
+        # 先按出现顺序确定所有列的并集，再逐表把各自的列放到对应位置
+        header = []
+        for table in tables:
+            header += [name for name, _ in _columns(conn, table) if name not in header]
+        sink = _CSVSink(csv_filename, ["table_name"] + header)
+        try:
+            for table in tables:
+                positions = [header.index(name) for name, _ in _columns(conn, table)]
+                for rows in _iter_chunks(conn.execute(f"SELECT * FROM {table}"), chunk_size):
+                    out = []
+                    for row in rows:
+                        line = [None] * len(header)
+                        for pos, value in zip(positions, row):
+                            line[pos] = value
+                        out.append([table] + line)
+                    sink.write(out)
+        finally:
+            sink.close()
+    finally:
         conn.close()
-        return
+    print(f"\n所有表数据已成功转换为单个 CSV 文件：{csv_filename}")
+    return csv_filename
 
-    db_name = os.path.splitext(db_file)[0]  # 去掉 .db 后缀
-    csv_filename = f"{db_name}_all_tables.csv"
+def export_tables(db_file, out_dir, fmt="csv", chunk_size=CHUNK_SIZE):
+    """ 每张表一个文件，保留各自的列 """
+    os.makedirs(out_dir, exist_ok=True)
+    conn = _connect(db_file)
+    written = []
+    try:
+        for table in _tables(conn):
+            columns = _columns(conn, table)
+            path = os.path.join(out_dir, table + FORMATS[fmt])
+            sink = _open_sink(path, fmt, [name for name, _ in columns], [declared for _, declared in columns])
+            try:
+                for rows in _iter_chunks(conn.execute(f"SELECT * FROM {table}"), chunk_size):
+                    sink.write(rows)
+            finally:
+                sink.close()
+            written.append(path)
+    finally:
+        conn.close()
+    return written
 
-    all_data = []  # 用于存储所有表的数据
+def _wide_key_columns(conn):
+    """ key_value_pairs 的所有键及其类型：只出现在 number_key_values 中的为 REAL，其余为 TEXT """
+    number_keys = {row[0] for row in conn.execute("SELECT DISTINCT key FROM number_key_values")}
+    text_keys = {row[0] for row in conn.execute("SELECT DISTINCT key FROM text_key_values")}
+    keys = [row[0] for row in conn.execute("SELECT DISTINCT key FROM keys ORDER BY key")]
+    for key in sorted((number_keys | text_keys) - set(keys)):
+        keys.append(key)
+    return [(key, "REAL" if key in number_keys and key not in text_keys else "TEXT") for key in keys]
 
-    for table in tables:
-        table_name = table[0]
-        df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
-        df.insert(0, "table_name", table_name)  # 在第一列添加表名
-        all_data.append(df)
+def export_wide(db_file, out_path, fmt="csv", chunk_size=CHUNK_SIZE):
+    """
+    每个结构一行的宽表：systems 的基本列 + formula + 每个键一列。
+    列由 number_key_values / text_key_values 中出现过的键决定；键值按 id 顺序从 systems.key_value_pairs
+    （ASE 同时写入键值表的同一份数据）读取，只沿主键顺序扫描 systems 一次，不需要对没有 id 索引的键值表排序。
+    """
+    conn = _connect(db_file)
+    try:
+        system_columns = dict(_columns(conn, "systems"))
+        base = [c for c in WIDE_SYSTEM_COLUMNS if c in system_columns]
+        key_columns = [(k, t) for k, t in _wide_key_columns(conn) if k not in base and k != "formula"]
+        columns = base + ["formula"] + [k for k, _ in key_columns]
+        types = [system_columns[c] for c in base] + ["TEXT"] + [t for _, t in key_columns]
+        numeric = [t == "REAL" for _, t in key_columns]
 
-    conn.close()
+        sink = _open_sink(out_path, fmt, columns, types)
+        try:
+            cursor = conn.execute(f"SELECT {', '.join(base)}, numbers, key_value_pairs FROM systems ORDER BY id")
+            for rows in _iter_chunks(cursor, chunk_size):
+                out = []
+                for row in rows:
+                    kvp = json.loads(row[-1]) if row[-1] else {}
+                    values = []
+                    for (key, _), is_number in zip(key_columns, numeric):
+                        value = kvp.get(key)
+                        if value is not None and not is_number:
+                            value = str(value)
+                        values.append(value)
+                    out.append(list(row[:-2]) + [_formula(row[-2])] + values)
+                sink.write(out)
+        finally:
+            sink.close()
+    finally:
+        conn.close()
+    return out_path
 
-    # **合并所有表的数据**
-    final_df = pd.concat(all_data, ignore_index=True)
+def _formula(numbers_blob):
+    """ 由 systems.numbers（ASE 以小端 int32 二进制保存）得到 Hill 式化学式 """
+    if numbers_blob is None:
+        return None
+    numbers = np.frombuffer(numbers_blob, dtype="<i4")
+    return hill_formula(Counter(numbers.tolist()))
 
-    # **保存为 CSV**
-    final_df.to_csv(csv_filename, index=False, encoding="utf-8-sig")  # 适用于中文
-    print(f"\n所有表数据已成功转换为单个 CSV 文件：{csv_filename}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="流式导出 ASE 数据库为 CSV / Parquet / Arrow")
+    parser.add_argument("db", nargs="?", help="数据库文件（缺省时在终端中从当前目录选择）")
+    parser.add_argument("--mode", choices=["single", "tables", "wide"], default="single",
+                        help="single: 所有表合并到一个 CSV（旧格式，默认）；tables: 每张表一个文件；"
+                             "wide: 每个结构一行，键值展开为列")
+    parser.add_argument("-f", "--format", choices=list(FORMATS), default="csv",
+                        help="输出格式（tables / wide 模式），parquet 与 arrow 需要 pyarrow")
+    parser.add_argument("-o", "--output", help="输出文件（wide）或目录（tables），默认以数据库名命名")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help=f"每次读取和写出的行数，决定内存上限，默认 {CHUNK_SIZE}")
+    args = parser.parse_args(argv)
+
+    db_file = args.db or select_db_file()
+    if not db_file:
+        return
+    db_name = os.path.splitext(db_file)[0]
+
+    if args.mode == "single":
+        if args.format != "csv":
+            print("❌ single 模式只支持 CSV")
+            return
+        convert_db_to_single_csv(db_file, args.chunk_size)
+    elif args.mode == "tables":
+        out_dir = args.output or f"{db_name}_tables"
+        written = export_tables(db_file, out_dir, args.format, args.chunk_size)
+        print(f"\n已导出 {len(written)} 张表到目录：{out_dir}")
+    else:
+        out_path = args.output or f"{db_name}_wide{FORMATS[args.format]}"
+        export_wide(db_file, out_path, args.format, args.chunk_size)
+        print(f"\n宽表已导出：{out_path}")
 
 if __name__ == "__main__":
-    db_file = select_db_file()
-    if db_file:
-        convert_db_to_single_csv(db_file)
+    main()
@@ -1,57 +1,333 @@
 import sqlite3
 import os
+import argparse
+import numpy as np
+from lib.query import PropertyIndex
+from lib.fingerprint import (FingerprintStore, FINGERPRINT_INDEX, canonical_order, distance_fingerprint,
+                             shape_descriptor)
+from lib.rmsd import match_rmsd_batch, aligned_rmsd_batch
+from lib.shard import read_shard
+
+# ASE 数据库中以 id 关联的表，systems 必须最先插入
+ASE_TABLES = ["systems", "species", "keys", "text_key_values", "number_key_values"]
+# dmol2db 写入的、同样以 systems.id 为键的附加表（被合并的库中有才复制）
+SIDE_TABLES = ["dos_spectra"]
+# 补建指纹时每次读取的行数
+BACKFILL_CHUNK = 1000
 
 def last_id(db_path: str) -> int:
-    from ase.db import connect
-    db = connect(db_path)
-    for row in db.select():
-        last_id = row.id
-    return last_id
-
-current_path = os.path.dirname(os.path.abspath(__file__))
-file_1 = os.path.join(current_path, 'DATABASE.db')  # 目标数据库
-file_2 = os.path.join(current_path, "DMOL_RESULTS.db")  # 被合并的数据库
-
-conn1 = sqlite3.connect(file_1)
-conn2 = sqlite3.connect(file_2)
-c1 = conn1.cursor()
-c2 = conn2.cursor()
-
-c1.execute('SELECT id from systems')
-row_num1 = len(c1.fetchall())  
-db1_last_id = last_id(file_1)  
-
-c2.execute('SELECT id from systems')
-row_num2 = len(c2.fetchall())
-
-print(f'初始 DATABASE.db 行数: {row_num1}, 被合并 DMOL_RESULTS.db 行数: {row_num2}')
-
-for i in range(1, row_num2+1):
-    c2.execute("UPDATE systems set ID=? where ID=?", (10000 + i, i))
-    c2.execute("UPDATE keys set id=? where id=?", (10000 + i, i))
-    c2.execute("UPDATE species set id=? where id=?", (10000 + i, i))
-    c2.execute("UPDATE text_key_values set id=? where id=?", (10000 + i, i))
-    c2.execute("UPDATE number_key_values set id=? where id=?", (10000 + i, i))
-conn2.commit()
-
-for j in range(1, row_num2+1):
-    new_id = db1_last_id + j
-    c2.execute("UPDATE systems set ID=? where ID=?", (new_id, 10000 + j))
-    c2.execute("UPDATE keys set id=? where id=?", (new_id, 10000 + j))
-    c2.execute("UPDATE species set id=? where id=?", (new_id, 10000 + j))
-    c2.execute("UPDATE text_key_values set id=? where id=?", (new_id, 10000 + j))
-    c2.execute("UPDATE number_key_values set id=? where id=?", (new_id, 10000 + j))
-conn2.commit()
-conn2.close()
-
-c1.execute(f"attach '{file_2}' as SecondaryDB")
-c1.execute('insert into systems select * from SecondaryDB.systems')
-c1.execute('insert into species select * from SecondaryDB.species')
-c1.execute('insert into keys select * from SecondaryDB.keys')
-c1.execute('insert into text_key_values select * from SecondaryDB.text_key_values')
-c1.execute('insert into number_key_values select * from SecondaryDB.number_key_values')
-
-conn1.commit()
-c1.execute('detach SecondaryDB')
-conn1.close()
-print("合并 DMOL 结果到 DATABASE.db 完成！")
\ No newline at end of file
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM systems").fetchone()[0]
+
+def _table_columns(conn, table, schema="main"):
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+def _ensure_schema(conn, schema):
+    """ 目标数据库还没有 ASE 表时，从被合并的数据库复制 ASE 的建表和索引语句 """
+    if conn.execute("SELECT name FROM main.sqlite_master WHERE name='systems'").fetchone():
+        return
+    tables = ASE_TABLES + ["information"]
+    rows = conn.execute(
+        f"SELECT type, sql FROM {schema}.sqlite_master "
+        f"WHERE sql IS NOT NULL AND tbl_name IN ({', '.join('?' * len(tables))})", tables
+    ).fetchall()
+    # 先建表再建索引
+    for obj_type, sql in rows:
+        if obj_type == "table":
+            conn.execute(sql)
+    for obj_type, sql in rows:
+        if obj_type == "index":
+            conn.execute(sql)
+    conn.execute(f"INSERT INTO information SELECT * FROM {schema}.information")
+
+def _has_table(conn, table, schema="main"):
+    return conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type='table' AND name=?", (table,)).fetchone() is not None
+
+def _ensure_side_table(conn, table, schema):
+    if not _has_table(conn, table):
+        sql = conn.execute(f"SELECT sql FROM {schema}.sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()[0]
+        conn.execute(sql)
+
+def _copy_table(conn, table, schema, offset, skip=False, remap=False):
+    """
+    INSERT … SELECT 一条语句整表复制，id 整体平移 offset；skip 时跳过 temp.merge_skip 中的 id，
+    remap 时 id 按 temp.merge_ids 映射（分片归并）
+    """
+    source_cols = set(_table_columns(conn, table, schema))
+    cols = [c for c in _table_columns(conn, table) if c in source_cols]
+    new_id = "m.new_id" if remap else f"t.id + {offset}"
+    select = ", ".join(new_id if c == "id" else f"t.{c}" for c in cols)
+    join = " JOIN temp.merge_ids m ON m.id = t.id" if remap else ""
+    where = " WHERE t.id NOT IN (SELECT id FROM temp.merge_skip)" if skip else ""
+    order = f" ORDER BY {new_id}" if table == "systems" else ""
+    cur = conn.execute(
+        f"INSERT INTO main.{table} ({', '.join(cols)}) SELECT {select} FROM {schema}.{table} t{join}{where}{order}"
+    )
+    return cur.rowcount
+
+# ========== 跨运行去重 ==========
+def _iter_structures(conn, schema, where="", params=()):
+    """ 逐行返回 (id, 按原子序数排序后的 numbers, positions, TOTEN) """
+    cur = conn.execute(
+        f"SELECT s.id, s.numbers, s.positions, n.value FROM {schema}.systems s "
+        f"LEFT JOIN {schema}.number_key_values n ON n.id = s.id AND n.key = 'TOTEN'{where} ORDER BY s.id", params)
+    for db_id, numbers, positions, toten in cur:
+        numbers = np.frombuffer(numbers, dtype=np.int32)
+        positions = np.frombuffer(positions, dtype=np.float64).reshape(-1, 3)
+        order = canonical_order(numbers)
+        yield db_id, numbers[order], positions[order], toten
+
+def _canonical_positions(conn, schema, db_id):
+    numbers, positions = conn.execute(
+        f"SELECT numbers, positions FROM {schema}.systems WHERE id=?", (db_id,)).fetchone()
+    order = canonical_order(np.frombuffer(numbers, dtype=np.int32))
+    return np.frombuffer(positions, dtype=np.float64).reshape(-1, 3)[order]
+
+def _backfill_fingerprints(conn, store, chunk_size=BACKFILL_CHUNK):
+    """
+    主数据库中还没有指纹的行（去重功能出现之前合并的，或用 --no-dedup 合并的）补建指纹。
+    先只取出缺指纹的 id，再按块读取坐标、写入指纹（边读边写同一张表不安全），内存只和 chunk_size 有关
+    """
+    store.prune()
+    # 没有 R*Tree 索引项的行（包括旧版本只建了指纹表的行）都重新计算
+    ids = [row[0] for row in conn.execute(
+        f"SELECT id FROM main.systems WHERE id NOT IN (SELECT id FROM main.{FINGERPRINT_INDEX}) ORDER BY id")]
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        where = f" WHERE s.id IN ({', '.join('?' * len(chunk))})"
+        # 每块先读完再写入
+        for db_id, numbers, positions, toten in list(_iter_structures(conn, "main", where, chunk)):
+            store.put(db_id, numbers, distance_fingerprint(positions), shape_descriptor(positions), toten)
+
+def _deduplicate(conn, schema, offset, rmsd_cutoff):
+    """
+    逐行查找被合并库中与主数据库（以及本库中已接受的行）重复的异构体：
+    指纹索引取候选 → RMSD 确认（与 cluster_structures 相同的判据），保留 TOTEN 更低的一个。
+    返回 (跳过的被合并库 id, 需要从主数据库删除的 id)
+    """
+    from ase.data import atomic_masses  # 只有去重时才需要 ase
+
+    store = FingerprintStore(conn)
+    _backfill_fingerprints(conn, store)
+    skip, replaced = set(), []
+    for source_id, numbers, positions, toten in _iter_structures(conn, schema):
+        fp, shape = distance_fingerprint(positions), shape_descriptor(positions)
+        match = None
+        candidates = store.candidates(numbers, fp, shape, rmsd_cutoff)
+        if candidates:
+            # id > offset 的候选是本次合并中已接受的行，坐标还在被合并库中
+            stack = np.array([_canonical_positions(conn, "main", c) if c <= offset
+                              else _canonical_positions(conn, schema, c - offset) for c, _ in candidates])
+            # 不同运行的取向任意，cluster_structures 的判据之外再做主轴全对齐的匹配
+            rmsd = np.minimum(match_rmsd_batch(positions, stack, numbers, atomic_masses[numbers]),
+                              aligned_rmsd_batch(positions, stack, numbers))
+            best = int(np.argmin(rmsd))
+            if rmsd[best] < rmsd_cutoff:
+                match = candidates[best]
+        if match is None:
+            store.put(source_id + offset, numbers, fp, shape, toten)
+            continue
+        match_id, match_toten = match
+        if toten is not None and (match_toten is None or toten < match_toten):
+            # 新结构能量更低：替换已有的行
+            if match_id > offset:
+                skip.add(match_id - offset)
+            else:
+                replaced.append(match_id)
+            store.delete([match_id])
+            store.put(source_id + offset, numbers, fp, shape, toten)
+        else:
+            skip.add(source_id)
+    return skip, replaced
+
+def _delete_rows(conn, ids):
+    """ 删除主数据库中的行（ASE 表、附加表和物化属性表） """
+    ids = [int(i) for i in ids]
+    if not ids:
+        return
+    placeholders = ", ".join("?" * len(ids))
+    for table in ASE_TABLES[::-1] + [t for t in SIDE_TABLES if _has_table(conn, t)]:
+        conn.execute(f"DELETE FROM main.{table} WHERE id IN ({placeholders})", ids)
+    PropertyIndex(conn).delete(ids)
+
+def merge_database(conn, source_path, rmsd_cutoff=None):
+    """
+    把一个结果数据库合并进已连接的目标数据库，整个过程在一个事务中完成；返回合并的行数。
+    rmsd_cutoff 不为 None 时按结构指纹 + RMSD 跨运行去重，重复的异构体只保留 TOTEN 更低的一个。
+    """
+    conn.execute("ATTACH DATABASE ? AS SecondaryDB", (source_path,))
+    try:
+        with conn:
+            _ensure_schema(conn, "SecondaryDB")
+            offset = conn.execute("SELECT COALESCE(MAX(id), 0) FROM main.systems").fetchone()[0]
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS merge_skip (id INTEGER PRIMARY KEY)")
+            conn.execute("DELETE FROM temp.merge_skip")
+            if rmsd_cutoff is not None:
+                skip, replaced = _deduplicate(conn, "SecondaryDB", offset, rmsd_cutoff)
+                conn.executemany("INSERT INTO temp.merge_skip VALUES (?)", [(i,) for i in skip])
+                _delete_rows(conn, replaced)
+                print(f"🔁 {os.path.basename(source_path)}: 跳过 {len(skip)} 个重复结构，"
+                      f"替换 {len(replaced)} 个能量更高的已有结构")
+            dedup = rmsd_cutoff is not None
+            rows = _copy_table(conn, "systems", "SecondaryDB", offset, dedup)
+            for table in ASE_TABLES[1:]:
+                _copy_table(conn, table, "SecondaryDB", offset, dedup)
+            for table in SIDE_TABLES:
+                if _has_table(conn, table, "SecondaryDB"):
+                    _ensure_side_table(conn, table, "SecondaryDB")
+                    _copy_table(conn, table, "SecondaryDB", offset, dedup)
+            # 物化属性表和覆盖索引：直接从被合并库的 EAV 表整体生成新行
+            properties = PropertyIndex(conn)
+            properties.ensure_covering_indexes()
+            properties.rebuild("SecondaryDB", offset)
+            properties.delete(i + offset for i, in conn.execute("SELECT id FROM temp.merge_skip"))
+            if properties.is_stale():
+                # 目标库是在物化表出现之前生成的，整体补建一次
+                properties.rebuild()
+    finally:
+        conn.execute("DETACH DATABASE SecondaryDB")
+    return rows
+
+def merge_databases(target_path, source_paths, rmsd_cutoff=None):
+    """ 依次合并多个 DMOL_RESULTS_*.db 到目标数据库，返回 {文件名: 合并行数} """
+    merged = {}
+    conn = sqlite3.connect(target_path)
+    try:
+        for source_path in source_paths:
+            merged[source_path] = merge_database(conn, source_path, rmsd_cutoff)
+    finally:
+        conn.close()
+    return merged
+
+# ========== 分片归并（dmol2db --shard i/N 的输出） ==========
+def _shard_filenames(shard_paths):
+    """ 逐个分片读取 (filename, 分片序号, id) """
+    for position, path in enumerate(shard_paths):
+        with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as conn:
+            if not _has_table(conn, "systems"):
+                continue
+            for db_id, filename in conn.execute(
+                    "SELECT s.id, t.value FROM systems s "
+                    "LEFT JOIN text_key_values t ON t.id = s.id AND t.key = 'filename'"):
+                yield filename or "", position, db_id
+
+def _check_shards(shard_paths):
+    """ 分片数据库应来自同一个 N、序号互不重复；缺片或重复时只提示，不阻止归并 """
+    seen, counts = {}, set()
+    for path in shard_paths:
+        with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as conn:
+            info = read_shard(conn)
+        if info is None:
+            print(f"⚠️ {os.path.basename(path)} 不是分片数据库（dmol2db --shard 的输出），按普通结果库归并")
+            continue
+        index, count, _ = info
+        if index in seen:
+            print(f"⚠️ 分片 {index}/{count} 重复: {os.path.basename(seen[index])}, {os.path.basename(path)}")
+        seen[index] = path
+        counts.add(count)
+    if seen:
+        if len(counts) != 1:
+            print("⚠️ 分片数据库的 N 不一致")
+        missing = sorted(set(range(max(counts))) - set(seen))
+        if missing:
+            print(f"⚠️ 缺少分片: {', '.join(map(str, missing))}")
+
+def reduce_shards(target_path, shard_paths):
+    """
+    把多个分片数据库归并到目标数据库，返回 {文件名: 合并行数}。
+    新 id 按 filename（{formula}_{search 目录标签}_{序号}，全局唯一）排序后连续分配，
+    与分片数、各节点的处理顺序无关：同一批输入无论怎样分片，归并结果的 id 和 filename 都一致。
+    分片之间没有重复结构（每个 search 目录只属于一个分片），不做去重；之后合并到 DATABASE.db 时再去重。
+    """
+    _check_shards(shard_paths)
+    order = sorted(_shard_filenames(shard_paths))
+    merged = {}
+    conn = sqlite3.connect(target_path)
+    try:
+        offset = conn.execute("SELECT COALESCE(MAX(id), 0) FROM systems").fetchone()[0] \
+            if _has_table(conn, "systems") else 0
+        new_ids = [{} for _ in shard_paths]
+        for new_id, (_, position, db_id) in enumerate(order, start=offset + 1):
+            new_ids[position][db_id] = new_id
+        for position, source_path in enumerate(shard_paths):
+            conn.execute("ATTACH DATABASE ? AS SecondaryDB", (source_path,))
+            try:
+                with conn:
+                    if not new_ids[position]:
+                        merged[source_path] = 0
+                        continue
+                    _ensure_schema(conn, "SecondaryDB")
+                    conn.execute("CREATE TEMP TABLE IF NOT EXISTS merge_ids (id INTEGER PRIMARY KEY, new_id INTEGER)")
+                    conn.execute("DELETE FROM temp.merge_ids")
+                    conn.executemany("INSERT INTO temp.merge_ids VALUES (?, ?)", new_ids[position].items())
+                    merged[source_path] = _copy_table(conn, "systems", "SecondaryDB", 0, remap=True)
+                    for table in ASE_TABLES[1:]:
+                        _copy_table(conn, table, "SecondaryDB", 0, remap=True)
+                    for table in SIDE_TABLES:
+                        if _has_table(conn, table, "SecondaryDB"):
+                            _ensure_side_table(conn, table, "SecondaryDB")
+                            _copy_table(conn, table, "SecondaryDB", 0, remap=True)
+            finally:
+                conn.execute("DETACH DATABASE SecondaryDB")
+            print(f"🔗 {os.path.basename(source_path)}: 归并 {merged[source_path]} 行")
+    finally:
+        if merged:
+            # 分片的 id 不是连续平移的，物化属性表最后整体重建一次（某个分片失败时也覆盖已归并的分片）
+            with conn:
+                properties = PropertyIndex(conn)
+                properties.ensure_covering_indexes()
+                properties.rebuild()
+        conn.close()
+    return merged
+
+def _row_count(db_path):
+    if not os.path.isfile(db_path):
+        return 0
+    with sqlite3.connect(db_path) as conn:
+        if not conn.execute("SELECT name FROM sqlite_master WHERE name='systems'").fetchone():
+            return 0
+        return conn.execute("SELECT COUNT(*) FROM systems").fetchone()[0]
+
+def main(argv=None):
+    current_path = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="合并 DMOL 结果数据库到 DATABASE.db")
+    parser.add_argument("sources", nargs="*", default=[os.path.join(current_path, "DMOL_RESULTS.db")],
+                        help="被合并的数据库，可一次给出多个（默认 DMOL_RESULTS.db）")
+    parser.add_argument("-t", "--target", default=os.path.join(current_path, "DATABASE.db"),
+                        help="目标数据库（默认 DATABASE.db）")
+    parser.add_argument("--rmsd-cutoff", type=float, default=0.2,
+                        help="跨运行去重的 RMSD 阈值 (Å)，与 dmol2db 聚类一致，默认 0.2")
+    parser.add_argument("--no-dedup", action="store_true", help="不去重，直接追加所有行")
+    parser.add_argument("--reduce", action="store_true",
+                        help="归并 dmol2db --shard 生成的分片数据库：id 按 filename 重新连续编号，不去重")
+    args = parser.parse_args(argv)
+
+    print(f'初始 {os.path.basename(args.target)} 行数: {_row_count(args.target)}')
+    for source_path in args.sources:
+        if not os.path.isfile(source_path):
+            print(f"❌ 找不到数据库: {source_path}")
+            return
+        print(f'被合并 {os.path.basename(source_path)} 行数: {_row_count(source_path)}')
+
+    if args.reduce:
+        try:
+            reduce_shards(args.target, args.sources)
+        except sqlite3.IntegrityError as e:
+            print(f"❌ 归并失败（目标库中可能已有这些分片），当前分片已回滚，错误: {e}")
+        print(f"归并分片到 {os.path.basename(args.target)} 完成！当前行数: {_row_count(args.target)}")
+        return
+
+    conn = sqlite3.connect(args.target)
+    try:
+        for source_path in args.sources:
+            try:
+                merge_database(conn, source_path, None if args.no_dedup else args.rmsd_cutoff)
+            except sqlite3.IntegrityError as e:
+                # 整个文件的插入已回滚，不会留下一半数据
+                print(f"❌ {source_path}: 合并失败（可能已合并过），已回滚，错误: {e}")
+    finally:
+        conn.close()
+    print(f"合并 DMOL 结果到 {os.path.basename(args.target)} 完成！当前行数: {_row_count(args.target)}")
+
+if __name__ == "__main__":
+    main()
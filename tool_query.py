@@ -0,0 +1,7 @@
+from lib.query import main
+
+# 按属性和组成分页查询数据库，例如:
+#   python tool_query.py DATABASE.db --build-index
+#   python tool_query.py DATABASE.db --range GAP_DFT=1.5:3 --contains Al B --sort TOTEN --limit 20
+if __name__ == "__main__":
+    main()
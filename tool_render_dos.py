@@ -0,0 +1,6 @@
+from lib.render_dos import main
+
+# 根据数据库中的 dos_spectra 表批量渲染 DOS 图，例如:
+#   python tool_render_dos.py DMOL_RESULTS.db --out dmol_dos --jobs 8
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+from lib.server import main
+
+# 本地只读 HTTP/JSON 查询服务（结构查询、xyz 下载、DOS 数据），例如:
+#   python tool_serve.py DATABASE.db --port 8000 --pool-size 16
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+from lib.symmetry import main
+
+# 为数据库中缺少点群的结构补算 Point_Group（例如 dmol2db --symmetry off 生成的数据库），例如:
+#   python tool_symmetry.py DMOL_RESULTS.db --jobs 8 --symmetry-timeout 30
+if __name__ == "__main__":
+    main()